@@ -1,6 +1,14 @@
 import argparse
+import asyncio
 import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional
 
 import boto3
 from botocore.exceptions import ClientError
@@ -8,9 +16,13 @@ from dotenv import load_dotenv
 from loguru import logger
 from pipecat.adapters.schemas.function_schema import FunctionSchema
 from pipecat.adapters.schemas.tools_schema import ToolsSchema
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.audio.vad.vad_analyzer import VADParams
-from pipecat.frames.frames import LLMRunFrame
+from pipecat.frames.frames import (
+    FunctionCallResultProperties,
+    MetricsFrame,
+    TTSSpeakFrame,
+)
+from pipecat.metrics.metrics import TTFBMetricsData
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
@@ -21,14 +33,47 @@ from pipecat.services.aws.llm import AWSBedrockLLMService
 from pipecat.services.aws.stt import AWSTranscribeSTTService
 from pipecat.services.aws.tts import AWSPollyTTSService
 from pipecat.services.aws_nova_sonic import AWSNovaSonicLLMService
-from pipecat.services.deepgram.stt import DeepgramSTTService, LiveOptions
+from pipecat.services.deepgram.stt import DeepgramSTTService
 from pipecat.services.deepgram.tts import DeepgramTTSService
 from pipecat.services.llm_service import FunctionCallParams
+from pipecat.services.stt_service import STTService
+from pipecat.services.tts_service import TTSService
 from pipecat.transcriptions.language import Language
 from pipecat.transports.base_transport import BaseTransport, TransportParams
 from pipecat.transports.daily.transport import DailyParams
-from strands import Agent, tool
-from strands.models import BedrockModel
+from strands import Agent, ToolContext, tool
+
+from agent_executor import (
+    AgentExecutor,
+    InterruptionStats,
+    RunCancellableBedrockModel,
+)
+from bedrock_limiter import (
+    PRIORITY_IN_TURN,
+    PRIORITY_SPECULATIVE,
+    BedrockLimiter,
+    LimitedBedrockClient,
+    LimitedBedrockLLMService,
+    parse_limits,
+)
+from claim_index import ClaimIndex, claim_id_from_query, load_claim_index
+from kb_cache import RetrievalCache
+from kb_context import ContextPacker
+from kb_prefetch import KnowledgeBasePrefetcher
+from latency import LatencyRecorder, TurnLatencyObserver
+from loop_monitor import LoopMonitor
+from query_router import ROUTE_KB, QueryRouter
+from shared_vad import (
+    BatchedSileroVADAnalyzer,
+    BatchedVADEngine,
+    SharedSileroVADAnalyzer,
+)
+from tts_cache import CachedDeepgramTTSService, TTSAudioCache
+from turn_taking import (
+    TurnTakingProfile,
+    check_turn_taking_profile,
+    get_turn_taking_profile,
+)
 
 # Load environment variables
 load_dotenv(override=True)
@@ -36,94 +81,339 @@ load_dotenv(override=True)
 # Bedrock Knowledge Base Configuration
 KNOWLEDGE_BASE_ID = os.getenv("KB_ID")
 
+# boto3 calls block, so retrieves run on a dedicated thread pool that is shared
+# by every session in the process. Its size bounds how many retrieves can be in
+# flight at once. (Strands runs tools on a private event loop per invocation, so
+# a thread pool works from every loop where a per-loop aioboto3 client wouldn't.)
+KB_MAX_CONCURRENT_RETRIEVES = int(os.getenv("KB_MAX_CONCURRENT_RETRIEVES", "8"))
+_retrieve_executor = ThreadPoolExecutor(
+    max_workers=KB_MAX_CONCURRENT_RETRIEVES, thread_name_prefix="kb-retrieve"
+)
+
+# Every Bedrock call in the process (the LLM, the Strands agents' model, KB
+# retrieves) waits for a token from a per-API, per-model bucket, so a load spike
+# queues instead of being throttled. BEDROCK_LIMITS overrides the default rate,
+# e.g. "retrieve=10,converse_stream/amazon.nova-lite-v1:0=20".
+BEDROCK_LIMITER = BedrockLimiter(
+    default_rps=float(os.getenv("BEDROCK_DEFAULT_RPS", "10")),
+    limits=parse_limits(os.getenv("BEDROCK_LIMITS")),
+)
+
+# "sequential" only runs the SEMANTIC search after the HYBRID one comes back
+# empty. "race" sends both at once and cancels the SEMANTIC one if it's unneeded.
+KB_SEARCH_STRATEGY = os.getenv("KB_SEARCH_STRATEGY", "sequential")
+
+# Retrieve results are cached per process, keyed by the normalized query and
+# search type. Call KB_CACHE.invalidate() after re-syncing the knowledge base.
+KB_CACHE = RetrievalCache(
+    max_entries=int(os.getenv("KB_CACHE_MAX_ENTRIES", "512")),
+    ttl_secs=float(os.getenv("KB_CACHE_TTL_SECS", "3600")),
+)
+
+# Search results are packed into this many (estimated) tokens for the agent,
+# best scores first and without the overlap between neighbouring chunks
+KB_CONTEXT = ContextPacker(
+    token_budget=int(os.getenv("KB_CONTEXT_TOKEN_BUDGET", "500")),
+    max_chunk_tokens=int(os.getenv("KB_CONTEXT_MAX_CHUNK_TOKENS", "250")),
+    min_relative_score=float(os.getenv("KB_CONTEXT_MIN_RELATIVE_SCORE", "0")),
+)
+
+# Optional local index that answers pure claim-ID queries without a vector
+# search. Build it with `python claim_index.py build <kb-docs-dir>`.
+CLAIM_INDEX = load_claim_index(os.getenv("CLAIM_INDEX_PATH", "claims.idx"))
+
+# Strands agent runs block for the whole agent loop, so they run on a bounded
+# thread pool shared by every session instead of on the event loop
+AGENT_EXECUTOR = AgentExecutor(
+    max_workers=int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", "16"))
+)
+
+# When the caller interrupts, pipecat cancels the search_knowledge_base call in
+# progress. The agent run behind it is told to stop too, so it makes no more
+# model or tool calls for an answer nobody will hear; this counts what that saves.
+INTERRUPTIONS = InterruptionStats()
+
+# "rules" sends single-claim lookups straight to the knowledge base, skipping
+# the Strands agent's two model calls; "agent" sends every search to the agent
+QUERY_ROUTER = QueryRouter(mode=os.getenv("QUERY_ROUTING", "rules"))
+
+# Speak the Strands agent's answer sentence by sentence as it streams in, rather
+# than waiting for the whole answer and having the main LLM rephrase it
+AGENT_STREAMING = os.getenv("AGENT_STREAMING", "false").lower() == "true"
+
+# Start KB retrieves for claim IDs heard in interim transcripts; off by default,
+# since a speculation that isn't used still spends a retrieve
+KB_PREFETCH = os.getenv("KB_PREFETCH", "false").lower() == "true"
+
+GREETING = "Thanks for contacting tri-county insurance. How can I help you?"
+KB_ERROR_MESSAGE = "I'm sorry, something went wrong while processing your request."
+AGENT_ERROR_MESSAGE = "I'm sorry, I encountered an error processing your request."
+# Utterances spoken word for word are synthesized once, then served from
+# TTS_CACHE. The error messages are function results the LLM rephrases, except
+# when the agent's answer is streamed straight to the TTS.
+TTS_CACHEABLE_TEXTS = [GREETING] + ([AGENT_ERROR_MESSAGE] if AGENT_STREAMING else [])
+TTS_CACHE = TTSAudioCache(os.getenv("TTS_CACHE_DIR", "tts_cache"))
+
+# Per-turn stage latencies from every session in the process. Set
+# LATENCY_METRICS_PORT to serve p50/p95/p99 per stage over HTTP, and
+# LATENCY_LOG_PATH to append each turn to a JSONL log.
+TURN_LATENCY = LatencyRecorder(
+    max_turns=int(os.getenv("LATENCY_MAX_TURNS", "1000")),
+    log_path=os.getenv("LATENCY_LOG_PATH"),
+)
+TURN_LATENCY.add_stats_source("kb_cache", KB_CACHE.stats)
+TURN_LATENCY.add_stats_source("kb_context", KB_CONTEXT.stats)
+TURN_LATENCY.add_stats_source("agent_executor", AGENT_EXECUTOR.stats)
+TURN_LATENCY.add_stats_source("interruptions", INTERRUPTIONS.stats)
+TURN_LATENCY.add_stats_source("query_router", QUERY_ROUTER.stats)
+TURN_LATENCY.add_stats_source("bedrock_limiter", BEDROCK_LIMITER.stats)
+
+# Set LOOP_MONITOR=true to sample event loop lag and log the stack of any code
+# that blocks the loop for longer than LOOP_MONITOR_THRESHOLD_MS. The lag
+# histogram and stall counts are served with the turn latencies.
+LOOP_MONITOR = None
+if os.getenv("LOOP_MONITOR", "false").lower() == "true":
+    LOOP_MONITOR = LoopMonitor(
+        threshold_secs=float(os.getenv("LOOP_MONITOR_THRESHOLD_MS", "100")) / 1000
+    )
+    TURN_LATENCY.add_stats_source("event_loop", LOOP_MONITOR.stats)
+
+# Set VAD_BATCHING=true to run every session's VAD in batched inference calls.
+# With many sessions that takes much less CPU, but each chunk waits up to
+# VAD_BATCH_WAIT_MS for its batch to fill.
+VAD_ENGINE = None
+if os.getenv("VAD_BATCHING", "false").lower() == "true":
+    VAD_ENGINE = BatchedVADEngine(
+        max_wait_secs=float(os.getenv("VAD_BATCH_WAIT_MS", "10")) / 1000
+    )
+    TURN_LATENCY.add_stats_source("vad_engine", VAD_ENGINE.stats)
+
+# Turn-taking profile (fast, balanced or telephony, see turn_taking.py) for
+# sessions that don't pick one with {"turn_taking": "<profile>"} in their body
+TURN_TAKING_PROFILE = check_turn_taking_profile(
+    os.getenv("TURN_TAKING_PROFILE", "balanced")
+)
+
+_THINKING_BLOCK = re.compile(r"<thinking>.*?</thinking>", re.DOTALL)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# How often tools check whether their agent run has been cancelled
+_CANCEL_POLL_SECS = 0.05
+
+
+async def _unless_cancelled(coro, cancel_signal: threading.Event):
+    """Await coro, unless cancel_signal is set first; then cancel it and return None"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while not task.done():
+            if cancel_signal.is_set():
+                return None
+            await asyncio.wait({task}, timeout=_CANCEL_POLL_SECS)
+        return task.result()
+    finally:
+        # No-op if it finished
+        task.cancel()
+
+
+def _pop_sentences(buffer: str) -> tuple:
+    """Split complete sentences off the front of streamed agent text.
+
+    Returns (sentences, remainder). <thinking> blocks are dropped, and anything
+    from an unmatched "<" on is held back in case it's an unfinished one.
+    """
+    buffer = _THINKING_BLOCK.sub("", buffer)
+    held = ""
+    tag_start = buffer.find("<")
+    if tag_start != -1:
+        buffer, held = buffer[:tag_start], buffer[tag_start:]
+    *sentences, rest = _SENTENCE_END.split(buffer)
+    return [s.strip() for s in sentences if s.strip()], rest + held
+
 
 class BedrockKnowledgeBaseClient:
     """Client for interacting with Amazon Bedrock Knowledge Base"""
 
-    def __init__(self, knowledge_base_id: str):
+    def __init__(
+        self,
+        knowledge_base_id: str,
+        search_strategy: str = KB_SEARCH_STRATEGY,
+        cache: RetrievalCache = KB_CACHE,
+        context_packer: ContextPacker = KB_CONTEXT,
+        claim_index: Optional[ClaimIndex] = CLAIM_INDEX,
+        limiter: BedrockLimiter = BEDROCK_LIMITER,
+        boto_session: Optional[boto3.Session] = None,
+    ):
         self.knowledge_base_id = knowledge_base_id
-        self.bedrock_agent_runtime = boto3.client(
-            "bedrock-agent-runtime",
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-            region_name=os.getenv("AWS_REGION", "us-east-1"),
-        )
+        self.limiter = limiter
+        self.search_strategy = search_strategy
+        self.cache = cache
+        self.context_packer = context_packer
+        self.claim_index = claim_index
+        if boto_session:
+            self.bedrock_agent_runtime = boto_session.client("bedrock-agent-runtime")
+        else:
+            self.bedrock_agent_runtime = boto3.client(
+                "bedrock-agent-runtime",
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                region_name=os.getenv("AWS_REGION", "us-east-1"),
+            )
         logger.info(
             f"Initialized Bedrock Knowledge Base client for KB: {knowledge_base_id}"
         )
 
-    async def query_knowledge_base(self, query: str, max_results: int = 10) -> str:
-        """Query the Bedrock Knowledge Base and return formatted response"""
-        try:
-            logger.info(f"Querying knowledge base with: {query}")
-
-            # Enhanced query for better claim ID matching
-            enhanced_query = query
-            if any(
-                keyword in query.lower()
-                for keyword in ["claim", "id", "number", "reference", "ticket"]
-            ):
-                enhanced_query = f"claim ID {query}"
-
-            response = self.bedrock_agent_runtime.retrieve(
+    def _start_retrieve(
+        self,
+        text: str,
+        search_type: str,
+        max_results: int,
+        priority: int = PRIORITY_IN_TURN,
+    ):
+        """Submit a single retrieve to the shared executor, once the limiter allows"""
+        return self.limiter.submit(
+            _retrieve_executor,
+            "retrieve",
+            self.knowledge_base_id,
+            lambda: self.bedrock_agent_runtime.retrieve(
                 knowledgeBaseId=self.knowledge_base_id,
-                retrievalQuery={"text": enhanced_query},
+                retrievalQuery={"text": text},
                 retrievalConfiguration={
                     "vectorSearchConfiguration": {
                         "numberOfResults": max_results,
-                        "overrideSearchType": "HYBRID",  # Use both semantic and keyword search
+                        "overrideSearchType": search_type,
                     }
                 },
-            )
+            ).get("retrievalResults", []),
+            priority,
+        )
+
+    async def _retrieve(self, text: str, search_type: str, max_results: int) -> list:
+        """Run a single retrieve on the shared executor without blocking the event loop"""
+        cache_key = self.cache.make_key(text, search_type, max_results)
+        results = self.cache.get(cache_key)
+        if results is not None:
+            logger.debug(f"Knowledge base cache hit for {search_type}: {text}")
+            return results
+
+        # Joins an identical retrieve if one is already in flight
+        future = self.cache.fetch(
+            cache_key, lambda: self._start_retrieve(text, search_type, max_results)
+        )
+        # A prefetch that's still waiting for the limiter is needed now
+        self.limiter.promote(future, PRIORITY_IN_TURN)
+        try:
+            # Shielded because other callers may be waiting on the same retrieve
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            self.cache.release(cache_key, future)
+            raise
+
+    def prefetch(self, query: str, max_results: int = 10) -> Optional[Future]:
+        """Start the HYBRID retrieve that query_knowledge_base(query) will need.
+
+        Returns the retrieve, or None if none was started. The result lands in
+        the cache, where the real lookup picks it up (or joins it if it's still
+        running).
+        """
+        # Claims in the local index don't need a retrieve at all
+        claim_id = claim_id_from_query(query)
+        if self.claim_index and claim_id and self.claim_index.lookup(claim_id):
+            return None
+        enhanced_query = self._enhance_query(query)
+        cache_key = self.cache.make_key(enhanced_query, "HYBRID", max_results)
+        return self.cache.speculate(
+            cache_key,
+            lambda: self._start_retrieve(
+                enhanced_query, "HYBRID", max_results, PRIORITY_SPECULATIVE
+            ),
+        )
+
+    async def _race_searches(
+        self, query: str, enhanced_query: str, max_results: int
+    ) -> list:
+        """Run HYBRID and SEMANTIC searches concurrently, preferring HYBRID results"""
+        hybrid = asyncio.ensure_future(
+            self._retrieve(enhanced_query, "HYBRID", max_results)
+        )
+        semantic = asyncio.ensure_future(self._retrieve(query, "SEMANTIC", max_results))
+        try:
+            results = await hybrid
+            if results:
+                return results
+            logger.info(f"No HYBRID results, using SEMANTIC results for: {query}")
+            return await semantic
+        finally:
+            # No-op if the SEMANTIC search was used; otherwise drop it, which also
+            # keeps it from starting if it's still queued on the executor
+            semantic.cancel()
+
+    def _lookup_claim_index(self, query: str) -> list:
+        """Answer a pure claim-ID query from the local index, if there is one"""
+        if not self.claim_index:
+            return []
+        claim_id = claim_id_from_query(query)
+        if not claim_id:
+            return []
+
+        chunks = self.claim_index.lookup(claim_id)
+        if chunks:
+            logger.info(f"Answered claim ID {claim_id} from the local claim index")
+        # Shaped like retrieve results so they format the same way
+        return [
+            {
+                "content": {"text": chunk["text"]},
+                "score": 1.0,
+                "location": {"s3Location": {"uri": chunk["source"]}},
+            }
+            for chunk in chunks
+        ]
 
-            # Extract and format the results
-            results = response.get("retrievalResults", [])
+    @staticmethod
+    def _enhance_query(query: str) -> str:
+        # Enhanced query for better claim ID matching
+        enhanced_query = query
+        if any(
+            keyword in query.lower()
+            for keyword in ["claim", "id", "number", "reference", "ticket"]
+        ):
+            enhanced_query = f"claim ID {query}"
+        return enhanced_query
+
+    async def _search(self, query: str, max_results: int) -> list:
+        """Search the knowledge base using the configured search strategy"""
+        enhanced_query = self._enhance_query(query)
+
+        if self.search_strategy == "race":
+            results = await self._race_searches(query, enhanced_query, max_results)
+        else:
+            # Use both semantic and keyword search
+            results = await self._retrieve(enhanced_query, "HYBRID", max_results)
 
             if not results:
                 # Try alternative query if no results found
                 logger.info(f"No results found, trying alternative query: {query}")
-                alt_response = self.bedrock_agent_runtime.retrieve(
-                    knowledgeBaseId=self.knowledge_base_id,
-                    retrievalQuery={"text": query},
-                    retrievalConfiguration={
-                        "vectorSearchConfiguration": {
-                            "numberOfResults": max_results,
-                            "overrideSearchType": "SEMANTIC",
-                        }
-                    },
-                )
-                results = alt_response.get("retrievalResults", [])
+                results = await self._retrieve(query, "SEMANTIC", max_results)
 
-            if not results:
-                return f"I couldn't find any information about '{query}' in the knowledge base. Please check if the claim ID exists or try rephrasing your question."
-
-            # Format the response with more detail
-            formatted_response = f"Found {len(results)} result(s) for your query:\n\n"
-
-            for i, result in enumerate(results[:5], 1):  # Show top 5 results
-                content = result.get("content", {}).get("text", "")
-                score = result.get("score", 0)
-                source = (
-                    result.get("location", {})
-                    .get("s3Location", {})
-                    .get("uri", "Unknown source")
-                )
+        return results
 
-                if content:
-                    # Show full content for claim-related queries to include all notes
-                    content_length = (
-                        1000
-                        if any(keyword in query.lower() for keyword in ["claim", "id"])
-                        else 200
-                    )
-                    truncated_content = content[:content_length]
-                    if len(content) > content_length:
-                        truncated_content += "..."
+    async def query_knowledge_base(self, query: str, max_results: int = 10) -> str:
+        """Query the Bedrock Knowledge Base and return formatted response"""
+        try:
+            logger.info(f"Querying knowledge base with: {query}")
 
-                    formatted_response += f"{i}. {truncated_content}\n"
-                    formatted_response += f"   (Relevance: {score:.2f})\n\n"
+            results = self._lookup_claim_index(query)
+            if not results:
+                results = await self._search(query, max_results)
 
-            return formatted_response.strip()
+            # Results can all be empty chunks
+            context = self.context_packer.pack(results) if results else None
+            if not context or not context.packed:
+                return f"I couldn't find any information about '{query}' in the knowledge base. Please check if the claim ID exists or try rephrasing your question."
+            logger.debug(
+                f"Packed {context.packed} of {len(results)} result(s) into "
+                f"~{context.tokens} tokens"
+            )
+            return context.text
 
         except ClientError as e:
             error_msg = f"Error querying knowledge base: {e}"
@@ -132,21 +422,90 @@ class BedrockKnowledgeBaseClient:
         except Exception as e:
             error_msg = f"Unexpected error: {e}"
             logger.error(error_msg)
-            return "I'm sorry, something went wrong while processing your request."
+            return KB_ERROR_MESSAGE
 
 
-class StrandsAgent:
-    def __init__(self):
-        self.session = boto3.Session(
+class BedrockClientPool:
+    """Process-wide pool of warmed Bedrock clients shared by every session.
+
+    Resolving credentials and setting up endpoints for a new boto3 session and
+    its clients takes hundreds of milliseconds, which callers would otherwise
+    wait through before the greeting. botocore clients are thread-safe, so
+    sessions borrow them round-robin; each pooled client keeps its own
+    connection pool.
+    """
+
+    def __init__(self, size: int = 4, limiter: BedrockLimiter = BEDROCK_LIMITER):
+        self.size = size
+        self.limiter = limiter
+        self._lock = threading.Lock()
+        self._clients = []
+        self._next = 0
+
+    def _create_session(self) -> boto3.Session:
+        return boto3.Session(
             aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
             aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
             region_name=os.getenv("AWS_REGION", "us-east-1"),
         )
 
-        self.bedrock_model = BedrockModel(
-            model_id="amazon.nova-lite-v1:0", boto_session=self.session
-        )
-        self.bedrock_client = BedrockKnowledgeBaseClient(KNOWLEDGE_BASE_ID)
+    def warm(self):
+        """Create the pooled clients, if that hasn't happened yet"""
+        with self._lock:
+            if self._clients:
+                return
+
+            start_time = time.monotonic()
+            # Creating clients from a shared boto3 session isn't thread-safe, so
+            # it only happens here, under the lock
+            session = self._create_session()
+            for _ in range(self.size):
+                model = RunCancellableBedrockModel(
+                    model_id="amazon.nova-lite-v1:0", boto_session=session
+                )
+                # The agent's model calls only happen inside a turn's tool call
+                model.client = LimitedBedrockClient(model.client, self.limiter)
+                kb_client = BedrockKnowledgeBaseClient(
+                    KNOWLEDGE_BASE_ID, limiter=self.limiter, boto_session=session
+                )
+                self._clients.append((model, kb_client))
+            logger.info(
+                f"Warmed {self.size} Bedrock client(s) in {time.monotonic() - start_time:.2f}s"
+            )
+
+    async def warm_async(self):
+        """warm(), on a worker thread so the event loop keeps running"""
+        if not self._clients:
+            await asyncio.get_running_loop().run_in_executor(None, self.warm)
+
+    def acquire(self) -> tuple:
+        """Borrow a (BedrockModel, BedrockKnowledgeBaseClient) pair.
+
+        Warms the pool first if it isn't yet, which blocks; on the event loop,
+        await warm_async() before the first acquire().
+        """
+        self.warm()
+        with self._lock:
+            clients = self._clients[self._next % self.size]
+            self._next += 1
+            return clients
+
+
+BEDROCK_CLIENTS = BedrockClientPool(
+    size=int(os.getenv("BEDROCK_CLIENT_POOL_SIZE", "4"))
+)
+
+
+class StrandsAgent:
+    def __init__(
+        self,
+        clients: BedrockClientPool = BEDROCK_CLIENTS,
+        interruptions: InterruptionStats = INTERRUPTIONS,
+    ):
+        # The Bedrock clients are shared across sessions; only the Strands Agent
+        # (and the conversation history it holds) belongs to this session
+        self.bedrock_model, self.bedrock_client = clients.acquire()
+        self.interruptions = interruptions
 
         self.agent = Agent(
             tools=[self.search_knowledge_base, self.general_query],
@@ -154,11 +513,24 @@ class StrandsAgent:
             system_prompt="You are a claim assistant. Search for EXACT claim IDs only. When users say 'claim ID 1', search for 'claim ID 1' specifically, not '1234'. When they say 'claim ID 1234', search for 'claim ID 1234' specifically. Use general_query for non-claim questions.",
         )
 
-    @tool
-    async def search_knowledge_base(self, query: str) -> str:
+        # Per-query stage latencies, reported as TTFB metrics by metrics_frame()
+        self.stage_timings = {}
+
+    @tool(context=True)
+    async def search_knowledge_base(self, query: str, tool_context: ToolContext) -> str:
         """Search for specific claim information in knowledge base"""
         logger.info(f"Searching KnowledgeBase: {query}")
-        return await self.bedrock_client.query_knowledge_base(query)
+        start_time = time.monotonic()
+        # Retrieves that haven't started yet are dropped along with the search
+        response = await _unless_cancelled(
+            self.bedrock_client.query_knowledge_base(query), tool_context.cancel_signal
+        )
+        if response is None:
+            logger.info(f"Knowledge base search cancelled: {query}")
+            self.interruptions.record_search_cancelled()
+            return "The search was cancelled."
+        self.stage_timings.setdefault("kb_retrieve", time.monotonic() - start_time)
+        return response
 
     @tool
     async def general_query(self, question: str) -> str:
@@ -174,14 +546,107 @@ class StrandsAgent:
             logger.error(f"Error with general query: {e}")
             return "I can help answer general questions. What would you like to know?"
 
-    def process_query(self, user_input: str) -> str:
-        """Process user input through the Strands agent"""
+    def _record_run(self, interrupted: bool):
+        invocation = self.agent.event_loop_metrics.latest_agent_invocation
+        output_tokens = invocation.usage["outputTokens"] if invocation else 0
+        self.interruptions.record_run(output_tokens, interrupted)
+
+    def process_query(
+        self, user_input: str, cancel_signal: Optional[threading.Event] = None
+    ) -> str:
+        """Process user input through the Strands agent.
+
+        Setting cancel_signal stops the agent at its next model chunk or
+        between model and tool calls.
+        """
+        self.stage_timings = {}
         try:
-            response = self.agent(user_input)
+            response = self.agent(
+                user_input,
+                cancel_signal=cancel_signal,
+                invocation_state={"run_cancel_signal": cancel_signal},
+            )
+            # A response cut off before Strands saw the signal ends normally
+            self._record_run(
+                interrupted=response.stop_reason == "cancelled"
+                or bool(cancel_signal and cancel_signal.is_set())
+            )
             return str(response)
         except Exception as e:
             logger.error(f"Error processing query with StrandsAgent: {e}")
-            return "I'm sorry, I encountered an error processing your request."
+            return AGENT_ERROR_MESSAGE
+
+    async def stream_query(self, user_input: str, executor: AgentExecutor):
+        """Process user input through the Strands agent, yielding complete sentences
+
+        The agent runs on executor, under its queue bound and timeout, as
+        process_query() does; its text comes back to the loop as it streams.
+        """
+        self.stage_timings = {}
+        start_time = time.monotonic()
+        loop = asyncio.get_running_loop()
+        # The agent's text as it streams, then None once the run is over
+        chunks = asyncio.Queue()
+        # Set if the caller stops reading, e.g. because it was interrupted
+        cancel_signal = threading.Event()
+
+        def on_event(**kwargs):
+            # On the executor thread, for every event the agent streams
+            text = kwargs.get("data")
+            if text:
+                loop.call_soon_threadsafe(chunks.put_nowait, text)
+
+        run = asyncio.ensure_future(
+            executor.run(
+                lambda: self.agent(
+                    user_input,
+                    cancel_signal=cancel_signal,
+                    invocation_state={"run_cancel_signal": cancel_signal},
+                    callback_handler=on_event,
+                ),
+                cancel_signal=cancel_signal,
+            )
+        )
+        run.add_done_callback(lambda _: chunks.put_nowait(None))
+        buffer = ""
+        finished = False
+        try:
+            while (text := await chunks.get()) is not None:
+                self.stage_timings.setdefault(
+                    "strands_agent", time.monotonic() - start_time
+                )
+                sentences, buffer = _pop_sentences(buffer + text)
+                for sentence in sentences:
+                    yield sentence
+
+            await run
+            finished = True
+            self._record_run(interrupted=False)
+
+            # Whatever's left once the agent is done, minus an unclosed <thinking>
+            rest = _THINKING_BLOCK.sub("", buffer).split("<thinking>")[0].strip()
+            if rest:
+                yield rest
+        except (asyncio.CancelledError, GeneratorExit):
+            # Cancelled while the agent was working, or closed while the caller
+            # was speaking a sentence
+            if not finished:
+                # Sets cancel_signal, or drops the run if it's still queued
+                run.cancel()
+                self._record_run(interrupted=True)
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming query with StrandsAgent: {e}")
+            yield AGENT_ERROR_MESSAGE
+
+    def metrics_frame(self) -> MetricsFrame:
+        """Stage latencies of the last query, as metrics for pipeline observers"""
+        return MetricsFrame(
+            data=[
+                TTFBMetricsData(processor=stage, value=value)
+                for stage, value in self.stage_timings.items()
+            ]
+        )
 
 
 search_function = FunctionSchema(
@@ -194,29 +659,18 @@ search_function = FunctionSchema(
 tools = ToolsSchema(standard_tools=[search_function])
 
 
-async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
-    logger.info("Starting Bedrock Knowledge Base Voice Agent with Strands")
+def create_pipeline_task(
+    transport: BaseTransport,
+    strands_agent: StrandsAgent,
+    stt: STTService,
+    tts: TTSService,
+    llm: AWSBedrockLLMService,
+) -> PipelineTask:
+    """Build the agent's pipeline around the given services.
 
-    strands_agent = StrandsAgent()
-
-    stt = DeepgramSTTService(
-        api_key=os.getenv("DEEPGRAM_API_KEY"),
-        live_options=LiveOptions(
-            model="nova-3-general", language=Language.EN, smart_format=True
-        ),
-    )
-
-    tts = DeepgramTTSService(
-        api_key=os.getenv("DEEPGRAM_API_KEY"),
-        voice="aura-2-arcas-en",
-        sample_rate=24000,
-        encoding="linear16",
-    )
-
-    llm = AWSBedrockLLMService(
-        aws_region="us-east-1",
-        model="us.anthropic.claude-3-5-haiku-20241022-v1:0",
-    )
+    Separate from run_bot so the same pipeline can be driven with local
+    stand-ins for the services (see benchmark.py).
+    """
 
     async def search_knowledge_base(params: FunctionCallParams):
         query = params.arguments.get("query", "")
@@ -230,10 +684,59 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
             )
             return
 
-        logger.info(f"Using Strands agent for: {query}")
+        route = QUERY_ROUTER.route(query)
+        start_time = time.monotonic()
+        if route == ROUTE_KB:
+            logger.info(f"Searching the knowledge base directly for: {query}")
+        else:
+            logger.info(f"Using Strands agent for: {query}")
 
         try:
-            response_text = strands_agent.process_query(query)
+            if route == ROUTE_KB:
+                response_text = await strands_agent.bedrock_client.query_knowledge_base(
+                    query
+                )
+                await params.llm.push_frame(
+                    MetricsFrame(
+                        data=[
+                            TTFBMetricsData(
+                                processor="kb_retrieve",
+                                value=time.monotonic() - start_time,
+                            )
+                        ]
+                    )
+                )
+            elif AGENT_STREAMING:
+                spoken = []
+                async for sentence in strands_agent.stream_query(query, AGENT_EXECUTOR):
+                    await params.llm.push_frame(TTSSpeakFrame(sentence))
+                    spoken.append(sentence)
+                await params.llm.push_frame(strands_agent.metrics_frame())
+                QUERY_ROUTER.record(route, time.monotonic() - start_time)
+
+                # The answer has already been spoken, so the LLM doesn't need to
+                # run again; the result just keeps the context complete
+                await params.result_callback(
+                    {
+                        "query": query,
+                        "response": " ".join(spoken),
+                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "knowledge_base_id": KNOWLEDGE_BASE_ID,
+                    },
+                    properties=FunctionCallResultProperties(run_llm=False),
+                )
+                return
+            else:
+                # Set if the call is cancelled by an interruption
+                cancel_signal = threading.Event()
+                response_text = await AGENT_EXECUTOR.run(
+                    strands_agent.process_query,
+                    query,
+                    cancel_signal,
+                    cancel_signal=cancel_signal,
+                )
+                await params.llm.push_frame(strands_agent.metrics_frame())
+            QUERY_ROUTER.record(route, time.monotonic() - start_time)
 
             await params.result_callback(
                 {
@@ -245,7 +748,8 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
             )
 
         except Exception as e:
-            logger.error(f"Error with Strands agent for {query}: {e}")
+            logger.error(f"Error searching ({route}) for {query}: {e}")
+            QUERY_ROUTER.record(route, time.monotonic() - start_time, error=True)
             await params.result_callback(
                 {
                     "query": query,
@@ -257,6 +761,12 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
 
     llm.register_function("search_knowledge_base", search_knowledge_base)
 
+    # Starts KB retrieves for claim IDs heard in interim transcripts, so results
+    # are often ready by the time the LLM calls search_knowledge_base
+    transcription = [stt]
+    if KB_PREFETCH:
+        transcription.append(KnowledgeBasePrefetcher(strands_agent.bedrock_client))
+
     # System instruction for knowledge base integration
     system_instruction = (
         "You are a helpful AI assistant that can help with claim lookups and general questions. "
@@ -276,8 +786,11 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
             {"role": "system", "content": system_instruction},
             {
                 "role": "user",
-                "content": "Start by saying exactly this: 'Thanks for contacting tri-county insurance. How can I help you?",
+                "content": f"Start by saying exactly this: '{GREETING}'",
             },
+            # The greeting is spoken straight from the TTS cache when the client
+            # connects, so it's already part of the conversation
+            {"role": "assistant", "content": GREETING},
         ],
         tools=tools,
     )
@@ -287,7 +800,7 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
     pipeline = Pipeline(
         [
             transport.input(),
-            stt,
+            *transcription,
             context_aggregator.user(),
             llm,
             tts,
@@ -296,6 +809,10 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
         ]
     )
 
+    session_id = uuid.uuid4().hex
+    if LOOP_MONITOR:
+        LOOP_MONITOR.track(session_id, pipeline)
+
     # Configure the pipeline task
     task = PipelineTask(
         pipeline,
@@ -304,14 +821,15 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
             enable_metrics=True,
             enable_usage_metrics=True,
         ),
+        observers=[TurnLatencyObserver(TURN_LATENCY, session_id=session_id)],
     )
 
     # Handle client connection event
     @transport.event_handler("on_client_connected")
     async def on_client_connected(transport, client):
         logger.info("Client connected to Bedrock Knowledge Base Voice Agent")
-        # Kick off the conversation
-        await task.queue_frames([LLMRunFrame()])
+        # Kick off the conversation with the (usually cached) greeting
+        await task.queue_frames([TTSSpeakFrame(GREETING)])
         # Trigger the first assistant response
         #await llm.trigger_assistant_response()
 
@@ -325,33 +843,114 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
         logger.info("Client closed connection to Bedrock Knowledge Base Voice Agent")
         await task.cancel()
 
+    return task
+
+
+@dataclass
+class SessionServices:
+    """A session's services, which run_bot() builds a pipeline around"""
+
+    strands_agent: StrandsAgent
+    stt: DeepgramSTTService
+    tts: CachedDeepgramTTSService
+    llm: LimitedBedrockLLMService
+
+
+def create_session_services(turn_taking: TurnTakingProfile) -> SessionServices:
+    stt = DeepgramSTTService(
+        api_key=os.getenv("DEEPGRAM_API_KEY"),
+        live_options=turn_taking.live_options(
+            model="nova-3-general", language=Language.EN, smart_format=True
+        ),
+    )
+
+    tts = CachedDeepgramTTSService(
+        audio_cache=TTS_CACHE,
+        cacheable_texts=TTS_CACHEABLE_TEXTS,
+        api_key=os.getenv("DEEPGRAM_API_KEY"),
+        voice="aura-2-arcas-en",
+        sample_rate=24000,
+        encoding="linear16",
+    )
+
+    llm = LimitedBedrockLLMService(
+        limiter=BEDROCK_LIMITER,
+        aws_region="us-east-1",
+        model="us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    )
+
+    return SessionServices(StrandsAgent(), stt, tts, llm)
+
+
+async def run_bot(
+    transport: BaseTransport,
+    runner_args: RunnerArguments,
+    turn_taking: TurnTakingProfile,
+):
+    """Run a session's pipeline.
+
+    Args:
+        transport: The session's transport.
+        runner_args: The runner's arguments for the session.
+        turn_taking: The session's turn-taking profile.
+    """
+    logger.info("Starting Bedrock Knowledge Base Voice Agent with Strands")
+
+    # Building the services blocks, so it happens off the loop other sessions'
+    # audio runs on
+    services = await asyncio.to_thread(create_session_services, turn_taking)
+
+    task = create_pipeline_task(
+        transport, services.strands_agent, services.stt, services.tts, services.llm
+    )
+
     # Run the pipeline
     runner = PipelineRunner(handle_sigint=False)
     await runner.run(task)
 
 
+def create_vad_analyzer(params: Optional[VADParams] = None) -> SharedSileroVADAnalyzer:
+    """Create a session's VAD analyzer, on the process-wide Silero model"""
+    if VAD_ENGINE:
+        return BatchedSileroVADAnalyzer(params=params, engine=VAD_ENGINE)
+    return SharedSileroVADAnalyzer(params=params)
+
+
 async def bot(runner_args: RunnerArguments):
     """Main bot entry point for the bot starter."""
 
+    # SmallWebRTC sessions don't have a body
+    turn_taking = get_turn_taking_profile(
+        getattr(runner_args, "body", None), TURN_TAKING_PROFILE
+    )
+    logger.info(f"Using the {turn_taking.name} turn-taking profile")
+
     transport_params = {
         "daily": lambda: DailyParams(
             audio_in_enabled=True,
             audio_out_enabled=True,
-            vad_analyzer=SileroVADAnalyzer(),
+            vad_analyzer=create_vad_analyzer(turn_taking.vad_params),
         ),
         "webrtc": lambda: TransportParams(
             audio_in_enabled=True,
             audio_out_enabled=True,
-            vad_analyzer=SileroVADAnalyzer(),
+            vad_analyzer=create_vad_analyzer(turn_taking.vad_params),
         ),
     }
 
+    # Only the first session waits for this, when the runner didn't warm the
+    # pool at startup
+    await BEDROCK_CLIENTS.warm_async()
+
     transport = await create_transport(runner_args, transport_params)
 
-    await run_bot(transport, runner_args)
+    await run_bot(transport, runner_args, turn_taking)
 
 
 if __name__ == "__main__":
     from pipecat.runner.run import main
 
+    BEDROCK_CLIENTS.warm()
+    if os.getenv("LATENCY_METRICS_PORT"):
+        TURN_LATENCY.serve(int(os.getenv("LATENCY_METRICS_PORT")))
     main()
\ No newline at end of file
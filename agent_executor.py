@@ -0,0 +1,224 @@
+"""Bounded, per-process executor for blocking Strands agent runs.
+
+A Strands agent call runs a full agent loop (nested model and tool calls) and
+blocks its caller until it finishes. Running it on the event loop that carries
+real-time audio stalls every session in the process, so agent runs go to a
+dedicated thread pool instead. The pool is shared by all sessions; its size
+bounds how many agent runs can be in flight, and anything beyond that queues.
+
+A run's thread can't be interrupted, so cancelling the coroutine that awaits it
+only drops runs that are still queued. Runs that take a cancel_signal stop
+early instead: Strands checks it while streaming the model's response and
+between model and tool calls. RunCancellableBedrockModel keeps passing a run's
+cancel_signal to the model after Strands has cleared its own. InterruptionStats
+counts the work that saves.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from loguru import logger
+from strands.models import BedrockModel
+
+
+class AgentRunRejected(Exception):
+    """The agent executor's queue is full"""
+
+
+class AgentExecutor:
+    """Thread pool for blocking agent runs, with queue depth and wait-time metrics.
+
+    Args:
+        max_workers: Number of agent runs in flight at once.
+        name: Prefix for the pool's thread names.
+        max_queued: Number of agent runs that can wait for a worker; runs
+            beyond that are rejected straight away. None for no limit.
+        timeout_secs: How long a run can take, queueing included, before its
+            cancel_signal is set and the caller gets asyncio.TimeoutError.
+            None for no limit.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 16,
+        name: str = "strands-agent",
+        max_queued: Optional[int] = None,
+        timeout_secs: Optional[float] = None,
+    ):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.timeout_secs = timeout_secs
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.interrupted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_secs_total = 0.0
+        self.wait_secs_max = 0.0
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        cancel_signal: Optional[threading.Event] = None,
+    ) -> Any:
+        """Run fn(*args) on the pool and wait for its result without blocking the loop
+
+        If the caller is cancelled, or the run times out, cancel_signal is
+        set, so a run that has already started (and passed it to the agent)
+        can stop early.
+
+        Raises:
+            AgentRunRejected: If max_queued runs are already waiting.
+            asyncio.TimeoutError: If the run took longer than timeout_secs.
+        """
+        submitted_at = time.monotonic()
+        started = threading.Event()
+
+        def call():
+            wait_secs = time.monotonic() - submitted_at
+            with self._lock:
+                self.queued -= 1
+                if cancel_signal and cancel_signal.is_set():
+                    self.cancelled += 1
+                    return None
+                started.set()
+                self.active += 1
+                self.wait_secs_total += wait_secs
+                self.wait_secs_max = max(self.wait_secs_max, wait_secs)
+            if wait_secs > 1.0:
+                logger.warning(f"Agent run waited {wait_secs:.2f}s for a free worker")
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        def on_done(future):
+            # A run cancelled while still queued never reaches call()
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+                    self.cancelled += 1
+
+        with self._lock:
+            if self.max_queued is not None and self.queued >= self.max_queued:
+                self.rejected += 1
+                raise AgentRunRejected(f"{self.queued} agent runs already queued")
+            self.queued += 1
+        future = self._executor.submit(call)
+        future.add_done_callback(on_done)
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), self.timeout_secs
+            )
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            if cancel_signal:
+                cancel_signal.set()
+            raise
+        except asyncio.CancelledError:
+            if cancel_signal:
+                cancel_signal.set()
+                if started.is_set():
+                    with self._lock:
+                        self.interrupted += 1
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self.active + self.completed
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "interrupted": self.interrupted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "wait_secs_avg": self.wait_secs_total / started if started else 0.0,
+                "wait_secs_max": self.wait_secs_max,
+            }
+
+
+class InterruptionStats:
+    """Counts the agent work that interruptions cut short.
+
+    An interrupted agent run stops streaming from the model and doesn't make
+    its remaining model and tool calls. The output tokens that saves are
+    estimated as those of an average completed run, less what the interrupted
+    run had already generated. Bedrock reports usage at the end of a response,
+    so tokens from a response cut off mid-stream aren't counted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed_runs = 0
+        self.completed_output_tokens = 0
+        self.interrupted_runs = 0
+        self.interrupted_output_tokens = 0
+        self.output_tokens_saved = 0.0
+        self.searches_cancelled = 0
+
+    def record_run(self, output_tokens: int, interrupted: bool):
+        with self._lock:
+            if not interrupted:
+                self.completed_runs += 1
+                self.completed_output_tokens += output_tokens
+                return
+            self.interrupted_runs += 1
+            self.interrupted_output_tokens += output_tokens
+            if self.completed_runs:
+                average = self.completed_output_tokens / self.completed_runs
+                self.output_tokens_saved += max(0.0, average - output_tokens)
+
+    def record_search_cancelled(self):
+        with self._lock:
+            self.searches_cancelled += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "completed_runs": self.completed_runs,
+                "interrupted_runs": self.interrupted_runs,
+                "interrupted_output_tokens": self.interrupted_output_tokens,
+                "output_tokens_saved": round(self.output_tokens_saved),
+                "searches_cancelled": self.searches_cancelled,
+            }
+
+
+class RunCancellableBedrockModel(BedrockModel):
+    """BedrockModel that stops streaming once its run's cancel_signal is set.
+
+    Strands hands models the agent's own cancel signal, and clears it as soon
+    as a cancelled run returns. A response that was still waiting for its first
+    chunk would then stream to the end on a thread nobody reads from. The run's
+    cancel_signal, passed as invocation_state["run_cancel_signal"], stays set.
+    """
+
+    def stream(
+        self,
+        *args,
+        invocation_state: Optional[dict] = None,
+        cancel_signal: Optional[threading.Event] = None,
+        **kwargs,
+    ):
+        run_cancel_signal = (invocation_state or {}).get("run_cancel_signal")
+        return super().stream(
+            *args,
+            invocation_state=invocation_state,
+            cancel_signal=run_cancel_signal or cancel_signal,
+            **kwargs,
+        )
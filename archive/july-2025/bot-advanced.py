@@ -6,11 +6,12 @@
 
 import asyncio
 import os
+from dataclasses import dataclass
+from typing import Optional
 
 from dotenv import load_dotenv
 from loguru import logger
 from pipecat.adapters.schemas.tools_schema import ToolsSchema
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.pipeline.parallel_pipeline import ParallelPipeline
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
@@ -27,22 +28,45 @@ from pipecatcloud.agent import (
     WebSocketSessionArguments,
 )
 
-from lib.cloud import SmallWebRTCSessionArguments
-from strands_agent import StrandsAgentProcessor, StrandsAgentRequestFrame
-from utils import TTSLockAcquireProcessor, TTSLockReleaseProcessor
+from lib.cloud import LOOP_MONITOR, SmallWebRTCSessionArguments
+
+# shared_vad.py (repository root) keeps one Silero model per process instead of
+# one per session; it's used when the repository root is on PYTHONPATH
+try:
+    from shared_vad import SharedSileroVADAnalyzer as SileroVADAnalyzer
+except ImportError:
+    from pipecat.audio.vad.silero import SileroVADAnalyzer
+# session_prep.py (repository root) builds sessions' services while their offer
+# is negotiated; without it, each session builds its own once it starts
+try:
+    from session_prep import PreconnectedDeepgramSTTService, PreparedSessions
+except ImportError:
+    PreparedSessions = None
+from strands_agent import (
+    INTERRUPTIONS,
+    StrandsAgentProcessor,
+    StrandsAgentRequestFrame,
+    agent_executor,
+)
+from utils import OutputArbiter
 
 # Load environment variables
 load_dotenv(override=True)
 
 
-async def run_bot(transport, handle_sigint: bool = True):
-    """Main pipeline setup and execution function.
+@dataclass
+class SessionServices:
+    """A session's services, which run_bot() builds a pipeline around"""
+
+    stt: DeepgramSTTService
+    main_tts: DeepgramTTSService
+    specialist_tts: DeepgramTTSService
+    llm: AWSBedrockLLMService
+    strands_agent_processor: StrandsAgentProcessor
 
-    Args:
-        transport: The DailyTransport instance
-    """
 
-    stt = DeepgramSTTService(
+def create_session_services(stt_class=DeepgramSTTService) -> SessionServices:
+    stt = stt_class(
         api_key=os.getenv("DEEPGRAM_API_KEY"),
         live_options=LiveOptions(
             model="nova-3-general", language=Language.EN, smart_format=True
@@ -73,6 +97,48 @@ async def run_bot(transport, handle_sigint: bool = True):
         # params=AWSBedrockLLMService.InputParams(temperature=0.8, latency="optimized"),
     )
 
+    return SessionServices(stt, main_tts, specialist_tts, llm, StrandsAgentProcessor())
+
+
+async def _prepare_session() -> SessionServices:
+    # Building the services blocks, and this runs in the server's offer handler
+    services = await asyncio.to_thread(
+        create_session_services, PreconnectedDeepgramSTTService
+    )
+    services.stt.preconnect()
+    return services
+
+
+async def _release_session(services: SessionServices):
+    await services.stt.release()
+
+
+PREPARED_SESSIONS = None
+if PreparedSessions:
+    PREPARED_SESSIONS = PreparedSessions(
+        _prepare_session,
+        _release_session,
+        timeout_secs=float(os.getenv("SESSION_PREPARE_TIMEOUT_SECS", "30")),
+    )
+
+
+async def run_bot(
+    transport, handle_sigint: bool = True, services: Optional[SessionServices] = None
+):
+    """Main pipeline setup and execution function.
+
+    Args:
+        transport: The DailyTransport instance
+        services: Services prepared ahead of the session, or None to build them
+            now
+    """
+    services = services or await asyncio.to_thread(create_session_services)
+    stt = services.stt
+    main_tts = services.main_tts
+    specialist_tts = services.specialist_tts
+    llm = services.llm
+    strands_agent_processor = services.strands_agent_processor
+
     rtvi = RTVIProcessor(config=RTVIConfig(config=[]))
 
     messages = [
@@ -109,18 +175,11 @@ async def run_bot(transport, handle_sigint: bool = True):
     context = OpenAILLMContext(messages, tools)
     context_aggregator = llm.create_context_aggregator(context)
 
-    strands_agent_processor = StrandsAgentProcessor()
-
-    # Create a shared asyncio lock for TTS processors
-    tts_lock = asyncio.Lock()
-
-    # Create lock acquire and release processors for main TTS
-    main_tts_lock_acquire = TTSLockAcquireProcessor(tts_lock)
-    main_tts_lock_release = TTSLockReleaseProcessor(tts_lock)
-
-    # Create lock acquire and release processors for specialist TTS
-    specialist_tts_lock_acquire = TTSLockAcquireProcessor(tts_lock)
-    specialist_tts_lock_release = TTSLockReleaseProcessor(tts_lock)
+    # The main and specialist voices take turns on the output. The main LLM
+    # answers the user directly, so it goes first when both are waiting.
+    output_arbiter = OutputArbiter()
+    main_speaker = output_arbiter.speaker("main", priority=1)
+    specialist_speaker = output_arbiter.speaker("specialist", priority=0)
 
     pipeline = Pipeline(
         [
@@ -131,15 +190,13 @@ async def run_bot(transport, handle_sigint: bool = True):
                     stt,
                     context_aggregator.user(),
                     llm,
-                    main_tts_lock_acquire,
                     main_tts,
-                    main_tts_lock_release,
+                    main_speaker,
                 ],
                 [
                     strands_agent_processor,
-                    specialist_tts_lock_acquire,
                     specialist_tts,
-                    specialist_tts_lock_release,
+                    specialist_speaker,
                 ],
             ),
             transport.output(),
@@ -158,6 +215,9 @@ async def run_bot(transport, handle_sigint: bool = True):
         observers=[RTVIObserver(rtvi)],
     )
 
+    if LOOP_MONITOR:
+        LOOP_MONITOR.track(task.name, pipeline)
+
     @transport.event_handler("on_client_connected")
     async def on_client_connected(transport, participant):
         logger.info("First participant joined: {}", participant)
@@ -174,6 +234,9 @@ async def run_bot(transport, handle_sigint: bool = True):
     @transport.event_handler("on_client_disconnected")
     async def on_client_disconnected(transport, participant):
         logger.info("Participant left: {}", participant)
+        logger.info(f"Output arbiter: {output_arbiter.stats()}")
+        logger.info(f"Agent executor: {agent_executor().stats()}")
+        logger.info(f"Agent interruptions: {INTERRUPTIONS.stats()}")
         await task.cancel()
 
     runner = PipelineRunner(handle_sigint=False, force_gc=True)
@@ -181,6 +244,18 @@ async def run_bot(transport, handle_sigint: bool = True):
     await runner.run(task)
 
 
+def prepare(key: str) -> bool:
+    """Start building a session's services (called by the server as an offer arrives)."""
+    return bool(PREPARED_SESSIONS) and PREPARED_SESSIONS.start(key)
+
+
+def warm():
+    """Load models ahead of the first session (called in each server worker)."""
+    # Initializes onnxruntime and loads the Silero model (once per process, with
+    # shared_vad)
+    SileroVADAnalyzer()
+
+
 async def bot(
     session_args: DailySessionArguments
     | SmallWebRTCSessionArguments
@@ -268,7 +343,12 @@ async def bot(
     else:
         raise ValueError(f"Unsupported session arguments type: {type(session_args)}")
 
-    await run_bot(transport)
+    services = None
+    prepared_key = getattr(session_args, "prepared_key", None)
+    if PREPARED_SESSIONS and prepared_key:
+        services = await PREPARED_SESSIONS.take(prepared_key)
+
+    await run_bot(transport, services=services)
 
 
 if __name__ == "__main__":
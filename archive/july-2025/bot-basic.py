@@ -9,7 +9,6 @@ import os
 from dotenv import load_dotenv
 from loguru import logger
 from pipecat.adapters.schemas.tools_schema import ToolsSchema
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
@@ -25,7 +24,14 @@ from pipecatcloud.agent import (
     WebSocketSessionArguments,
 )
 
-from lib.cloud import SmallWebRTCSessionArguments
+from lib.cloud import LOOP_MONITOR, SmallWebRTCSessionArguments
+
+# shared_vad.py (repository root) keeps one Silero model per process instead of
+# one per session; it's used when the repository root is on PYTHONPATH
+try:
+    from shared_vad import SharedSileroVADAnalyzer as SileroVADAnalyzer
+except ImportError:
+    from pipecat.audio.vad.silero import SileroVADAnalyzer
 
 # Load environment variables
 load_dotenv(override=True)
@@ -113,6 +119,9 @@ async def run_bot(transport, handle_sigint: bool = True):
         ),
     )
 
+    if LOOP_MONITOR:
+        LOOP_MONITOR.track(task.name, pipeline)
+
     @transport.event_handler("on_client_connected")
     async def on_client_connected(transport, participant):
         logger.info("First participant joined: {}", participant)
@@ -136,6 +145,13 @@ async def run_bot(transport, handle_sigint: bool = True):
     await runner.run(task)
 
 
+def warm():
+    """Load models ahead of the first session (called in each server worker)."""
+    # Initializes onnxruntime and loads the Silero model (once per process, with
+    # shared_vad)
+    SileroVADAnalyzer()
+
+
 async def bot(
     session_args: DailySessionArguments
     | SmallWebRTCSessionArguments
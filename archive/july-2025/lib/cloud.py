@@ -50,6 +50,11 @@ Bot function signature::
         # Run your bot logic
         await run_bot_logic(transport)
 
+A bot can also implement an optional `prepare(key)` function, which the
+server calls as a WebRTC offer arrives so the bot can start building the
+session's services while the peer connection is negotiated. It returns whether
+it did; the session's arguments then carry the key as `prepared_key`.
+
 Supported transports:
 
 - Daily - Creates rooms and tokens, runs bot as participant
@@ -79,8 +84,12 @@ Then run: `python bot.py -t daily` or `python bot.py -t webrtc`
 
 import argparse
 import asyncio
+import importlib
+import importlib.util
 import os
 import sys
+import time
+import uuid
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
@@ -93,6 +102,7 @@ from fastapi.responses import RedirectResponse
 from loguru import logger
 
 from lib.runner_utils import setup_websocket_routes
+from lib.worker_pool import WorkerPool
 
 # Require pipecatcloud for cloud-compatible bots
 try:
@@ -115,16 +125,84 @@ class SmallWebRTCSessionArguments:
 
     webrtc_connection: Any
     session_id: Optional[str] = None
+    # The key the bot's prepare() was called with, if it was
+    prepared_key: Optional[str] = None
 
 
 load_dotenv(override=True)
 os.environ["LOCAL_RUN"] = "1"
 
+# Set LOOP_MONITOR=true to sample event loop lag and log the stack of any code
+# that blocks the loop; the histogram is served at /metrics/loop. This uses
+# loop_monitor.py from the repository root, so that needs to be on PYTHONPATH.
+LOOP_MONITOR = None
+if os.getenv("LOOP_MONITOR", "false").lower() == "true":
+    from loop_monitor import LoopMonitor
+
+    LOOP_MONITOR = LoopMonitor(
+        threshold_secs=float(os.getenv("LOOP_MONITOR_THRESHOLD_MS", "100")) / 1000
+    )
+
+
+# Transport modules the bots import when a session starts. main() imports them
+# up front so the first session of each kind doesn't pay for it.
+_TRANSPORT_MODULES = {
+    "daily": ["aiohttp", "lib.daily", "pipecat.transports.services.daily"],
+    "webrtc": [
+        "pipecat.transports.base_transport",
+        "pipecat.transports.network.small_webrtc",
+    ],
+    "twilio": [
+        "pipecat.transports.network.fastapi_websocket",
+        "pipecat.serializers.twilio",
+    ],
+    "telnyx": [
+        "pipecat.transports.network.fastapi_websocket",
+        "pipecat.serializers.telnyx",
+    ],
+    "plivo": [
+        "pipecat.transports.network.fastapi_websocket",
+        "pipecat.serializers.plivo",
+    ],
+}
+
+# Set by _get_bot_module() the first time it's called
+_bot_module = None
+
 
 def _get_bot_module():
-    """Get the bot module from the calling script."""
-    import importlib.util
+    """Get the bot module, finding it the first time this is called."""
+    global _bot_module
+    if _bot_module is None:
+        _bot_module = _find_bot_module()
+    return _bot_module
+
+
+def _preload(transport_type: str):
+    """Find the bot module and import the transport's dependencies.
+
+    Done once at startup, so that session requests don't have to scan for and
+    execute the bot file, or import pipecat and the Strands dependencies.
+
+    Args:
+        transport_type: The transport the server was started with.
+    """
+    start_time = time.monotonic()
+    bot_module = _get_bot_module()
+    for module in _TRANSPORT_MODULES.get(transport_type, []):
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            # pipecat raises a plain Exception for missing optional dependencies
+            logger.warning(f"Couldn't preload {module}: {e}")
+    logger.info(
+        f"Loaded bot module {bot_module.__name__} and {transport_type} transport "
+        f"in {time.monotonic() - start_time:.2f}s"
+    )
+
 
+def _find_bot_module():
+    """Find the bot module from the calling script."""
     # Get the main module (the file that was executed)
     main_module = sys.modules["__main__"]
 
@@ -162,6 +240,21 @@ def _get_bot_module():
     )
 
 
+def _prepare_session(bot_module) -> Optional[str]:
+    """Have the bot start building a session's services, if it can.
+
+    Called as an offer arrives, so the bot's optional ``prepare(key)`` builds
+    the services (and opens their connections) while the peer connection is
+    negotiated. The session takes them back by the key this returns; the bot
+    releases them itself if that never happens.
+    """
+    prepare = getattr(bot_module, "prepare", None)
+    if not prepare:
+        return None
+    key = uuid.uuid4().hex
+    return key if prepare(key) else None
+
+
 async def _run_telephony_bot(transport_type: str, websocket: WebSocket, call_info):
     """Run a bot for telephony transports."""
     bot_module = _get_bot_module()
@@ -177,8 +270,17 @@ async def _run_telephony_bot(transport_type: str, websocket: WebSocket, call_inf
     await bot_module.bot(session_args)
 
 
-def _create_server_app(transport_type: str, host: str = "localhost", proxy: str = None):
-    """Create FastAPI app with transport-specific routes."""
+def _create_server_app(
+    transport_type: str,
+    host: str = "localhost",
+    proxy: str = None,
+    worker_pool: Optional[WorkerPool] = None,
+):
+    """Create FastAPI app with transport-specific routes.
+
+    With a worker_pool, Daily and WebRTC sessions run in the pool's worker
+    processes; telephony sessions always run in this process.
+    """
     app = FastAPI()
 
     app.add_middleware(
@@ -217,6 +319,11 @@ def _create_server_app(transport_type: str, host: str = "localhost", proxy: str
             """Handle WebRTC offer requests and manage peer connections."""
             pc_id = request.get("pc_id")
 
+            if worker_pool and pc_id not in pcs_map:
+                answer = await worker_pool.offer(request)
+                if answer is not None:
+                    return answer
+
             if pc_id and pc_id in pcs_map:
                 pipecat_connection = pcs_map[pc_id]
                 logger.info(f"Reusing existing connection for pc_id: {pc_id}")
@@ -226,6 +333,9 @@ def _create_server_app(transport_type: str, host: str = "localhost", proxy: str
                     restart_pc=request.get("restart_pc", False),
                 )
             else:
+                bot_module = _get_bot_module()
+                prepared_key = _prepare_session(bot_module)
+
                 pipecat_connection = SmallWebRTCConnection()
                 await pipecat_connection.initialize(
                     sdp=request["sdp"], type=request["type"]
@@ -239,11 +349,10 @@ def _create_server_app(transport_type: str, host: str = "localhost", proxy: str
                     )
                     pcs_map.pop(webrtc_connection.pc_id, None)
 
-                bot_module = _get_bot_module()
-
                 session_args = SmallWebRTCSessionArguments(
                     webrtc_connection=pipecat_connection,
                     session_id=None,
+                    prepared_key=prepared_key,
                 )
                 background_tasks.add_task(bot_module.bot, session_args)
 
@@ -287,11 +396,15 @@ def _create_server_app(transport_type: str, host: str = "localhost", proxy: str
                 room_url, token = await configure(session)
 
                 # Start the bot in the background to join the room
-                bot_module = _get_bot_module()
-                session_args = DailySessionArguments(
-                    room_url=room_url, token=token, body={}, session_id=None
-                )
-                asyncio.create_task(bot_module.bot(session_args))
+                if not (
+                    worker_pool
+                    and await worker_pool.start_daily_session(room_url, token, {})
+                ):
+                    bot_module = _get_bot_module()
+                    session_args = DailySessionArguments(
+                        room_url=room_url, token=token, body={}, session_id=None
+                    )
+                    asyncio.create_task(bot_module.bot(session_args))
                 return RedirectResponse(room_url)
 
         elif transport_type == "webrtc":
@@ -299,6 +412,36 @@ def _create_server_app(transport_type: str, host: str = "localhost", proxy: str
         else:
             return {"status": f"Bot started with {transport_type}"}
 
+    if LOOP_MONITOR:
+
+        @app.get("/metrics/loop")
+        async def loop_metrics():
+            """Return the event loop lag histogram and the most recent stalls."""
+            return {
+                **LOOP_MONITOR.stats(),
+                "recent_stalls": LOOP_MONITOR.recent_stalls(),
+            }
+
+    if worker_pool:
+
+        @app.get("/metrics/workers")
+        async def worker_metrics():
+            """Return the bot workers and how many sessions each is running."""
+            return worker_pool.stats()
+
+        # Start the workers with the app, and stop them after the
+        # transport-specific cleanup
+        app_lifespan = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan_with_workers(app: FastAPI):
+            await worker_pool.start()
+            async with app_lifespan(app):
+                yield
+            await worker_pool.stop()
+
+        app.router.lifespan_context = lifespan_with_workers
+
     @app.post("/connect")
     async def rtvi_connect():
         """Launch a bot and return connection info for RTVI clients."""
@@ -312,11 +455,15 @@ def _create_server_app(transport_type: str, host: str = "localhost", proxy: str
                 room_url, token = await configure(session)
 
                 # Start the bot in the background
-                bot_module = _get_bot_module()
-                session_args = DailySessionArguments(
-                    room_url=room_url, token=token, body={}, session_id=None
-                )
-                asyncio.create_task(bot_module.bot(session_args))
+                if not (
+                    worker_pool
+                    and await worker_pool.start_daily_session(room_url, token, {})
+                ):
+                    bot_module = _get_bot_module()
+                    session_args = DailySessionArguments(
+                        room_url=room_url, token=token, body={}, session_id=None
+                    )
+                    asyncio.create_task(bot_module.bot(session_args))
                 return {"room_url": room_url, "token": token}
 
         else:
@@ -339,6 +486,8 @@ def main():
         --port: Server port (default: 7860)
         -t/--transport: Transport type (daily, webrtc, twilio, telnyx, plivo)
         -x/--proxy: Public proxy hostname for telephony webhooks
+        -w/--workers: Run Daily and WebRTC sessions in this many worker processes
+        --recycle-after: Replace each worker after this many sessions
         -v/--verbose: Increase logging verbosity
 
     The bot file must contain a `bot(session_args)` function as the entry point.
@@ -357,6 +506,19 @@ def main():
         help="Transport type",
     )
     parser.add_argument("--proxy", "-x", help="Public proxy host name")
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=0,
+        help="Number of warm worker processes to run sessions in (0 to run in-process)",
+    )
+    parser.add_argument(
+        "--recycle-after",
+        type=int,
+        default=0,
+        help="Replace a worker after it has run this many sessions (0 to never)",
+    )
     parser.add_argument(
         "--verbose", "-v", action="count", default=0, help="Increase logging verbosity"
     )
@@ -379,8 +541,20 @@ def main():
         print("   Open this URL in your browser to start a session!")
         print()
 
+    # Find the bot and import its dependencies before accepting any sessions
+    _preload(args.transport)
+
+    worker_pool = None
+    if args.workers and args.transport in ["daily", "webrtc"]:
+        worker_pool = WorkerPool(args.workers, args.transport, args.recycle_after)
+    elif args.workers:
+        logger.warning(
+            f"{args.transport} sessions can't be handed to worker processes, "
+            "running them in-process"
+        )
+
     # Create the app with transport-specific setup
-    app = _create_server_app(args.transport, args.host, args.proxy)
+    app = _create_server_app(args.transport, args.host, args.proxy, worker_pool)
 
     # Run the server
     uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,368 @@
+#
+# Copyright (c) 2025, Daily
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""Pool of pre-spawned worker processes that run bot sessions.
+
+By default the development server runs every bot as a task in its own process,
+so all sessions share one GIL and one event loop. With a WorkerPool, the server
+keeps a number of worker processes running instead. Each worker has already
+imported the bot and its transport, and called the bot module's optional
+``warm()`` function to load its models. New sessions go to the worker with
+the fewest active sessions.
+
+Only the data needed to start a session is sent to a worker, so only some
+transports can be dispatched:
+
+- Daily: the room URL and token; the worker joins the room itself.
+- WebRTC: the SDP offer; the worker creates the peer connection and the answer
+  is returned to the client. Renegotiations for a pc_id go to the worker that
+  owns it.
+
+Telephony sessions arrive on a websocket that belongs to the server process,
+and can't be handed over, so they always run in-process. So do sessions that
+arrive while no worker is ready.
+
+Workers can be recycled after a number of sessions. A replacement is spawned
+straight away, and the old worker exits once its last session has ended.
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+
+def _worker_main(conn, transport_type: str):
+    """Entry point of a worker process."""
+    # The server shuts workers down itself; don't let Ctrl+C race it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from lib import cloud
+
+    cloud._preload(transport_type)
+    bot_module = cloud._get_bot_module()
+    warm = getattr(bot_module, "warm", None)
+    if warm:
+        warm()
+
+    asyncio.run(_WorkerSessions(conn, bot_module).serve())
+
+
+class _WorkerSessions:
+    """Runs the sessions the server dispatches to a worker process."""
+
+    def __init__(self, conn, bot_module):
+        self._conn = conn
+        self._bot_module = bot_module
+        self._connections = {}
+        self._tasks = set()
+
+    def _receive(self, messages: asyncio.Queue):
+        try:
+            messages.put_nowait(self._conn.recv())
+        except (EOFError, OSError):
+            # The server went away
+            asyncio.get_running_loop().remove_reader(self._conn.fileno())
+            messages.put_nowait(("stop", None, None))
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        loop.add_reader(self._conn.fileno(), self._receive, messages)
+        self._conn.send(("ready", None, os.getpid()))
+
+        handlers = {"daily": self._start_daily, "offer": self._offer}
+        while True:
+            kind, request_id, payload = await messages.get()
+            if kind == "stop":
+                break
+            try:
+                self._conn.send(("result", request_id, await handlers[kind](payload)))
+            except Exception as e:
+                logger.exception(f"Worker {os.getpid()} couldn't handle {kind}")
+                self._conn.send(("error", request_id, str(e)))
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*[pc.disconnect() for pc in self._connections.values()])
+
+    def _run_session(self, session: int, session_args):
+        def session_ended(task: asyncio.Task):
+            self._tasks.discard(task)
+            if not task.cancelled() and task.exception():
+                logger.error(f"Session {session} failed: {task.exception()}")
+            try:
+                self._conn.send(("ended", None, session))
+            except OSError:
+                pass
+
+        task = asyncio.create_task(self._bot_module.bot(session_args))
+        task.add_done_callback(session_ended)
+        self._tasks.add(task)
+
+    async def _start_daily(self, payload: dict):
+        from pipecatcloud.agent import DailySessionArguments
+
+        session_args = DailySessionArguments(
+            room_url=payload["room_url"],
+            token=payload["token"],
+            body=payload["body"],
+            session_id=None,
+        )
+        self._run_session(payload["session"], session_args)
+
+    async def _offer(self, payload: dict) -> dict:
+        from pipecat.transports.network.webrtc_connection import SmallWebRTCConnection
+
+        from lib.cloud import SmallWebRTCSessionArguments, _prepare_session
+
+        request = payload["request"]
+        pc_id = request.get("pc_id")
+        if pc_id and pc_id in self._connections:
+            connection = self._connections[pc_id]
+            await connection.renegotiate(
+                sdp=request["sdp"],
+                type=request["type"],
+                restart_pc=request.get("restart_pc", False),
+            )
+        else:
+            prepared_key = _prepare_session(self._bot_module)
+            connection = SmallWebRTCConnection()
+            await connection.initialize(sdp=request["sdp"], type=request["type"])
+
+            @connection.event_handler("closed")
+            async def handle_disconnected(webrtc_connection: SmallWebRTCConnection):
+                self._connections.pop(webrtc_connection.pc_id, None)
+
+            session_args = SmallWebRTCSessionArguments(
+                webrtc_connection=connection,
+                session_id=None,
+                prepared_key=prepared_key,
+            )
+            self._run_session(payload["session"], session_args)
+
+        answer = connection.get_answer()
+        self._connections[answer["pc_id"]] = connection
+        return answer
+
+
+@dataclass
+class _Worker:
+    process: multiprocessing.Process
+    conn: object
+    ready: bool = False
+    retiring: bool = False
+    served: int = 0
+    # Active session -> its WebRTC pc_id, if any
+    sessions: Dict[int, Optional[str]] = field(default_factory=dict)
+    pending: Dict[int, asyncio.Future] = field(default_factory=dict)
+
+
+class WorkerPool:
+    """Dispatches bot sessions to a pool of warm worker processes.
+
+    Args:
+        size: Number of worker processes to keep running.
+        transport_type: The transport the server was started with.
+        recycle_after: Replace a worker after it has been given this many
+            sessions (0 to never recycle).
+        request_timeout_secs: How long to wait for a worker to accept a session.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        transport_type: str,
+        recycle_after: int = 0,
+        request_timeout_secs: float = 30.0,
+    ):
+        self.size = size
+        self.transport_type = transport_type
+        self.recycle_after = recycle_after
+        self.request_timeout_secs = request_timeout_secs
+        # Workers are spawned rather than forked, so they don't inherit the
+        # server's event loop and threads
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[_Worker] = []
+        self._pcs: Dict[str, _Worker] = {}
+        self._ids = itertools.count()
+        self._loop = None
+        self._stopping = False
+        self._recycled = 0
+        self._fallbacks = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        for _ in range(self.size):
+            self._spawn()
+        logger.info(f"Starting {self.size} bot workers")
+
+    async def stop(self):
+        self._stopping = True
+        for worker in self._workers:
+            try:
+                worker.conn.send(("stop", None, None))
+            except OSError:
+                pass
+        for worker in list(self._workers):
+            await self._loop.run_in_executor(None, worker.process.join, 5.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.transport_type),
+            name="bot-worker",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process=process, conn=parent_conn)
+        self._workers.append(worker)
+        self._loop.add_reader(parent_conn.fileno(), self._receive, worker)
+
+    def _receive(self, worker: _Worker):
+        try:
+            kind, request_id, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            self._exited(worker)
+            return
+
+        if kind == "ready":
+            worker.ready = True
+            logger.info(f"Bot worker {payload} is ready")
+        elif kind == "ended":
+            pc_id = worker.sessions.pop(payload, None)
+            self._pcs.pop(pc_id, None)
+            self._stop_if_retired(worker)
+        else:
+            future = worker.pending.pop(request_id, None)
+            if future and not future.done():
+                if kind == "result":
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(payload))
+
+    def _exited(self, worker: _Worker):
+        self._loop.remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        self._workers.remove(worker)
+        for pc_id in worker.sessions.values():
+            self._pcs.pop(pc_id, None)
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError("Bot worker exited"))
+
+        if worker.retiring or self._stopping:
+            logger.info(f"Bot worker {worker.process.pid} stopped")
+            return
+        logger.error(
+            f"Bot worker {worker.process.pid} exited unexpectedly with "
+            f"{len(worker.sessions)} active sessions, replacing it"
+        )
+        self._spawn()
+
+    def _retire(self, worker: _Worker):
+        logger.info(
+            f"Recycling bot worker {worker.process.pid} after {worker.served} sessions"
+        )
+        worker.retiring = True
+        self._recycled += 1
+        self._spawn()
+        self._stop_if_retired(worker)
+
+    def _stop_if_retired(self, worker: _Worker):
+        if worker.retiring and not worker.sessions:
+            worker.conn.send(("stop", None, None))
+
+    def _least_loaded(self) -> Optional[_Worker]:
+        workers = [w for w in self._workers if w.ready and not w.retiring]
+        return min(workers, key=lambda w: len(w.sessions), default=None)
+
+    async def _request(self, worker: _Worker, kind: str, payload: dict):
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        worker.pending[request_id] = future
+        worker.conn.send((kind, request_id, payload))
+        try:
+            return await asyncio.wait_for(future, self.request_timeout_secs)
+        finally:
+            worker.pending.pop(request_id, None)
+
+    async def _dispatch(self, kind: str, payload: dict):
+        """Start a session on the least loaded worker.
+
+        Returns:
+            (worker, session, result), or None if no worker is ready.
+        """
+        worker = self._least_loaded()
+        if worker is None:
+            self._fallbacks += 1
+            logger.warning("No bot worker is ready, running the session in-process")
+            return None
+
+        session = next(self._ids)
+        worker.sessions[session] = None
+        worker.served += 1
+        if self.recycle_after and worker.served >= self.recycle_after:
+            self._retire(worker)
+        try:
+            result = await self._request(worker, kind, {**payload, "session": session})
+        except Exception:
+            worker.sessions.pop(session, None)
+            self._stop_if_retired(worker)
+            raise
+        return worker, session, result
+
+    async def start_daily_session(self, room_url: str, token: str, body: dict) -> bool:
+        """Have a worker join a Daily room. Returns False if none is ready."""
+        payload = {"room_url": room_url, "token": token, "body": body}
+        return await self._dispatch("daily", payload) is not None
+
+    async def offer(self, request: dict) -> Optional[dict]:
+        """Handle a WebRTC offer in a worker.
+
+        Returns:
+            The SDP answer, or None if no worker is ready.
+        """
+        worker = self._pcs.get(request.get("pc_id"))
+        if worker:
+            logger.info(f"Renegotiating pc_id {request['pc_id']} in its worker")
+            return await self._request(worker, "offer", {"request": request})
+
+        dispatched = await self._dispatch("offer", {"request": request})
+        if dispatched is None:
+            return None
+        worker, session, answer = dispatched
+        # The session may already have ended
+        if session in worker.sessions:
+            worker.sessions[session] = answer["pc_id"]
+            self._pcs[answer["pc_id"]] = worker
+        return answer
+
+    def stats(self) -> dict:
+        return {
+            "workers": [
+                {
+                    "pid": worker.process.pid,
+                    "ready": worker.ready,
+                    "retiring": worker.retiring,
+                    "sessions": len(worker.sessions),
+                    "served": worker.served,
+                }
+                for worker in self._workers
+            ],
+            "recycled": self._recycled,
+            "in_process_fallbacks": self._fallbacks,
+        }
@@ -1,12 +1,31 @@
 import asyncio
+import os
+import threading
+import time
+from collections import deque
 from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
 
 from loguru import logger
-from pipecat.frames.frames import Frame, TextFrame, TTSSpeakFrame
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    InterruptionFrame,
+    StartFrame,
+    TextFrame,
+    TTSSpeakFrame,
+)
 from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 from pipecat.processors.frameworks.rtvi import RTVIServerMessageFrame
 from strands import Agent, tool
-from strands.models import BedrockModel
+
+from agent_executor import (
+    AgentExecutor,
+    AgentRunRejected,
+    InterruptionStats,
+    RunCancellableBedrockModel,
+)
 
 
 @dataclass
@@ -18,11 +37,231 @@ class StrandsThinkingTextFrame:
     text: str
 
 
+# Agent runs in this process, completed and interrupted
+INTERRUPTIONS = InterruptionStats()
+
+_agent_executor = None
+
+
+def agent_executor() -> AgentExecutor:
+    """Return the process-wide AgentExecutor, configured from the environment"""
+    global _agent_executor
+    if _agent_executor is None:
+        _agent_executor = AgentExecutor(
+            max_workers=int(os.getenv("STRANDS_AGENT_WORKERS", "4")),
+            max_queued=int(os.getenv("STRANDS_AGENT_MAX_QUEUED", "16")),
+            timeout_secs=float(os.getenv("STRANDS_AGENT_TIMEOUT_SECS", "60")),
+        )
+    return _agent_executor
+
+
+class ThinkingBridge:
+    """Carries the agent's streamed text from its thread to the pipeline, in batches.
+
+    The Strands callback handler runs on the agent's executor thread, once for
+    every streamed token. put() adds the text to a buffer under a lock, and only
+    wakes the event loop when the buffer stops being empty or has a batch's
+    worth of text. run(), on the loop, sends what's buffered as one message
+    once max_delay_secs have passed since its first text, max_batch_chars are
+    waiting, or the model's message has ended. Batches break between words,
+    since the console joins consecutive thinking messages with a space.
+
+    The buffer holds up to max_buffered_chars. While it's full, put() holds up
+    the agent's thread, for up to max_block_secs, after which the text is
+    dropped rather than stall the agent for good.
+
+    Args:
+        send: Sends a batch of text; awaited on the event loop.
+        max_delay_secs: The longest text waits for more to batch with.
+        max_batch_chars: The most text in one batch.
+        max_buffered_chars: The most text waiting to be sent.
+        max_block_secs: The longest put() waits for room.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        max_delay_secs: float = 0.25,
+        max_batch_chars: int = 500,
+        max_buffered_chars: int = 8000,
+        max_block_secs: float = 1.0,
+    ):
+        self.max_delay_secs = max_delay_secs
+        self.max_batch_chars = max_batch_chars
+        self.max_buffered_chars = max_buffered_chars
+        self.max_block_secs = max_block_secs
+        self._send = send
+        self._lock = threading.Condition()
+        self._chunks = []
+        self._size = 0
+        self._first_at = None
+        self._message_ended = False
+        # Only an unfinished word is buffered, so there's nothing to send yet
+        self._unfinished_word = False
+        self._loop = None
+        self._loop_thread = None
+        self._wake = asyncio.Event()
+        self._events = 0
+        self._chars = 0
+        self._batches = 0
+        self._dropped_chars = 0
+        self._blocked_secs = 0.0
+        self._max_buffered = 0
+        self._delays = deque(maxlen=1000)
+
+    def put(self, text: str):
+        """Buffer text for the next batch. Thread-safe."""
+        with self._lock:
+            self._events += 1
+            blocked_at = None
+            while self._size and self._size + len(text) > self.max_buffered_chars:
+                now = time.monotonic()
+                blocked_at = blocked_at or now
+                remaining = blocked_at + self.max_block_secs - now
+                # Never block the loop thread, which is the one that makes room
+                if remaining <= 0 or self._on_loop_thread():
+                    self._dropped_chars += len(text)
+                    self._blocked_secs += now - blocked_at
+                    return
+                self._lock.wait(remaining)
+            if blocked_at:
+                self._blocked_secs += time.monotonic() - blocked_at
+
+            was_empty = not self._size or self._unfinished_word
+            was_short = self._size < self.max_batch_chars
+            self._unfinished_word = False
+            self._chunks.append(text)
+            self._size += len(text)
+            self._chars += len(text)
+            self._max_buffered = max(self._max_buffered, self._size)
+            if was_empty:
+                self._first_at = time.monotonic()
+        if was_empty or (was_short and self._size >= self.max_batch_chars):
+            self._wake_loop()
+
+    def end_message(self):
+        """Send what's buffered now; the model's message has ended. Thread-safe."""
+        with self._lock:
+            if not self._size:
+                return
+            self._message_ended = True
+        self._wake_loop()
+
+    def clear(self):
+        """Drop what's buffered, e.g. because its agent run was cancelled"""
+        with self._lock:
+            self._dropped_chars += self._size
+            self._take_all()
+
+    def _on_loop_thread(self) -> bool:
+        return self._loop_thread == threading.get_ident()
+
+    def _wake_loop(self):
+        if self._loop is None:
+            # run() checks the buffer when it starts
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            # The loop has closed
+            pass
+
+    def _take_all(self) -> str:
+        text = "".join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        self._first_at = None
+        self._message_ended = False
+        self._unfinished_word = False
+        self._lock.notify_all()
+        return text
+
+    def _take_batch(self) -> str:
+        with self._lock:
+            first_at = self._first_at
+            message_ended = self._message_ended
+            text = self._take_all()
+            batch, rest = text[: self.max_batch_chars], text[self.max_batch_chars :]
+            if rest or not message_ended:
+                cut = batch.rfind(" ")
+                if cut > 0:
+                    batch, rest = batch[:cut], batch[cut:] + rest
+                elif not rest:
+                    # A single unfinished word; wait for the rest of it
+                    batch, rest = "", batch
+                    self._unfinished_word = True
+            if rest:
+                self._chunks.append(rest)
+                self._size = len(rest)
+                self._first_at = time.monotonic()
+                self._message_ended = message_ended
+        if batch:
+            self._delays.append(time.monotonic() - first_at)
+        return batch.strip()
+
+    def _ready(self) -> Optional[float]:
+        """0 if a batch should be sent now, else how long to wait for one"""
+        with self._lock:
+            if not self._size or (self._unfinished_word and not self._message_ended):
+                return None
+            if self._message_ended or self._size >= self.max_batch_chars:
+                return 0
+            return max(0.0, self._first_at + self.max_delay_secs - time.monotonic())
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        while True:
+            wait_secs = self._ready()
+            if wait_secs is None:
+                await self._wake.wait()
+                self._wake.clear()
+            elif wait_secs > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait_secs)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+            else:
+                # Leaves an unfinished word for the next batch
+                batch = self._take_batch()
+                if batch:
+                    self._batches += 1
+                    await self._send(batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            delays = sorted(self._delays) or [0.0]
+            return {
+                "events": self._events,
+                "chars": self._chars,
+                "batches": self._batches,
+                "events_per_batch": self._events / max(1, self._batches),
+                "dropped_chars": self._dropped_chars,
+                "blocked_secs": self._blocked_secs,
+                "buffered_chars": self._size,
+                "max_buffered_chars": self._max_buffered,
+                "delay_p50": delays[len(delays) // 2],
+                "delay_max": delays[-1],
+            }
+
+
 class StrandsAgentProcessor(FrameProcessor):
-    def __init__(self):
+    """Answers StrandsAgentRequestFrames with a Strands agent.
+
+    Agent runs happen on an AgentExecutor in the background, one at a time,
+    while other frames keep flowing. An interruption, or the end of the
+    pipeline, cancels the current run and any waiting ones.
+    """
+
+    def __init__(self, executor: Optional[AgentExecutor] = None):
         super().__init__()
+        self._executor = executor or agent_executor()
+        # The agent keeps the conversation, so its runs take turns
+        self._agent_lock = asyncio.Lock()
+        self._runs = set()
         self.agent = Agent(
-            model=BedrockModel(
+            model=RunCancellableBedrockModel(
                 model_id="us.anthropic.claude-3-7-sonnet-20250219-v1:0",
                 max_tokens=64000,
             ),
@@ -43,30 +282,90 @@ class StrandsAgentProcessor(FrameProcessor):
             """,
             callback_handler=self.strands_callback_handler,
         )
-        self._next_strands_message_is_last = False
-        self._strands_messages_queue = asyncio.Queue()
-        asyncio.create_task(self.process_strands_messages())
+        self._thinking = ThinkingBridge(self.send_thinking)
+        self._thinking_task = None
+        # The text of the model's latest message, held back from the thinking
+        # messages until a tool call or another message shows it isn't the
+        # final answer, which is sent as "specialist-talking" instead
+        self._held_message = []
 
     async def process_frame(self, frame: Frame, direction: FrameDirection):
         await super().process_frame(frame, direction)
-        if isinstance(frame, StrandsAgentRequestFrame):
+        if isinstance(frame, StartFrame):
+            await self.push_frame(frame, direction)
+            self._thinking_task = self.create_task(self._thinking.run())
+        elif isinstance(frame, StrandsAgentRequestFrame):
             logger.debug(f"!!! got a request frame: {frame}")
-            loop = asyncio.get_running_loop()
-            result = await loop.run_in_executor(None, self.agent, frame.text)
-            logger.info(f"!!! agent result: {result}")
-            await self.push_frame(
-                RTVIServerMessageFrame(
-                    data={
-                        "type": "specialist-talking",
-                        "message": result.message["content"][0]["text"],
-                    }
-                )
-            )
-            await self.push_frame(TTSSpeakFrame(result.message["content"][0]["text"]))
-
+            task = self.create_task(self._run_agent(frame.text))
+            self._runs.add(task)
+            task.add_done_callback(self._runs.discard)
+        elif isinstance(frame, (InterruptionFrame, EndFrame, CancelFrame)):
+            await self.cancel_runs()
+            if not isinstance(frame, InterruptionFrame) and self._thinking_task:
+                logger.info(f"Specialist thinking: {self._thinking.stats()}")
+                await self.cancel_task(self._thinking_task)
+                self._thinking_task = None
+            await self.push_frame(frame, direction)
         else:
             await self.push_frame(frame, direction)
 
+    async def cancel_runs(self):
+        """Cancel the current agent run, and any that are waiting for it"""
+        for task in list(self._runs):
+            logger.debug("!!! cancelling agent run")
+            await self.cancel_task(task)
+        self._thinking.clear()
+
+    def _call_agent(self, prompt: str, cancel_signal: threading.Event):
+        # On an executor thread. A cancelled run stops streaming from Bedrock,
+        # and makes no more model or tool calls.
+        self._held_message = []
+        result = self.agent(
+            prompt,
+            cancel_signal=cancel_signal,
+            invocation_state={"run_cancel_signal": cancel_signal},
+        )
+        invocation = self.agent.event_loop_metrics.latest_agent_invocation
+        INTERRUPTIONS.record_run(
+            invocation.usage["outputTokens"] if invocation else 0,
+            # A response cut off before Strands saw the signal ends normally
+            interrupted=result.stop_reason == "cancelled" or cancel_signal.is_set(),
+        )
+        return result
+
+    async def _run_agent(self, prompt: str):
+        async with self._agent_lock:
+            cancel_signal = threading.Event()
+            try:
+                result = await self._executor.run(
+                    self._call_agent, prompt, cancel_signal, cancel_signal=cancel_signal
+                )
+            except AgentRunRejected as e:
+                logger.warning(f"!!! agent run rejected: {e}")
+                await self.push_frame(
+                    TTSSpeakFrame("Sorry, the specialist is busy. Please ask again.")
+                )
+                return
+            except asyncio.TimeoutError:
+                logger.warning(f"!!! agent run timed out: {prompt}")
+                await self.push_frame(
+                    TTSSpeakFrame("Sorry, the specialist couldn't find an answer.")
+                )
+                return
+
+        logger.info(f"!!! agent result: {result}")
+        if result is None or result.stop_reason == "cancelled":
+            return
+        await self.push_frame(
+            RTVIServerMessageFrame(
+                data={
+                    "type": "specialist-talking",
+                    "message": result.message["content"][0]["text"],
+                }
+            )
+        )
+        await self.push_frame(TTSSpeakFrame(result.message["content"][0]["text"]))
+
     @tool
     def get_location_name_from_landmark(self, landmark: str) -> str:
         """
@@ -103,37 +402,31 @@ class StrandsAgentProcessor(FrameProcessor):
 
     def strands_callback_handler(self, **kwargs):
         """
-        Handle events from the Strands agent.
+        Handle events from the Strands agent. Called on the agent's thread, for
+        every streamed token.
         """
-        logger.debug(f"Strands callback handler: {kwargs}")
-
-        if "event" in kwargs:
+        if "data" in kwargs:
+            self._held_message.append(kwargs["data"])
+        elif "current_tool_use" in kwargs:
+            self._send_held_message()
+        elif "event" in kwargs:
             event_obj = kwargs["event"]
-            if event_obj and "messageStop" in event_obj:
-                message_stop = event_obj["messageStop"]
-                if message_stop and "stopReason" in message_stop:
-                    stop_reason = message_stop["stopReason"]
-                    if stop_reason == "end_turn":
-                        self._next_strands_message_is_last = True
-        elif "message" in kwargs:
-            message_obj = kwargs["message"]
-            if message_obj and "content" in message_obj and "role" in message_obj:
-                role = message_obj["role"]
-                content = message_obj["content"]
-                if role == "assistant" and isinstance(content, list):
-                    for content_obj in content:
-                        if isinstance(content_obj, dict) and "text" in content_obj:
-                            message = content_obj["text"]
-                            if not self._next_strands_message_is_last:
-                                self._strands_messages_queue.put_nowait(message)
-
-    async def process_strands_messages(self):
-        while True:
-            message = await self._strands_messages_queue.get()
-            # await self.push_frame(StrandsThinkingTextFrame(message))
-            await self.push_frame(
-                RTVIServerMessageFrame(
-                    data={"type": "specialist-thinking", "message": message}
-                )
+            if event_obj and "messageStart" in event_obj:
+                self._send_held_message()
+
+    def _send_held_message(self):
+        # The held message led to a tool call or another message, so it was
+        # the agent thinking aloud
+        if not self._held_message:
+            return
+        self._thinking.put("".join(self._held_message))
+        self._held_message = []
+        self._thinking.end_message()
+
+    async def send_thinking(self, message: str):
+        # await self.push_frame(StrandsThinkingTextFrame(message))
+        await self.push_frame(
+            RTVIServerMessageFrame(
+                data={"type": "specialist-thinking", "message": message}
             )
-            self._strands_messages_queue.task_done()
+        )
@@ -1,50 +1,315 @@
 import asyncio
+import time
+from collections import deque
+from typing import List, Optional
 
 from loguru import logger
 from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
     Frame,
+    InterruptionFrame,
     LLMFullResponseEndFrame,
     LLMFullResponseStartFrame,
+    OutputAudioRawFrame,
+    StartFrame,
+    SystemFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    TTSTextFrame,
 )
 
 # Import for the OpenAILLMContextFrame used in GreetingProcessor
 from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 
+# Where a queued frame sits in its speaker's utterance
+_UTTERANCE_START = "start"
+_UTTERANCE_END = "end"
 
-class TTSLockAcquireProcessor(FrameProcessor):
-    """FrameProcessor that acquires a lock when it sees a LLMFullResponseStartFrame."""
 
-    def __init__(self, lock: asyncio.Lock):
-        super().__init__()
-        self._lock = lock
+class OutputArbiter:
+    """Takes turns between several TTS branches that share one output.
 
-    async def process_frame(self, frame: Frame, direction: FrameDirection):
-        await super().process_frame(frame, direction)
+    Each branch ends in a SpeakerGate (see speaker()), which queues the
+    branch's utterances rather than blocking it. An utterance is an LLM
+    response (LLMFullResponseStartFrame to LLMFullResponseEndFrame), or a
+    single TTSStartedFrame to TTSStoppedFrame for speech that isn't one, such
+    as a TTSSpeakFrame.
+
+    One speaker at a time has the floor. When it finishes its utterance, the
+    floor goes to the highest priority speaker with an utterance waiting (the
+    one that's waited longest, between equals). Audio is released at the pace
+    it plays, lead_secs ahead, so the rest stays queued here where it can still
+    be dropped. With preemption="preempt", a higher priority speaker takes the
+    floor straight away and the rest of the current utterance is dropped; with
+    "finish" it waits.
+
+    An interruption from any branch drops every speaker's queued speech.
+
+    Args:
+        preemption: "finish" or "preempt".
+        lead_secs: How far ahead of real time audio is released to the output.
+        max_queued_secs: A speaker's branch waits while this much of its audio
+            is queued.
+    """
+
+    def __init__(
+        self,
+        preemption: str = "finish",
+        lead_secs: float = 0.25,
+        max_queued_secs: float = 30.0,
+    ):
+        if preemption not in ("finish", "preempt"):
+            raise ValueError(f"Unknown preemption policy: {preemption}")
+        self.preemption = preemption
+        self.lead_secs = lead_secs
+        self.max_queued_secs = max_queued_secs
+        self._gates: List[SpeakerGate] = []
+        self._holder: Optional[SpeakerGate] = None
+        self._waiters: List[SpeakerGate] = []
+        self._floor_changed = asyncio.Condition()
+        self._play_until = 0.0
+        self._interruptions = 0
+        self._last_interruption_id = None
 
-        # Acquire the lock when we see a LLMFullResponseStartFrame
-        if isinstance(frame, LLMFullResponseStartFrame):
-            logger.debug("!!! TTSLockAcquireProcessor: Acquiring lock")
-            await self._lock.acquire()
+    def speaker(self, name: str, priority: int = 0) -> "SpeakerGate":
+        """Create the gate to put at the end of a speaker's branch, after its TTS"""
+        gate = SpeakerGate(self, name, priority)
+        self._gates.append(gate)
+        return gate
 
-        # Always pass the frame through
-        await self.push_frame(frame, direction)
+    def _next_waiter(self) -> "SpeakerGate":
+        return max(self._waiters, key=lambda gate: gate.priority)
 
+    async def acquire(self, gate: "SpeakerGate"):
+        async with self._floor_changed:
+            self._waiters.append(gate)
+            try:
+                holder = self._holder
+                if (
+                    self.preemption == "preempt"
+                    and holder
+                    and gate.priority > holder.priority
+                ):
+                    logger.debug(f"!!! {gate.speaker} preempts {holder.speaker}")
+                    holder.preempt()
+                await self._floor_changed.wait_for(
+                    lambda: self._holder is None and self._next_waiter() is gate
+                )
+                self._holder = gate
+            finally:
+                self._waiters.remove(gate)
+                self._floor_changed.notify_all()
 
-class TTSLockReleaseProcessor(FrameProcessor):
-    """FrameProcessor that releases a lock when it sees a LLMFullResponseEndFrame."""
+    async def release(self, gate: "SpeakerGate"):
+        async with self._floor_changed:
+            if self._holder is gate:
+                self._holder = None
+                self._floor_changed.notify_all()
 
-    def __init__(self, lock: asyncio.Lock):
+    async def pace(self, duration: float):
+        """Wait until audio of this duration can be released to the output"""
+        now = time.monotonic()
+        self._play_until = max(self._play_until, now)
+        delay = self._play_until - now - self.lead_secs
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._play_until += duration
+
+    async def interrupt(self, frame: InterruptionFrame):
+        # Interruptions that go through several branches reach several gates
+        if frame.id == self._last_interruption_id:
+            return
+        self._last_interruption_id = frame.id
+        self._interruptions += 1
+        self._play_until = 0.0
+        for gate in self._gates:
+            await gate.reset()
+
+    def stats(self) -> dict:
+        return {
+            "interruptions": self._interruptions,
+            "speakers": {gate.speaker: gate.stats() for gate in self._gates},
+        }
+
+
+class SpeakerGate(FrameProcessor):
+    """Queues a TTS branch's speech until its OutputArbiter gives it the floor."""
+
+    def __init__(self, arbiter: OutputArbiter, speaker: str, priority: int):
         super().__init__()
-        self._lock = lock
+        self.speaker = speaker
+        self.priority = priority
+        self._arbiter = arbiter
+        # (frame, direction, utterance boundary, audio duration, queued at)
+        self._queue = deque()
+        self._queue_changed = asyncio.Event()
+        self._space = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Frames queued but not pushed yet, including the one being pushed
+        self._pending = 0
+        self._in_utterance = False
+        self._utterance_opener = None
+        self._preempted = False
+        self._holding = False
+        self._drain_task = None
+        self._queued_secs = 0.0
+        self._max_queued_secs = 0.0
+        self._utterances = 0
+        self._floor_waits = deque(maxlen=1000)
+        self._preemptions = 0
+        self._dropped_secs = 0.0
 
     async def process_frame(self, frame: Frame, direction: FrameDirection):
         await super().process_frame(frame, direction)
 
-        # Release the lock when we see a LLMFullResponseEndFrame
-        if isinstance(frame, LLMFullResponseEndFrame):
-            logger.debug("!!! TTSLockReleaseProcessor: Releasing lock")
-            if self._lock.locked():
-                self._lock.release()
+        if isinstance(frame, StartFrame):
+            await self.push_frame(frame, direction)
+            self._drain_task = self.create_task(self._drain())
+        elif isinstance(frame, InterruptionFrame):
+            await self._arbiter.interrupt(frame)
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, EndFrame):
+            # Let the queued speech finish first
+            await self._idle.wait()
+            await self._stop_draining()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, CancelFrame):
+            await self._stop_draining()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, SystemFrame) or direction == FrameDirection.UPSTREAM:
+            await self.push_frame(frame, direction)
+        else:
+            await self._enqueue(frame, direction)
+
+    async def _enqueue(self, frame: Frame, direction: FrameDirection):
+        duration = 0.0
+        if isinstance(frame, OutputAudioRawFrame):
+            duration = len(frame.audio) / (frame.sample_rate * frame.num_channels * 2)
+
+        boundary = None
+        if not self._in_utterance:
+            if isinstance(frame, (LLMFullResponseStartFrame, TTSStartedFrame)):
+                boundary = _UTTERANCE_START
+                self._in_utterance = True
+                self._utterance_opener = type(frame)
+            elif (
+                isinstance(frame, (OutputAudioRawFrame, TTSTextFrame))
+                and not self._holding
+            ):
+                # Speech outside an utterance is the late tail of one reset()
+                # dropped; it doesn't have the floor, so it mustn't be heard
+                self._dropped_secs += duration
+                return
+            elif not self._pending:
+                # Not part of any speech, and nothing queued ahead of it
+                await self.push_frame(frame, direction)
+                return
+        elif isinstance(frame, LLMFullResponseEndFrame) or (
+            isinstance(frame, TTSStoppedFrame)
+            and self._utterance_opener is TTSStartedFrame
+        ):
+            boundary = _UTTERANCE_END
+            self._in_utterance = False
+
+        if isinstance(frame, OutputAudioRawFrame):
+            # Bounded queue: hold this branch back while too much is queued
+            while self._queued_secs >= self._arbiter.max_queued_secs:
+                self._space.clear()
+                await self._space.wait()
+            self._queued_secs += duration
+            self._max_queued_secs = max(self._max_queued_secs, self._queued_secs)
+
+        self._queue.append((frame, direction, boundary, duration, time.monotonic()))
+        self._pending += 1
+        self._idle.clear()
+        self._queue_changed.set()
+
+    async def _drain(self):
+        dropping = False
+        while True:
+            if self._preempted and self._holding:
+                # Give up the floor now, and the rest of the utterance with it
+                self._preemptions += 1
+                await self._arbiter.release(self)
+                self._holding = False
+                dropping = True
+
+            if not self._queue:
+                self._queue_changed.clear()
+                await self._queue_changed.wait()
+                continue
+
+            frame, direction, boundary, duration, queued_at = self._queue[0]
+            if boundary == _UTTERANCE_START:
+                await self._arbiter.acquire(self)
+                self._floor_waits.append(time.monotonic() - queued_at)
+                self._utterances += 1
+                self._holding = True
+                self._preempted = False
+                dropping = False
+            self._queue.popleft()
+
+            if dropping and isinstance(frame, (OutputAudioRawFrame, TTSTextFrame)):
+                self._dropped_secs += duration
+            else:
+                if duration:
+                    await self._arbiter.pace(duration)
+                await self.push_frame(frame, direction)
+            self._queued_secs -= duration
+            self._space.set()
+
+            if boundary == _UTTERANCE_END:
+                await self._arbiter.release(self)
+                self._holding = False
+                dropping = False
+
+            self._pending -= 1
+            if not self._pending:
+                self._idle.set()
+
+    def preempt(self):
+        """Stop speaking at the next frame, and drop the rest of the utterance"""
+        self._preempted = True
+        self._queue_changed.set()
+
+    async def reset(self):
+        """Drop everything queued, e.g. because the user interrupted"""
+        if self._drain_task:
+            await self.cancel_task(self._drain_task)
+        self._dropped_secs += self._queued_secs
+        if self._queue:
+            logger.debug(
+                f"!!! {self.speaker}: dropping {self._queued_secs:.1f}s of queued audio"
+            )
+        self._queue.clear()
+        self._pending = 0
+        self._queued_secs = 0.0
+        self._in_utterance = False
+        self._preempted = False
+        self._holding = False
+        self._idle.set()
+        self._space.set()
+        await self._arbiter.release(self)
+        if self._drain_task:
+            self._drain_task = self.create_task(self._drain())
+
+    async def _stop_draining(self):
+        if self._drain_task:
+            await self.cancel_task(self._drain_task)
+            self._drain_task = None
+        await self._arbiter.release(self)
 
-        # Always pass the frame through
-        await self.push_frame(frame, direction)
+    def stats(self) -> dict:
+        waits = sorted(self._floor_waits) or [0.0]
+        return {
+            "priority": self.priority,
+            "queued_secs": self._queued_secs,
+            "max_queued_secs": self._max_queued_secs,
+            "utterances": self._utterances,
+            "floor_wait_p50": waits[len(waits) // 2],
+            "floor_wait_max": waits[-1],
+            "preemptions": self._preemptions,
+            "dropped_secs": self._dropped_secs,
+        }
@@ -0,0 +1,471 @@
+"""Per-process admission control for Bedrock calls.
+
+Every session's LLM service, the Strands agents' model and the knowledge base
+retrieves all call Bedrock, and nothing stopped them from going over the
+account's request rate together. Bedrock then throttles, and a throttled call
+became a "something went wrong" reply.
+
+BedrockLimiter gives each API and model (converse_stream to Claude, converse_stream
+to Nova, retrieve from the KB, ...) a token bucket, shared by every session in
+the process. A call waits for a token before it's sent. When several are
+waiting, calls that are part of a turn already under way go first, then the
+first call of a new turn, then a new session's first call, then speculative
+prefetches. A throttled call is retried after a pause, and the bucket's rate is
+halved; each successful call adds back a little, so the rate settles just under
+what Bedrock actually allows (additive increase, multiplicative decrease).
+
+A call waiting for a token doesn't hold a thread: the grants come from one
+scheduler thread per limiter, as futures that blocking, async and executor
+callers can all wait on.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Executor, Future, InvalidStateError
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+from pipecat.services.aws.llm import AWSBedrockLLMService
+
+from latency import percentile
+
+# Lower goes first
+PRIORITY_IN_TURN = 0
+PRIORITY_NEW_TURN = 1
+PRIORITY_NEW_SESSION = 2
+PRIORITY_SPECULATIVE = 3
+PRIORITY_NAMES = {
+    PRIORITY_IN_TURN: "in_turn",
+    PRIORITY_NEW_TURN: "new_turn",
+    PRIORITY_NEW_SESSION: "new_session",
+    PRIORITY_SPECULATIVE: "speculative",
+}
+
+_THROTTLE_CODES = {
+    "ThrottlingException",
+    "throttlingException",
+    "TooManyRequestsException",
+}
+
+
+def is_throttle(error: BaseException) -> bool:
+    """Whether error is Bedrock saying the request rate is too high"""
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in _THROTTLE_CODES
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, float]:
+    """Limits from "api=rps,api/model=rps,...", e.g. "retrieve=10,converse_stream/amazon.nova-lite-v1:0=20" """
+    limits = {}
+    for item in (spec or "").split(","):
+        if item.strip():
+            key, rps = item.rsplit("=", 1)
+            limits[key.strip()] = float(rps)
+    return limits
+
+
+class _Bucket:
+    """Token bucket for one API and model, with the calls waiting on it"""
+
+    def __init__(self, rps: float, burst: float):
+        self.max_rate = rps
+        self.rate = rps
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttle_streak = 0
+        # (priority, sequence number, queued at, future)
+        self.waiters = []
+        self.attempts = 0
+        self.throttles = 0
+        self.retries = 0
+        self.failures = 0
+        self.waits = {priority: deque(maxlen=1000) for priority in PRIORITY_NAMES}
+
+    def refill(self, now: float):
+        # Nothing accrues while the bucket is paused
+        if now > self.updated:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+    def ready(self, now: float) -> bool:
+        return now >= self.paused_until and self.tokens >= 1
+
+    def next_token_at(self, now: float) -> float:
+        start = max(now, self.updated)
+        return start + max(0.0, 1 - self.tokens) / self.rate
+
+    def stats(self) -> dict:
+        waits = {}
+        for priority, values in self.waits.items():
+            if values:
+                values = sorted(values)
+                waits[PRIORITY_NAMES[priority]] = {
+                    "count": len(values),
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "max": values[-1],
+                }
+        return {
+            "limit_rps": self.max_rate,
+            "rate_rps": self.rate,
+            "queued": len(self.waiters),
+            "attempts": self.attempts,
+            "throttles": self.throttles,
+            "retries": self.retries,
+            "failures": self.failures,
+            "queue_wait": waits,
+        }
+
+
+class BedrockLimiter:
+    """Token buckets for Bedrock calls, one per API and model.
+
+    Args:
+        default_rps: Requests per second for an API and model without a limit
+            of its own.
+        limits: Requests per second by "api" or "api/model".
+        burst_secs: Bucket size, in seconds of requests at the full rate.
+        max_attempts: Tries for a throttled call, including the first.
+        backoff_secs: How long a bucket pauses after a throttle, doubled for
+            each throttle in a row, up to max_backoff_secs.
+        min_rate_fraction: The rate never adapts below this fraction of the
+            limit.
+        recovery_secs: Each successful call raises the rate by
+            1 / recovery_secs requests per second.
+    """
+
+    def __init__(
+        self,
+        default_rps: float = 20.0,
+        limits: Optional[Dict[str, float]] = None,
+        burst_secs: float = 1.0,
+        max_attempts: int = 4,
+        backoff_secs: float = 0.25,
+        max_backoff_secs: float = 4.0,
+        min_rate_fraction: float = 0.1,
+        recovery_secs: float = 10.0,
+    ):
+        self.default_rps = default_rps
+        self.limits = dict(limits or {})
+        self.burst_secs = burst_secs
+        self.max_attempts = max_attempts
+        self.backoff_secs = backoff_secs
+        self.max_backoff_secs = max_backoff_secs
+        self.min_rate_fraction = min_rate_fraction
+        self.recovery_secs = recovery_secs
+        self._buckets: Dict[tuple, _Bucket] = {}
+        # Reentrant, because a granted future's callbacks run under it
+        self._condition = threading.Condition(threading.RLock())
+        self._sequence = itertools.count()
+        # submit()ted futures -> (api, model, sequence number), for promote()
+        self._submitted = weakref.WeakKeyDictionary()
+        self._thread = None
+
+    def _bucket(self, api: str, model: Optional[str]) -> _Bucket:
+        key = (api, model)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rps = self.limits.get(f"{api}/{model}") or self.limits.get(api)
+            rps = rps or self.default_rps
+            bucket = self._buckets[key] = _Bucket(rps, max(1.0, rps * self.burst_secs))
+        return bucket
+
+    def acquire(
+        self,
+        api: str,
+        model: Optional[str],
+        priority: int = PRIORITY_NEW_TURN,
+        sequence: Optional[int] = None,
+    ) -> Future:
+        """A future that's done, with the seconds waited, once the call may be sent.
+
+        Cancelling the future gives up the call's place in the queue.
+        """
+        future = Future()
+        with self._condition:
+            bucket = self._bucket(api, model)
+            now = time.monotonic()
+            bucket.refill(now)
+            if not bucket.waiters and bucket.ready(now):
+                bucket.tokens -= 1
+                bucket.waits[priority].append(0.0)
+                future.set_running_or_notify_cancel()
+                future.set_result(0.0)
+                return future
+
+            if sequence is None:
+                sequence = next(self._sequence)
+            heapq.heappush(bucket.waiters, (priority, sequence, now, future))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="bedrock-limiter", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def _grant(self, bucket: _Bucket, now: float):
+        bucket.refill(now)
+        while bucket.waiters and bucket.ready(now):
+            priority, _, queued_at, future = heapq.heappop(bucket.waiters)
+            # Cancelled waiters don't use a token
+            if not future.set_running_or_notify_cancel():
+                continue
+            bucket.tokens -= 1
+            wait = now - queued_at
+            bucket.waits[priority].append(wait)
+            future.set_result(wait)
+
+    def _run(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wake_at = None
+                for bucket in list(self._buckets.values()):
+                    self._grant(bucket, now)
+                    if bucket.waiters:
+                        at = bucket.next_token_at(now)
+                        wake_at = at if wake_at is None else min(wake_at, at)
+                timeout = None if wake_at is None else max(0.001, wake_at - now)
+                self._condition.wait(timeout)
+
+    def _record(self, api: str, model: Optional[str], error: Optional[BaseException]):
+        """Adapt the bucket's rate to how the call went; True if it should be retried"""
+        with self._condition:
+            bucket = self._bucket(api, model)
+            bucket.attempts += 1
+            if error is not None and not is_throttle(error):
+                return False
+            if error is None:
+                bucket.throttle_streak = 0
+                bucket.rate = min(bucket.max_rate, bucket.rate + 1 / self.recovery_secs)
+                return False
+
+            bucket.throttles += 1
+            bucket.throttle_streak += 1
+            bucket.rate = max(bucket.max_rate * self.min_rate_fraction, bucket.rate / 2)
+            pause = min(
+                self.max_backoff_secs,
+                self.backoff_secs * 2 ** (bucket.throttle_streak - 1),
+            )
+            now = time.monotonic()
+            # Jittered, so that callers throttled together don't retry together
+            bucket.paused_until = max(
+                bucket.paused_until, now + pause * random.uniform(0.5, 1.0)
+            )
+            bucket.tokens = 0.0
+            bucket.updated = bucket.paused_until
+            self._condition.notify()
+            return True
+
+    def _retry_or_fail(self, api: str, model: Optional[str], attempt: int) -> bool:
+        with self._condition:
+            bucket = self._bucket(api, model)
+            if attempt < self.max_attempts:
+                bucket.retries += 1
+                return True
+            bucket.failures += 1
+        logger.warning(f"Bedrock {api} ({model}) still throttled after {attempt} tries")
+        return False
+
+    def call(
+        self,
+        api: str,
+        model: Optional[str],
+        fn: Callable[[], Any],
+        priority: int = PRIORITY_NEW_TURN,
+    ) -> Any:
+        """Run fn() once admitted, blocking this thread, retrying if it's throttled"""
+        sequence = next(self._sequence)
+        for attempt in itertools.count(1):
+            self.acquire(api, model, priority, sequence).result()
+            try:
+                result = fn()
+            except Exception as e:
+                if self._record(api, model, e) and self._retry_or_fail(
+                    api, model, attempt
+                ):
+                    continue
+                raise
+            self._record(api, model, None)
+            return result
+
+    async def call_async(
+        self,
+        api: str,
+        model: Optional[str],
+        fn: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_NEW_TURN,
+    ) -> Any:
+        """Await fn() once admitted, retrying if it's throttled"""
+        sequence = next(self._sequence)
+        for attempt in itertools.count(1):
+            await asyncio.wrap_future(self.acquire(api, model, priority, sequence))
+            try:
+                result = await fn()
+            except Exception as e:
+                if self._record(api, model, e) and self._retry_or_fail(
+                    api, model, attempt
+                ):
+                    continue
+                raise
+            self._record(api, model, None)
+            return result
+
+    def submit(
+        self,
+        executor: Executor,
+        api: str,
+        model: Optional[str],
+        fn: Callable[[], Any],
+        priority: int = PRIORITY_NEW_TURN,
+    ) -> Future:
+        """Run fn() on executor once admitted, retrying if it's throttled.
+
+        No executor thread is held while the call waits. Cancelling the
+        returned future keeps fn() from running again, whether it's waiting
+        for its first try or to retry after being throttled; a try that's
+        already running finishes, but its result is dropped.
+        """
+        outer = Future()
+        sequence = next(self._sequence)
+
+        def settle(settle_outer: Callable[[], None]):
+            # The caller may cancel outer at any point, as it never runs
+            try:
+                settle_outer()
+            except InvalidStateError:
+                pass
+
+        def run(attempt: int):
+            if outer.cancelled():
+                return
+            try:
+                result = fn()
+            except Exception as e:
+                if self._record(api, model, e) and self._retry_or_fail(
+                    api, model, attempt
+                ):
+                    admit(attempt + 1)
+                else:
+                    settle(lambda: outer.set_exception(e))
+                return
+            self._record(api, model, None)
+            settle(lambda: outer.set_result(result))
+
+        def admit(attempt: int):
+            grant = self.acquire(api, model, priority, sequence)
+            # Gives up the grant's place in the queue, for a retry as much as
+            # for the first try
+            outer.add_done_callback(lambda f: f.cancelled() and grant.cancel())
+            grant.add_done_callback(
+                lambda g: g.cancelled()
+                or outer.cancelled()
+                or executor.submit(run, attempt)
+            )
+
+        with self._condition:
+            self._submitted[outer] = (api, model, sequence)
+        admit(1)
+        return outer
+
+    def promote(self, future: Future, priority: int):
+        """Move a submit()ted call that's still waiting up to priority"""
+        with self._condition:
+            entry = self._submitted.get(future)
+            if entry is None:
+                return
+            api, model, sequence = entry
+            waiters = self._buckets[(api, model)].waiters
+            for index, waiter in enumerate(waiters):
+                if waiter[1] == sequence and waiter[0] > priority:
+                    waiters[index] = (priority, *waiter[1:])
+                    heapq.heapify(waiters)
+                    self._condition.notify()
+                    return
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                f"{api}/{model}" if model else api: bucket.stats()
+                for (api, model), bucket in self._buckets.items()
+            }
+
+
+class LimitedBedrockClient:
+    """A bedrock-runtime client whose model calls go through a BedrockLimiter.
+
+    Everything else is passed through to the wrapped client.
+    """
+
+    def __init__(
+        self, client, limiter: BedrockLimiter, priority: int = PRIORITY_IN_TURN
+    ):
+        self._client = client
+        self._limiter = limiter
+        self._priority = priority
+
+    def converse_stream(self, **request):
+        return self._limiter.call(
+            "converse_stream",
+            request.get("modelId"),
+            lambda: self._client.converse_stream(**request),
+            self._priority,
+        )
+
+    def converse(self, **request):
+        return self._limiter.call(
+            "converse",
+            request.get("modelId"),
+            lambda: self._client.converse(**request),
+            self._priority,
+        )
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+class LimitedBedrockLLMService(AWSBedrockLLMService):
+    """AWSBedrockLLMService whose converse_stream calls go through a BedrockLimiter.
+
+    A session's first call is PRIORITY_NEW_SESSION, the call that answers a
+    function call's result is PRIORITY_IN_TURN, and any other starts a new
+    turn.
+    """
+
+    def __init__(self, *, limiter: BedrockLimiter, **kwargs):
+        super().__init__(**kwargs)
+        self._limiter = limiter
+        self._answered = False
+
+    async def _create_converse_stream(self, client, request_params):
+        messages = request_params.get("messages") or [{}]
+        content = messages[-1].get("content")
+        if not self._answered:
+            priority = PRIORITY_NEW_SESSION
+        elif isinstance(content, list) and any("toolResult" in b for b in content):
+            priority = PRIORITY_IN_TURN
+        else:
+            priority = PRIORITY_NEW_TURN
+
+        create = super()._create_converse_stream
+        response = await self._limiter.call_async(
+            "converse_stream",
+            request_params.get("modelId"),
+            lambda: create(client, request_params),
+            priority,
+        )
+        self._answered = True
+        return response
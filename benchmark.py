@@ -0,0 +1,2719 @@
+"""Offline replay benchmark for the agent.py pipeline.
+
+Runs N concurrent sessions of the real agent pipeline (create_pipeline_task) in
+a single process, with local, deterministic stand-ins for the transport,
+Deepgram STT and TTS, the Bedrock LLM, the Strands agent's Bedrock model and
+the knowledge base. Nothing leaves the machine and no API keys are needed.
+
+Each session replays a script of caller utterances, waiting for the bot to
+answer each one before playing the next: 16-bit mono WAV files from --audio (in
+name order, each with its transcript in a .txt file next to it), or synthetic
+noise bursts that stand in for speech. The synthetic queries include single-claim
+lookups, which go straight to the knowledge base, and a comparison of two claims,
+which goes to the Strands agent. The stand-ins' latencies and token rates are
+set on the command line.
+
+The report has per-stage turn latency percentiles (bot_started is the
+end-to-end latency the caller hears), event loop lag, CPU time per session and
+peak RSS, plus the KB cache and agent executor counters:
+
+    python benchmark.py replay --sessions 20 --output baseline.json
+    python benchmark.py replay --sessions 20 --baseline baseline.json
+
+With --baseline, the run fails (exit status 1) if any of the gated metrics is
+worse than the baseline's by more than --max-regression. agent.py's own settings
+(KB_SEARCH_STRATEGY, AGENT_STREAMING, ...) are read from the environment as usual.
+With --compare-prefetch, the same sessions are replayed without and then with
+the interim-transcript KB prefetcher, and the report has both runs' latencies
+and KB cache counters.
+
+The vad subcommand measures Silero VAD memory and throughput against the number
+of sessions in the process, with a model per session, a shared model, and a
+shared model run on batches of streams. The vad-engine subcommand compares the
+CPU use of per-stream and BatchedVADEngine inference with streams sending audio
+in real time.
+
+The turn-taking subcommand replays recorded calls through each turn-taking
+profile's VAD, and reports end-of-turn latency against how often the caller
+would have been interrupted mid-turn.
+
+The kb-offload subcommand paces every session's audio frames while the sessions
+look claims up, and reports how late the frames are with boto3's retrieve
+called on the event loop (as it used to be) and on the retrieve executor.
+
+The kb-race subcommand runs the same claim lookups with the sequential and
+racing search strategies against a simulated knowledge base whose HYBRID
+search misses some claims, and reports latency percentiles and histograms.
+
+The agent-stall subcommand has one session run Strands agent calls while the
+others pace audio frames, and reports how late the other sessions' frames are
+with the agent run on the event loop (as it used to be) and on AgentExecutor.
+
+The client-pool subcommand times session setup with real boto3 clients, built
+per session (as they used to be) and borrowed from a warmed BedrockClientPool,
+and how long warming the pool on first use stalls the event loop.
+
+The interruption subcommand interrupts Strands agent runs on the stand-in model
+part way through, and reports the model calls, retrieves and thread time they
+go on to use, with and without passing the runs a cancel_signal.
+
+The thinking-bridge subcommand streams thousands of token events a second from
+a stand-in agent thread through the archive bot's ThinkingBridge, and reports
+how many messages reach the pipeline, how late, and the event loop lag.
+
+The routing subcommand classifies a labeled query set with QueryRouter, and
+runs it through the stand-ins with every query going to the Strands agent and
+then with each query on its route, reporting accuracy and per-route latency.
+
+The bedrock-limiter subcommand starts a spike of sessions against a stand-in
+Bedrock that throttles above a request rate, and reports failed turns, turn
+latency and the limiter's queue waits, without the limiter and with it.
+
+The warm-start subcommand times sessions from their offer to the bot's first
+audio, with their services built once the transport exists and prepared while
+the offer is negotiated, as the archive's dev server does, and checks that
+unused preparations are released.
+
+The kb-context subcommand formats a fixture set of knowledge base results (or
+synthetic ones) the old way and with ContextPacker at several token budgets,
+and reports the prompt tokens, the facts the answer needs that survive, and
+the time to first token that saves at a given prefill rate. Packing is reported
+on its own, and then with low-scoring results also left out
+(--min-relative-score), since that saves tokens by dropping results.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import itertools
+import json
+import math
+import os
+import random
+import re
+import resource
+import sys
+import threading
+import time
+import uuid
+import wave
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Callable, List, Optional
+
+import numpy as np
+from botocore.exceptions import ClientError
+from loguru import logger
+from pipecat.audio.vad.silero import SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADState
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    Frame,
+    InputAudioRawFrame,
+    InterimTranscriptionFrame,
+    OutputAudioRawFrame,
+    StartFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.services.aws.llm import AWSBedrockLLMService
+from pipecat.services.stt_service import STTService
+from pipecat.services.tts_service import TTSService
+from pipecat.transports.base_input import BaseInputTransport
+from pipecat.transports.base_output import BaseOutputTransport
+from pipecat.transports.base_transport import BaseTransport, TransportParams
+from pipecat.utils.time import time_now_iso8601
+
+import agent
+from agent_executor import AgentExecutor, InterruptionStats
+from bedrock_limiter import (
+    PRIORITY_IN_TURN,
+    PRIORITY_NEW_SESSION,
+    PRIORITY_NEW_TURN,
+    BedrockLimiter,
+)
+from claim_index import find_claim_ids
+from kb_cache import RetrievalCache
+from kb_context import ContextPacker, estimate_tokens
+from latency import percentile
+from query_router import ROUTE_AGENT, ROUTE_KB, QueryRouter
+from session_prep import PreconnectedDeepgramSTTService, PreparedSessions
+from shared_vad import (
+    BatchedSileroVADAnalyzer,
+    BatchedVADEngine,
+    SharedSileroVADAnalyzer,
+    SileroStreamState,
+    run_batch,
+)
+from turn_taking import TURN_TAKING_PROFILES, TurnTakingProfile
+
+# Audio is fed to the pipeline in real time, in chunks of this many seconds
+CHUNK_SECS = 0.02
+
+# Rough speaking rate of the synthetic caller and the stand-in TTS voice
+WORDS_PER_SEC = 2.5
+
+_BARE_NUMBER = re.compile(r"\b\d{3,}\b")
+
+# Single-claim lookups go straight to the knowledge base (with
+# QUERY_ROUTING=rules); the comparison of two claims goes to the Strands agent
+_SYNTHETIC_QUERIES = [
+    "What's the status of claim ID {claim_id}?",
+    "Which has the bigger repair estimate, claim {claim_id} or claim {other_claim_id}?",
+    "Can you tell me the estimate on claim {claim_id}?",
+    "What are your office hours?",
+]
+
+# Metrics that --baseline compares, with the absolute change that's always
+# treated as noise
+_GATED_METRICS = {
+    ("stages", "bot_started", "p95"): 0.05,
+    ("loop_lag", "p99"): 0.005,
+    ("cpu_secs_per_session",): 0.05,
+    ("peak_rss_mb",): 10.0,
+}
+
+
+@dataclass
+class Utterance:
+    audio: bytes
+    text: str
+
+    def duration(self, sample_rate: int) -> float:
+        return len(self.audio) / (sample_rate * 2)
+
+
+@dataclass
+class ReplayTimings:
+    """Latencies and rates of the local service stand-ins"""
+
+    stt_final_secs: float = 0.15
+    llm_ttfb_secs: float = 0.4
+    llm_tokens_per_sec: float = 60.0
+    agent_ttfb_secs: float = 0.5
+    agent_tokens_per_sec: float = 80.0
+    kb_retrieve_secs: float = 0.3
+    tts_ttfb_secs: float = 0.2
+    tts_realtime_factor: float = 10.0
+
+
+@dataclass
+class ReplayCounters:
+    """Work done by the Bedrock stand-ins"""
+
+    model_calls: int = 0
+    text_tokens: int = 0
+    retrieves: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "model_calls": self.model_calls,
+                "text_tokens": self.text_tokens,
+                "retrieves": self.retrieves,
+            }
+
+
+def load_script(audio_dir: str) -> tuple:
+    """Read utterances from audio_dir/*.wav and their .txt transcripts"""
+    utterances = []
+    sample_rate = None
+    for path in sorted(glob.glob(os.path.join(audio_dir, "*.wav"))):
+        with wave.open(path, "rb") as f:
+            if f.getnchannels() != 1 or f.getsampwidth() != 2:
+                raise ValueError(f"{path}: expected 16-bit mono audio")
+            if sample_rate and f.getframerate() != sample_rate:
+                raise ValueError(f"{path}: all recordings must have the same rate")
+            sample_rate = f.getframerate()
+            audio = f.readframes(f.getnframes())
+        with open(f"{os.path.splitext(path)[0]}.txt") as f:
+            utterances.append(Utterance(audio, f.read().strip()))
+
+    if not utterances:
+        raise ValueError(f"No .wav files in {audio_dir}")
+    return utterances, sample_rate
+
+
+def synthetic_script(turns: int, seed: int, sample_rate: int = 16000) -> list:
+    """Noise bursts as long as the queries would take to say"""
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    utterances = []
+    for turn in range(turns):
+        query = _SYNTHETIC_QUERIES[turn % len(_SYNTHETIC_QUERIES)]
+        claim_id = rng.randint(1000, 1099)
+        other_claim_id = rng.randint(1000, 1099) if "other_claim_id" in query else None
+        text = query.format(claim_id=claim_id, other_claim_id=other_claim_id)
+        num_samples = int(sample_rate * len(text.split()) / WORDS_PER_SEC)
+        samples = noise.normal(0, 6000, num_samples).clip(-32768, 32767)
+        utterances.append(Utterance(samples.astype(np.int16).tobytes(), text))
+    return utterances
+
+
+class EnergyVADAnalyzer(VADAnalyzer):
+    """Treats any loud enough audio as speech, for the synthetic noise bursts"""
+
+    def __init__(self, threshold: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self._threshold = threshold
+
+    def num_frames_required(self) -> int:
+        return int(self.sample_rate * CHUNK_SECS)
+
+    def voice_confidence(self, buffer) -> float:
+        samples = np.frombuffer(buffer, dtype=np.int16).astype(np.float32)
+        rms = np.sqrt(np.mean(samples**2)) if samples.size else 0.0
+        return 1.0 if rms >= self._threshold else 0.0
+
+
+#
+# Stand-in Bedrock models and knowledge base
+#
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content", [])
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content if "text" in block)
+
+
+def _has_tool_result(message: dict) -> bool:
+    content = message.get("content", [])
+    return isinstance(content, list) and any("toolResult" in b for b in content)
+
+
+def _claim_ids(text: str) -> list:
+    return find_claim_ids(text) or _BARE_NUMBER.findall(text)
+
+
+def converse_events(request: dict) -> list:
+    """Deterministic Bedrock converse_stream events for a request.
+
+    A user turn that mentions a claim gets a search_knowledge_base tool call
+    (if the tool is on offer), for "claim ID <id>" or, if it mentions more than
+    one claim, for what the user said; anything else, including tool results,
+    gets a short answer streamed a word at a time.
+    """
+    messages = request.get("messages", [])
+    last = messages[-1] if messages else {}
+    tool_names = {
+        tool.get("toolSpec", {}).get("name")
+        for tool in request.get("toolConfig", {}).get("tools", [])
+    }
+
+    claim_ids = _claim_ids(_message_text(last))
+    if (
+        claim_ids
+        and not _has_tool_result(last)
+        and "search_knowledge_base" in tool_names
+    ):
+        query = f"claim ID {claim_ids[0]}"
+        if len(claim_ids) > 1:
+            query = _message_text(last)
+        arguments = json.dumps({"query": query})
+        return [
+            {"messageStart": {"role": "assistant"}},
+            {
+                "contentBlockStart": {
+                    "start": {
+                        "toolUse": {
+                            "toolUseId": f"tooluse_{uuid.uuid4().hex[:16]}",
+                            "name": "search_knowledge_base",
+                        }
+                    },
+                    "contentBlockIndex": 0,
+                }
+            },
+            {
+                "contentBlockDelta": {
+                    "delta": {"toolUse": {"input": arguments}},
+                    "contentBlockIndex": 0,
+                }
+            },
+            {"contentBlockStop": {"contentBlockIndex": 0}},
+            {"messageStop": {"stopReason": "tool_use"}},
+            {"metadata": {"usage": _usage(messages, 20), "metrics": {"latencyMs": 0}}},
+        ]
+
+    if _has_tool_result(last):
+        answer = (
+            "That claim is open and under review. The repair estimate is on "
+            "file, and an adjuster will follow up within two business days."
+        )
+    else:
+        answer = (
+            "Our office is open weekdays from eight to six. "
+            "Is there anything else I can help you with?"
+        )
+    words = answer.split(" ")
+    return (
+        [
+            {"messageStart": {"role": "assistant"}},
+            {"contentBlockStart": {"start": {}, "contentBlockIndex": 0}},
+        ]
+        + [
+            {
+                "contentBlockDelta": {
+                    "delta": {"text": word if i == 0 else f" {word}"},
+                    "contentBlockIndex": 0,
+                }
+            }
+            for i, word in enumerate(words)
+        ]
+        + [
+            {"contentBlockStop": {"contentBlockIndex": 0}},
+            {"messageStop": {"stopReason": "end_turn"}},
+            {
+                "metadata": {
+                    "usage": _usage(messages, len(words)),
+                    "metrics": {"latencyMs": 0},
+                }
+            },
+        ]
+    )
+
+
+def _usage(messages: list, output_tokens: int) -> dict:
+    input_tokens = sum(len(_message_text(m).split()) for m in messages)
+    return {
+        "inputTokens": input_tokens,
+        "outputTokens": output_tokens,
+        "totalTokens": input_tokens + output_tokens,
+    }
+
+
+def _is_text_delta(event: dict) -> bool:
+    return "text" in event.get("contentBlockDelta", {}).get("delta", {})
+
+
+class ReplayBedrockClient:
+    """Blocking stand-in for the bedrock-runtime and bedrock-agent-runtime clients"""
+
+    def __init__(
+        self,
+        timings: ReplayTimings,
+        region_name: str,
+        counters: Optional[ReplayCounters] = None,
+    ):
+        self._timings = timings
+        self._counters = counters or ReplayCounters()
+        self.meta = SimpleNamespace(region_name=region_name)
+
+    def converse_stream(self, **request) -> dict:
+        self._counters.add(model_calls=1)
+        time.sleep(self._timings.agent_ttfb_secs)
+        return {"stream": self._stream(converse_events(request))}
+
+    def _stream(self, events: list):
+        for event in events:
+            if _is_text_delta(event):
+                time.sleep(1 / self._timings.agent_tokens_per_sec)
+                self._counters.add(text_tokens=1)
+            yield event
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+        self._counters.add(retrieves=1)
+        time.sleep(self._timings.kb_retrieve_secs)
+        claim_ids = _claim_ids(retrievalQuery["text"])
+        return {
+            "retrievalResults": [
+                {
+                    "content": {
+                        "text": f"Claim ID {claim_id}. Status: open, under review. "
+                        "Estimate: $2,450 for rear bumper repair. Notes: adjuster "
+                        "assigned, follow-up within two business days."
+                    },
+                    "score": 0.9,
+                    "location": {"s3Location": {"uri": f"s3://replay/{claim_id}.txt"}},
+                }
+                for claim_id in claim_ids[:1]
+            ]
+        }
+
+
+class ReplayBotoSession:
+    """Duck-typed boto3.Session that hands out ReplayBedrockClients"""
+
+    region_name = "us-east-1"
+
+    def __init__(self, timings: ReplayTimings, counters: Optional[ReplayCounters]):
+        self._timings = timings
+        self._counters = counters
+
+    def client(self, service_name: str, region_name: Optional[str] = None, **kwargs):
+        return ReplayBedrockClient(
+            self._timings, region_name or self.region_name, self._counters
+        )
+
+
+class ReplayClientPool(agent.BedrockClientPool):
+    """BedrockClientPool whose Strands models and KB clients are stand-ins"""
+
+    def __init__(
+        self,
+        timings: ReplayTimings,
+        size: int,
+        counters: Optional[ReplayCounters] = None,
+    ):
+        super().__init__(size)
+        self._timings = timings
+        self.counters = counters or ReplayCounters()
+
+    def _create_session(self) -> ReplayBotoSession:
+        return ReplayBotoSession(self._timings, self.counters)
+
+
+class ReplayBedrockLLMService(AWSBedrockLLMService):
+    """AWSBedrockLLMService whose converse_stream calls are answered locally"""
+
+    def __init__(self, timings: ReplayTimings, **kwargs):
+        super().__init__(model="replay", **kwargs)
+        self._timings = timings
+
+    async def _create_converse_stream(self, client, request_params):
+        await asyncio.sleep(self._timings.llm_ttfb_secs)
+        return {"stream": self._stream(converse_events(request_params))}
+
+    async def _stream(self, events: list):
+        for event in events:
+            if _is_text_delta(event):
+                await asyncio.sleep(1 / self._timings.llm_tokens_per_sec)
+            yield event
+
+
+#
+# Stand-in STT and TTS
+#
+
+
+@dataclass
+class ReplaySession:
+    """A session's script, and what the caller is currently saying"""
+
+    utterances: List[Utterance]
+    sample_rate: int
+    current: Optional[Utterance] = None
+    finalized: set = field(default_factory=set)
+
+
+class ReplaySTTService(STTService):
+    """Transcribes the session's script: interims while the caller is speaking,
+    and the final transcript shortly after they stop
+    """
+
+    INTERIM_INTERVAL_SECS = 0.3
+
+    def __init__(self, session: ReplaySession, timings: ReplayTimings, **kwargs):
+        super().__init__(**kwargs)
+        self._session = session
+        self._timings = timings
+        self._speaking_since = None
+        self._last_interim_at = 0.0
+
+    async def run_stt(self, audio: bytes):
+        utterance = self._session.current
+        now = time.monotonic()
+        if (
+            utterance is not None
+            and self._speaking_since is not None
+            and now - self._last_interim_at >= self.INTERIM_INTERVAL_SECS
+        ):
+            self._last_interim_at = now
+            words = utterance.text.split()
+            spoken = (now - self._speaking_since) / utterance.duration(
+                self._session.sample_rate
+            )
+            count = max(1, min(len(words), int(len(words) * spoken)))
+            yield InterimTranscriptionFrame(
+                " ".join(words[:count]), "", time_now_iso8601()
+            )
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, UserStartedSpeakingFrame):
+            self._speaking_since = time.monotonic()
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._speaking_since = None
+            utterance = self._session.current
+            # A pause in the middle of an utterance mustn't transcribe it twice
+            if utterance is not None and id(utterance) not in self._session.finalized:
+                self._session.finalized.add(id(utterance))
+                self.create_task(self._finalize(utterance))
+
+    async def _finalize(self, utterance: Utterance):
+        await asyncio.sleep(self._timings.stt_final_secs)
+        await self.push_frame(
+            TranscriptionFrame(utterance.text, "", time_now_iso8601())
+        )
+
+
+class ReplayTTSService(TTSService):
+    """Synthesizes silence as long as the text would take to say"""
+
+    def __init__(self, timings: ReplayTimings, **kwargs):
+        super().__init__(**kwargs)
+        self._timings = timings
+
+    async def run_tts(self, text: str):
+        await self.start_ttfb_metrics()
+        await asyncio.sleep(self._timings.tts_ttfb_secs)
+        yield TTSStartedFrame()
+
+        chunk_secs = 0.1
+        chunk = b"\x00" * (int(self.sample_rate * chunk_secs) * 2)
+        chunks = max(1, int(len(text.split()) / WORDS_PER_SEC / chunk_secs))
+        for _ in range(chunks):
+            await self.stop_ttfb_metrics()
+            yield TTSAudioRawFrame(
+                audio=chunk, sample_rate=self.sample_rate, num_channels=1
+            )
+            await asyncio.sleep(chunk_secs / self._timings.tts_realtime_factor)
+        yield TTSStoppedFrame()
+
+
+#
+# Stand-in transport
+#
+
+
+class ReplayInputTransport(BaseInputTransport):
+    """Plays the session's script into the pipeline in real time"""
+
+    def __init__(
+        self,
+        transport: "ReplayTransport",
+        session: ReplaySession,
+        params: TransportParams,
+        turn_gap_secs: float,
+        response_timeout_secs: float,
+        connect_secs: float = 0.0,
+    ):
+        super().__init__(params)
+        self._transport = transport
+        self._session = session
+        self._turn_gap_secs = turn_gap_secs
+        self._response_timeout_secs = response_timeout_secs
+        # How long the caller's connection (ICE, or joining the room) takes
+        self._connect_secs = connect_secs
+        self._replay_task = None
+        self._bot_speaking = False
+        self._bot_spoke = False
+        self._bot_stopped_at = 0.0
+        self._next_chunk_at = 0.0
+
+    async def start(self, frame: StartFrame):
+        await super().start(frame)
+        await asyncio.sleep(self._connect_secs)
+        await self.set_transport_ready(frame)
+        if not self._replay_task:
+            self._replay_task = self.create_task(self._replay())
+
+    async def stop(self, frame):
+        await super().stop(frame)
+        await self._cancel_replay_task()
+
+    async def cancel(self, frame):
+        await super().cancel(frame)
+        await self._cancel_replay_task()
+
+    async def _cancel_replay_task(self):
+        if self._replay_task:
+            await self.cancel_task(self._replay_task)
+            self._replay_task = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, BotStartedSpeakingFrame):
+            self._bot_speaking = True
+            self._bot_spoke = True
+        elif isinstance(frame, BotStoppedSpeakingFrame):
+            self._bot_speaking = False
+            self._bot_stopped_at = time.monotonic()
+
+    async def _push_chunk(self, audio: bytes):
+        # Paced against an absolute schedule, so a slow loop doesn't stretch the call
+        loop = asyncio.get_running_loop()
+        self._next_chunk_at = max(self._next_chunk_at, loop.time()) + CHUNK_SECS
+        await self.push_audio_frame(
+            InputAudioRawFrame(
+                audio=audio, sample_rate=self._session.sample_rate, num_channels=1
+            )
+        )
+        await asyncio.sleep(self._next_chunk_at - loop.time())
+
+    async def _wait_for_bot(self):
+        """Send silence until the bot has answered and gone quiet"""
+        silence = b"\x00" * (int(self._session.sample_rate * CHUNK_SECS) * 2)
+        started_at = time.monotonic()
+        while True:
+            await self._push_chunk(silence)
+            now = time.monotonic()
+            if self._bot_spoke and not self._bot_speaking:
+                if now - self._bot_stopped_at >= self._turn_gap_secs:
+                    return
+            elif not self._bot_spoke and now - started_at > self._response_timeout_secs:
+                logger.warning(f"{self}: No response after {now - started_at:.1f}s")
+                return
+
+    async def _replay(self):
+        await self._transport.client_connected()
+        # The greeting
+        await self._wait_for_bot()
+
+        chunk_size = int(self._session.sample_rate * CHUNK_SECS) * 2
+        for utterance in self._session.utterances:
+            self._session.current = utterance
+            self._bot_spoke = False
+            for start in range(0, len(utterance.audio), chunk_size):
+                await self._push_chunk(utterance.audio[start : start + chunk_size])
+            await self._wait_for_bot()
+
+        await self._transport.client_closed()
+
+
+class ReplayOutputTransport(BaseOutputTransport):
+    """Discards the bot's audio, taking as long as playing it would"""
+
+    def __init__(self, params: TransportParams):
+        super().__init__(params)
+        self._played_until = 0.0
+        self.first_audio_at = None
+
+    async def start(self, frame: StartFrame):
+        await super().start(frame)
+        await self.set_transport_ready(frame)
+
+    async def write_audio_frame(self, frame: OutputAudioRawFrame):
+        loop = asyncio.get_running_loop()
+        if self.first_audio_at is None:
+            self.first_audio_at = time.monotonic()
+        duration = len(frame.audio) / (frame.sample_rate * frame.num_channels * 2)
+        self._played_until = max(self._played_until, loop.time()) + duration
+        await asyncio.sleep(self._played_until - loop.time() - duration)
+
+
+class ReplayTransport(BaseTransport):
+    """Transport for one replayed session, with the client events agent.py handles"""
+
+    def __init__(self, session: ReplaySession, params: TransportParams, **kwargs):
+        super().__init__()
+        self._session = session
+        self._params = params
+        self._kwargs = kwargs
+        self._client = uuid.uuid4().hex
+        self._input = None
+        self._output = None
+
+        self._register_event_handler("on_client_connected")
+        self._register_event_handler("on_client_disconnected")
+        self._register_event_handler("on_client_closed")
+
+    def input(self) -> ReplayInputTransport:
+        if not self._input:
+            self._input = ReplayInputTransport(
+                self, self._session, self._params, **self._kwargs
+            )
+        return self._input
+
+    def output(self) -> ReplayOutputTransport:
+        if not self._output:
+            self._output = ReplayOutputTransport(self._params)
+        return self._output
+
+    async def client_connected(self):
+        await self._call_event_handler("on_client_connected", self._client)
+
+    async def client_closed(self):
+        await self._call_event_handler("on_client_disconnected", self._client)
+        await self._call_event_handler("on_client_closed", self._client)
+
+
+#
+# Benchmark runner
+#
+
+
+class LoopLagSampler:
+    """Measures how late the event loop wakes up from a short sleep"""
+
+    def __init__(self, interval_secs: float = 0.05):
+        self.interval_secs = interval_secs
+        self.samples = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval_secs)
+            self.samples.append(max(0.0, loop.time() - start - self.interval_secs))
+
+    def report(self) -> dict:
+        samples = sorted(self.samples) or [0.0]
+        return {
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+            "max": samples[-1],
+        }
+
+
+async def run_session(index: int, args, timings: ReplayTimings, pool: ReplayClientPool):
+    if args.audio:
+        utterances, sample_rate = load_script(args.audio)
+    else:
+        utterances, sample_rate = synthetic_script(args.turns, seed=index), 16000
+    session = ReplaySession(utterances, sample_rate)
+
+    vad = args.vad or ("silero" if args.audio else "energy")
+    params = TransportParams(
+        audio_in_enabled=True,
+        audio_out_enabled=True,
+        audio_in_sample_rate=sample_rate,
+        vad_analyzer=(
+            agent.create_vad_analyzer() if vad == "silero" else EnergyVADAnalyzer()
+        ),
+    )
+    transport = ReplayTransport(
+        session,
+        params,
+        turn_gap_secs=args.turn_gap,
+        response_timeout_secs=args.response_timeout,
+    )
+
+    task = agent.create_pipeline_task(
+        transport,
+        agent.StrandsAgent(clients=pool),
+        ReplaySTTService(session, timings),
+        ReplayTTSService(timings, sample_rate=24000),
+        ReplayBedrockLLMService(timings, aws_region="us-east-1"),
+    )
+    await PipelineRunner(handle_sigint=False).run(task)
+
+
+async def replay_sessions(args) -> dict:
+    timings = ReplayTimings(
+        stt_final_secs=args.stt_final_latency,
+        llm_ttfb_secs=args.llm_ttfb,
+        llm_tokens_per_sec=args.llm_tokens_per_sec,
+        agent_ttfb_secs=args.agent_ttfb,
+        agent_tokens_per_sec=args.agent_tokens_per_sec,
+        kb_retrieve_secs=args.kb_latency,
+        tts_ttfb_secs=args.tts_ttfb,
+    )
+    pool = ReplayClientPool(timings, size=agent.BEDROCK_CLIENTS.size)
+    pool.warm()
+
+    lag = LoopLagSampler()
+    lag_task = asyncio.create_task(lag.run())
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start_time = time.monotonic()
+
+    async def staggered(index: int):
+        await asyncio.sleep(args.ramp * index / args.sessions)
+        await run_session(index, args, timings, pool)
+
+    await asyncio.gather(*(staggered(i) for i in range(args.sessions)))
+
+    wall_secs = time.monotonic() - start_time
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    lag_task.cancel()
+
+    cpu_secs = (usage.ru_utime - usage_before.ru_utime) + (
+        usage.ru_stime - usage_before.ru_stime
+    )
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+
+    report = agent.TURN_LATENCY.report()
+    report.update(
+        {
+            "sessions": args.sessions,
+            "bedrock": pool.counters.report(),
+            "wall_secs": wall_secs,
+            "loop_lag": lag.report(),
+            "cpu_secs_per_session": cpu_secs / args.sessions,
+            "cpu_percent": 100 * cpu_secs / wall_secs,
+            "peak_rss_mb": usage.ru_maxrss * rss_scale / 2**20,
+            "threads": threading.active_count(),
+        }
+    )
+    return report
+
+
+# KB cache counters reported for each run of --compare-prefetch
+_PREFETCH_CACHE_COUNTERS = (
+    "hits",
+    "misses",
+    "joined",
+    "speculative_started",
+    "speculative_used",
+    "speculative_wasted",
+)
+
+
+async def replay(args) -> dict:
+    if not args.compare_prefetch:
+        return await replay_sessions(args)
+
+    # The same sessions, without and then with KB_PREFETCH, each starting from
+    # an empty KB cache and no recorded turns
+    report = {"sessions": args.sessions}
+    for mode, prefetch in (("without_prefetch", False), ("with_prefetch", True)):
+        agent.KB_PREFETCH = prefetch
+        agent.KB_CACHE.invalidate()
+        agent.TURN_LATENCY.clear()
+        cache_before = agent.KB_CACHE.stats()
+        run = await replay_sessions(args)
+        report[mode] = {
+            "turns": run["turns"],
+            "stages": run["stages"],
+            "bedrock": run["bedrock"],
+            "kb_cache": {
+                counter: run["kb_cache"][counter] - cache_before[counter]
+                for counter in _PREFETCH_CACHE_COUNTERS
+            },
+            "loop_lag": run["loop_lag"],
+        }
+    return report
+
+
+async def _pace_audio(lateness: list, frame_secs: float = 0.02):
+    """Pace audio frames against an absolute schedule, as an output transport
+    does, recording how late each one is, until cancelled
+    """
+    loop = asyncio.get_running_loop()
+    next_at = loop.time()
+    while True:
+        next_at += frame_secs
+        await asyncio.sleep(next_at - loop.time())
+        lateness.append(max(0.0, loop.time() - next_at))
+
+
+def _jitter_ms(lateness: list) -> dict:
+    values = sorted(lateness) or [0.0]
+    return {
+        "frames": len(lateness),
+        "p50": 1000 * percentile(values, 50),
+        "p95": 1000 * percentile(values, 95),
+        "p99": 1000 * percentile(values, 99),
+        "max": 1000 * values[-1],
+    }
+
+
+class BlockingRetrieveKBClient(agent.BedrockKnowledgeBaseClient):
+    """The KB client as it was before retrieves moved to an executor, with
+    boto3's retrieve called straight from the event loop
+    """
+
+    def _start_retrieve(
+        self,
+        text: str,
+        search_type: str,
+        max_results: int,
+        priority: int = PRIORITY_IN_TURN,
+    ) -> Future:
+        future = Future()
+        future.set_result(
+            self.bedrock_agent_runtime.retrieve(
+                knowledgeBaseId=self.knowledge_base_id,
+                retrievalQuery={"text": text},
+                retrievalConfiguration={
+                    "vectorSearchConfiguration": {
+                        "numberOfResults": max_results,
+                        "overrideSearchType": search_type,
+                    }
+                },
+            ).get("retrievalResults", [])
+        )
+        return future
+
+
+async def kb_offload(args) -> dict:
+    """Audio frame jitter while sessions look claims up, with each session
+    pacing 20 ms frames as its output transport would.
+
+    The lookups go through query_knowledge_base() against the blocking
+    stand-in retrieve, first with boto3 called on the event loop, as it was,
+    then with retrieves on the shared executor.
+    """
+    timings = ReplayTimings(kb_retrieve_secs=args.kb_latency)
+    # Distinct claims, so no lookup is answered from the KB cache
+    claim_ids = itertools.count(1000)
+    report = {"sessions": args.sessions, "kb_latency_secs": args.kb_latency}
+
+    for mode, client_class in (
+        ("on_loop", BlockingRetrieveKBClient),
+        ("executor", agent.BedrockKnowledgeBaseClient),
+    ):
+        client = client_class(
+            "replay",
+            search_strategy="sequential",
+            cache=RetrievalCache(),
+            claim_index=None,
+            limiter=BedrockLimiter(default_rps=10000),
+            boto_session=ReplayBotoSession(timings, None),
+        )
+        lateness = []
+        lookup_secs = []
+
+        async def session(index: int):
+            rng = random.Random(index)
+            await asyncio.sleep(rng.uniform(0, args.lookup_interval))
+            end_at = time.monotonic() + args.duration
+            while time.monotonic() < end_at:
+                start_time = time.monotonic()
+                await client.query_knowledge_base(f"claim ID {next(claim_ids)}")
+                lookup_secs.append(time.monotonic() - start_time)
+                await asyncio.sleep(rng.expovariate(1 / args.lookup_interval))
+
+        pacers = [
+            asyncio.create_task(_pace_audio(lateness)) for _ in range(args.sessions)
+        ]
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+        for pacer in pacers:
+            pacer.cancel()
+        await asyncio.gather(*pacers, return_exceptions=True)
+
+        lookup_secs.sort()
+        report[mode] = {
+            "lookups": len(lookup_secs),
+            "lookup_secs": {
+                "p50": percentile(lookup_secs, 50),
+                "p95": percentile(lookup_secs, 95),
+            },
+            "audio_frame_lateness_ms": _jitter_ms(lateness),
+        }
+    return report
+
+
+class SimulatedKnowledgeBase:
+    """Blocking bedrock-agent-runtime stand-in whose HYBRID search misses a
+    fraction of claims, which only the SEMANTIC search then finds
+    """
+
+    def __init__(self, delay_secs: float, jitter_secs: float, miss_rate: float):
+        self.delay_secs = delay_secs
+        self.jitter_secs = jitter_secs
+        self.miss_rate = miss_rate
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+        self.retrieves = {"HYBRID": 0, "SEMANTIC": 0}
+
+    def misses(self, claim_id: str) -> bool:
+        return random.Random(claim_id).random() < self.miss_rate
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+        search_type = retrievalConfiguration["vectorSearchConfiguration"][
+            "overrideSearchType"
+        ]
+        with self._lock:
+            self.retrieves[search_type] += 1
+            delay = self.delay_secs + self._rng.uniform(0, self.jitter_secs)
+        time.sleep(delay)
+
+        claim_id = _claim_ids(retrievalQuery["text"])[0]
+        if search_type == "HYBRID" and self.misses(claim_id):
+            return {"retrievalResults": []}
+        return {
+            "retrievalResults": [
+                {
+                    "content": {"text": f"Claim ID {claim_id}. Status: open."},
+                    "score": 0.9,
+                    "location": {"s3Location": {"uri": f"s3://sim/{claim_id}.txt"}},
+                }
+            ]
+        }
+
+
+def _latency_histogram(latencies: list, bucket_secs: float) -> dict:
+    """Counts of latencies per bucket, keyed by the bucket's lower bound"""
+    counts = {}
+    for latency in latencies:
+        bucket = round(math.floor(latency / bucket_secs) * bucket_secs, 3)
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return {f"{bucket:.3f}": counts[bucket] for bucket in sorted(counts)}
+
+
+async def kb_race(args) -> dict:
+    """Search latency of the sequential and racing strategies.
+
+    Each strategy looks up the same claims through query_knowledge_base(),
+    against a simulated knowledge base with a per-call delay whose HYBRID
+    search misses --miss-rate of them.
+    """
+    claim_ids = [str(1000 + i) for i in range(args.queries)]
+    report = {"queries": args.queries, "delay_secs": args.delay}
+
+    for strategy in ("sequential", "race"):
+        kb = SimulatedKnowledgeBase(args.delay, args.jitter, args.miss_rate)
+        client = agent.BedrockKnowledgeBaseClient(
+            "simulated",
+            search_strategy=strategy,
+            cache=RetrievalCache(),
+            claim_index=None,
+            limiter=BedrockLimiter(default_rps=10000),
+            boto_session=SimpleNamespace(client=lambda *args, **kwargs: kb),
+        )
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def lookup(claim_id: str) -> float:
+            async with semaphore:
+                start_time = time.monotonic()
+                await client.query_knowledge_base(f"claim ID {claim_id}")
+                return time.monotonic() - start_time
+
+        latencies = await asyncio.gather(*(lookup(c) for c in claim_ids))
+        by_outcome = {"hit": [], "miss": []}
+        for claim_id, latency in zip(claim_ids, latencies):
+            by_outcome["miss" if kb.misses(claim_id) else "hit"].append(latency)
+
+        report[strategy] = {
+            "retrieves": kb.retrieves,
+            "histogram": _latency_histogram(latencies, args.bucket),
+        }
+        for outcome, values in (("all", latencies), *by_outcome.items()):
+            values = sorted(values) or [0.0]
+            report[strategy][outcome] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+    return report
+
+
+async def agent_stall(args) -> dict:
+    """Audio frame lateness in the other sessions while one session's Strands
+    agent answers.
+
+    --agent-sessions sessions each run --queries agent calls against the
+    stand-in model, while the rest pace 20 ms audio frames. The calls first
+    run process_query() on the event loop, as the search handler used to,
+    then on an AgentExecutor.
+    """
+    timings = ReplayTimings(
+        agent_ttfb_secs=args.agent_ttfb,
+        agent_tokens_per_sec=args.agent_tokens_per_sec,
+        kb_retrieve_secs=args.kb_latency,
+    )
+    # Distinct claims, so no run's retrieve is answered from the KB cache
+    claim_ids = itertools.count(1000)
+    report = {"sessions": args.sessions, "agent_sessions": args.agent_sessions}
+
+    for mode in ("on_loop", "executor"):
+        pool = ReplayClientPool(timings, size=args.agent_sessions)
+        pool.warm()
+        executor = AgentExecutor(max_workers=args.agent_sessions)
+        lateness = []
+        run_secs = []
+
+        async def agent_session():
+            strands_agent = agent.StrandsAgent(clients=pool)
+            # Let the other sessions' audio get going first
+            await asyncio.sleep(0.2)
+            for _ in range(args.queries):
+                query = f"What's the status of claim ID {next(claim_ids)}?"
+                start_time = time.monotonic()
+                if mode == "on_loop":
+                    strands_agent.process_query(query)
+                else:
+                    await executor.run(strands_agent.process_query, query)
+                run_secs.append(time.monotonic() - start_time)
+
+        pacers = [
+            asyncio.create_task(_pace_audio(lateness))
+            for _ in range(args.sessions - args.agent_sessions)
+        ]
+        await asyncio.gather(*(agent_session() for _ in range(args.agent_sessions)))
+        # The frames that were due during the last run
+        await asyncio.sleep(0.2)
+        for pacer in pacers:
+            pacer.cancel()
+        await asyncio.gather(*pacers, return_exceptions=True)
+
+        run_secs.sort()
+        report[mode] = {
+            "agent_runs": len(run_secs),
+            "agent_run_secs": {
+                "p50": percentile(run_secs, 50),
+                "max": run_secs[-1],
+            },
+            "other_sessions_audio_frame_lateness_ms": _jitter_ms(lateness),
+            "agent_executor": executor.stats(),
+        }
+    return report
+
+
+async def client_pool(args) -> dict:
+    """Session setup time with a Bedrock client pool and without.
+
+    Uses real boto3 sessions and clients (nothing is sent). "per_session"
+    sessions each create their own boto3 session, Bedrock model and KB client,
+    as every session used to; "pooled" sessions borrow them from a pool warmed
+    at startup. The first session on an unwarmed pool warms it, which is timed
+    against the event loop: synchronously, and with warm_async().
+    """
+    report = {"sessions": args.sessions}
+
+    def time_sessions(make_pool: Callable[[], agent.BedrockClientPool]) -> dict:
+        setup_secs = []
+        for _ in range(args.sessions):
+            start_time = time.monotonic()
+            agent.StrandsAgent(clients=make_pool())
+            setup_secs.append(time.monotonic() - start_time)
+        setup_secs.sort()
+        return {
+            "p50": percentile(setup_secs, 50),
+            "p95": percentile(setup_secs, 95),
+            "max": setup_secs[-1],
+        }
+
+    report["per_session_setup_secs"] = time_sessions(
+        lambda: agent.BedrockClientPool(size=1)
+    )
+
+    pool = agent.BedrockClientPool(size=args.pool_size)
+    start_time = time.monotonic()
+    pool.warm()
+    report["pool_warm_secs"] = time.monotonic() - start_time
+    report["pooled_setup_secs"] = time_sessions(lambda: pool)
+
+    for mode in ("warm_on_loop", "warm_async"):
+        pool = agent.BedrockClientPool(size=args.pool_size)
+        lateness = []
+        pacer = asyncio.create_task(_pace_audio(lateness))
+        await asyncio.sleep(0.1)
+        start_time = time.monotonic()
+        if mode == "warm_async":
+            await pool.warm_async()
+        agent.StrandsAgent(clients=pool)
+        first_session_secs = time.monotonic() - start_time
+        await asyncio.sleep(0.1)
+        pacer.cancel()
+        await asyncio.gather(pacer, return_exceptions=True)
+        report[mode] = {
+            "first_session_secs": first_session_secs,
+            "audio_frame_lateness_ms": _jitter_ms(lateness),
+        }
+    return report
+
+
+async def interruption(args) -> dict:
+    """Interrupt Strands agent runs part way through, as a caller barging in would.
+
+    The agent runs against the stand-in Bedrock model and knowledge base. Each
+    run is cancelled the way pipecat cancels search_knowledge_base when the
+    caller interrupts, first without passing the run a cancel_signal (so it
+    runs to the end regardless), then with one. One uninterrupted run per mode
+    gives InterruptionStats the average it estimates tokens saved from.
+    """
+    timings = ReplayTimings(
+        agent_ttfb_secs=args.agent_ttfb,
+        agent_tokens_per_sec=args.agent_tokens_per_sec,
+        kb_retrieve_secs=args.kb_latency,
+    )
+    report = {"runs": args.runs, "interrupt_after_secs": args.interrupt_after}
+    # Distinct claims, so no run's retrieve is answered from the KB cache
+    claim_ids = itertools.count(1000)
+
+    for mode in ("ignored", "cancelled"):
+        pool = ReplayClientPool(timings, size=1)
+        pool.warm()
+        interruptions = InterruptionStats()
+        executor = AgentExecutor(max_workers=args.runs)
+
+        def run(strands_agent: agent.StrandsAgent):
+            query = f"What's the status of claim ID {next(claim_ids)}?"
+            if mode == "ignored":
+                return executor.run(strands_agent.process_query, query)
+            cancel_signal = threading.Event()
+            return executor.run(
+                strands_agent.process_query,
+                query,
+                cancel_signal,
+                cancel_signal=cancel_signal,
+            )
+
+        await run(agent.StrandsAgent(clients=pool, interruptions=interruptions))
+        completed = pool.counters.report()
+
+        tasks = [
+            asyncio.create_task(
+                run(agent.StrandsAgent(clients=pool, interruptions=interruptions))
+            )
+            for _ in range(args.runs)
+        ]
+        await asyncio.sleep(args.interrupt_after)
+        interrupted_at = time.monotonic()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # The runs' threads carry on until the agents notice
+        while executor.stats()["active"]:
+            await asyncio.sleep(0.01)
+
+        total = pool.counters.report()
+        report[mode] = {
+            "threads_busy_after_interrupt_secs": time.monotonic() - interrupted_at,
+            "bedrock_per_interrupted_run": {
+                name: (total[name] - completed[name]) / args.runs for name in total
+            },
+            "bedrock_per_completed_run": completed,
+            "interruptions": interruptions.stats(),
+        }
+    return report
+
+
+# (query, the route it should take); {claim} and {other} are filled with claim IDs
+_LABELED_QUERIES = [
+    ("claim ID {claim}", ROUTE_KB),
+    ("claim {claim}", ROUTE_KB),
+    ("claim number {claim}", ROUTE_KB),
+    ("claim #{claim}", ROUTE_KB),
+    ("{claim}", ROUTE_KB),
+    ("What's the status of claim {claim}?", ROUTE_KB),
+    ("estimate for claim ID {claim}", ROUTE_KB),
+    ("Can you look up claim {claim}?", ROUTE_KB),
+    ("What is the repair estimate on claim number {claim}?", ROUTE_KB),
+    ("notes on claim {claim}", ROUTE_KB),
+    ("payment status for claim ID {claim}", ROUTE_KB),
+    ("claim ID {claim} status", ROUTE_KB),
+    # Lookups the rules are too narrow for
+    ("Has the payment on claim {claim} been issued?", ROUTE_KB),
+    ("When will the adjuster call back about claim {claim}?", ROUTE_KB),
+    ("What are your office hours?", ROUTE_AGENT),
+    ("How do I file a windshield claim?", ROUTE_AGENT),
+    ("How long does a claim usually take?", ROUTE_AGENT),
+    ("What does my policy say about rental cars?", ROUTE_AGENT),
+    ("Which of my claims are still open?", ROUTE_AGENT),
+    ("Compare claim {claim} and claim {other}", ROUTE_AGENT),
+    ("What's the status of claim {claim} and claim {other}?", ROUTE_AGENT),
+    ("Why was claim {claim} denied?", ROUTE_AGENT),
+    ("Is claim {claim} covered under my comprehensive policy?", ROUTE_AGENT),
+    ("If claim {claim} is approved, when do I get paid?", ROUTE_AGENT),
+    ("How does the deductible apply to claim {claim}?", ROUTE_AGENT),
+    ("Is the estimate on claim {claim} higher than usual?", ROUTE_AGENT),
+]
+
+
+def load_labeled_queries(path: Optional[str]) -> list:
+    """(query, route) pairs from a JSON list of {"query", "route"}, or the built-in set"""
+    if not path:
+        return _LABELED_QUERIES
+    with open(path) as f:
+        return [(item["query"], item["route"]) for item in json.load(f)]
+
+
+async def routing(args) -> dict:
+    """Route a labeled query set, and time each route against the stand-ins.
+
+    Accuracy is the classifier's against the labels. Each query is then run
+    through the route it was given, with every query going to the Strands
+    agent as the baseline, and the latency and Bedrock work of each route is
+    reported.
+    """
+    queries = load_labeled_queries(args.queries)
+    rules = QueryRouter(mode="rules")
+    misrouted = []
+    by_route = {
+        route: {"labeled": 0, "routed": 0, "correct": 0}
+        for route in (ROUTE_KB, ROUTE_AGENT)
+    }
+    for template, expected in queries:
+        query = template.format(claim=1234, other=5678)
+        route = rules.route(query)
+        by_route[expected]["labeled"] += 1
+        by_route[route]["routed"] += 1
+        if route == expected:
+            by_route[route]["correct"] += 1
+        else:
+            misrouted.append({"query": query, "expected": expected})
+    for counts in by_route.values():
+        counts["precision"] = counts["correct"] / max(1, counts["routed"])
+        counts["recall"] = counts["correct"] / max(1, counts["labeled"])
+    report = {
+        "queries": len(queries),
+        "accuracy": 1 - len(misrouted) / len(queries),
+        "by_route": by_route,
+        "misrouted": misrouted,
+    }
+
+    timings = ReplayTimings(
+        agent_ttfb_secs=args.agent_ttfb,
+        agent_tokens_per_sec=args.agent_tokens_per_sec,
+        kb_retrieve_secs=args.kb_latency,
+    )
+    # Distinct claims, so no retrieve is answered from the KB cache
+    claim_ids = itertools.count(1000)
+    for mode in ("agent", "rules"):
+        router = QueryRouter(mode=mode)
+        pool = ReplayClientPool(timings, size=1)
+        pool.warm()
+        strands_agent = agent.StrandsAgent(clients=pool)
+        executor = AgentExecutor(max_workers=1)
+        start_time = time.monotonic()
+        for template, _ in queries:
+            query = template.format(claim=next(claim_ids), other=next(claim_ids))
+            route = router.route(query)
+            query_start = time.monotonic()
+            if route == ROUTE_KB:
+                await strands_agent.bedrock_client.query_knowledge_base(query)
+            else:
+                await executor.run(strands_agent.process_query, query)
+            router.record(route, time.monotonic() - query_start)
+        report[mode] = {
+            "total_secs": time.monotonic() - start_time,
+            "routes": router.stats(),
+            "bedrock": pool.counters.report(),
+        }
+    return report
+
+
+class ThrottlingBedrock:
+    """Stand-in Bedrock that throttles each API and model above a request rate"""
+
+    def __init__(self, rps: float, latency_secs: float):
+        self.rps = rps
+        self.latency_secs = latency_secs
+        self._lock = threading.Lock()
+        # (api, model) -> when each request in the last second was accepted
+        self._accepted = {}
+        self.requests = 0
+        self.throttled = 0
+
+    def _accept(self, api: str, model: str):
+        with self._lock:
+            now = time.monotonic()
+            window = self._accepted.setdefault((api, model), deque())
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if len(window) >= self.rps:
+                self.throttled += 1
+                raise ClientError(
+                    {
+                        "Error": {
+                            "Code": "ThrottlingException",
+                            "Message": "Rate exceeded",
+                        }
+                    },
+                    api,
+                )
+            window.append(now)
+            self.requests += 1
+
+    def call(self, api: str, model: str):
+        self._accept(api, model)
+        time.sleep(self.latency_secs)
+
+    async def call_async(self, api: str, model: str):
+        self._accept(api, model)
+        await asyncio.sleep(self.latency_secs)
+
+
+async def _limited_session(
+    args, bedrock: ThrottlingBedrock, limiter: Optional[BedrockLimiter], pools
+) -> list:
+    """One caller's turns, each making the Bedrock calls a KB lookup turn makes.
+
+    Returns (turn number, seconds, whether it failed) for each turn.
+    """
+    retrieve_pool, agent_pool = pools
+    loop = asyncio.get_running_loop()
+
+    async def llm(priority: int):
+        call = lambda: bedrock.call_async("converse_stream", "claude")
+        if limiter:
+            return await limiter.call_async("converse_stream", "claude", call, priority)
+        return await call()
+
+    async def retrieve():
+        call = lambda: bedrock.call("retrieve", "kb")
+        if limiter:
+            future = limiter.submit(
+                retrieve_pool, "retrieve", "kb", call, PRIORITY_IN_TURN
+            )
+        else:
+            future = retrieve_pool.submit(call)
+        return await asyncio.wrap_future(future)
+
+    async def agent_model():
+        call = lambda: bedrock.call("converse_stream", "nova")
+        if limiter:
+            return await loop.run_in_executor(
+                agent_pool,
+                limiter.call,
+                "converse_stream",
+                "nova",
+                call,
+                PRIORITY_IN_TURN,
+            )
+        return await loop.run_in_executor(agent_pool, call)
+
+    turns = []
+    for turn in range(args.turns):
+        start_time = time.monotonic()
+        try:
+            await llm(PRIORITY_NEW_SESSION if turn == 0 else PRIORITY_NEW_TURN)
+            await retrieve()
+            await agent_model()
+            await agent_model()
+            # The LLM's answer from the function call's result
+            await llm(PRIORITY_IN_TURN)
+            failed = False
+        except ClientError:
+            failed = True
+        turns.append((turn, time.monotonic() - start_time, failed))
+        await asyncio.sleep(args.think_secs)
+    return turns
+
+
+async def bedrock_limiter(args) -> dict:
+    """Sessions arriving in a spike against a stand-in Bedrock that throttles.
+
+    Each turn makes the calls a claim lookup through the Strands agent makes:
+    the LLM, a retrieve, two agent model calls and the LLM again. Without the
+    limiter a throttled call fails the turn, as it does in the bot. The limiter
+    is run with its limit set to the stand-in's real one, and to twice that,
+    which it has to adapt down from.
+    """
+    report = {"sessions": args.sessions, "throttle_rps": args.throttle_rps}
+    modes = {
+        "unlimited": None,
+        "limiter": args.throttle_rps,
+        "limiter_overestimated": args.throttle_rps * 2,
+    }
+    for mode, limit in modes.items():
+        bedrock = ThrottlingBedrock(args.throttle_rps, args.latency)
+        limiter = BedrockLimiter(default_rps=limit) if limit else None
+        pools = (
+            ThreadPoolExecutor(max_workers=8),
+            ThreadPoolExecutor(max_workers=args.sessions),
+        )
+
+        async def session(index: int):
+            await asyncio.sleep(args.ramp * index / args.sessions)
+            return await _limited_session(args, bedrock, limiter, pools)
+
+        start_time = time.monotonic()
+        sessions = await asyncio.gather(*(session(i) for i in range(args.sessions)))
+        turns = [turn for turns in sessions for turn in turns]
+        for pool in pools:
+            pool.shutdown()
+
+        def latencies(first: bool) -> dict:
+            values = sorted(
+                secs
+                for turn, secs, failed in turns
+                if not failed and (turn == 0) == first
+            )
+            if not values:
+                return {}
+            return {"p50": percentile(values, 50), "p95": percentile(values, 95)}
+
+        report[mode] = {
+            "total_secs": time.monotonic() - start_time,
+            "turns": len(turns),
+            "failed_turns": sum(1 for _, _, failed in turns if failed),
+            "bedrock_requests": bedrock.requests,
+            "bedrock_throttled": bedrock.throttled,
+            "first_turn_secs": latencies(first=True),
+            "later_turn_secs": latencies(first=False),
+            "limiter": limiter.stats() if limiter else None,
+        }
+    return report
+
+
+class StandInConnection:
+    """Deepgram websocket stand-in, which ignores the audio it's sent"""
+
+    open_connections = 0
+
+    def __init__(self):
+        self.connected = True
+        StandInConnection.open_connections += 1
+
+    async def is_connected(self) -> bool:
+        return self.connected
+
+    async def send(self, audio: bytes):
+        pass
+
+    async def finalize(self):
+        pass
+
+    async def finish(self):
+        if self.connected:
+            self.connected = False
+            StandInConnection.open_connections -= 1
+
+
+class StandInDeepgramSTTService(PreconnectedDeepgramSTTService):
+    """PreconnectedDeepgramSTTService whose websocket takes connect_secs to open"""
+
+    def __init__(self, connect_secs: float, **kwargs):
+        super().__init__(api_key="replay", **kwargs)
+        self._connect_secs = connect_secs
+
+    async def _connect(self):
+        await asyncio.sleep(self._connect_secs)
+        self._connection = StandInConnection()
+
+
+async def _warm_start_session(
+    args, create_services: Callable[[], tuple], sessions: PreparedSessions
+) -> float:
+    """Offer a session, and return how long it took to the bot's first audio"""
+    offered_at = time.monotonic()
+    key = uuid.uuid4().hex
+    sessions.start(key)
+    # Negotiating the offer, before the answer goes back and the bot starts
+    await asyncio.sleep(args.signaling)
+
+    services = await sessions.take(key) or await asyncio.to_thread(create_services)
+    transport = ReplayTransport(
+        ReplaySession([], 16000),
+        TransportParams(
+            audio_in_enabled=True,
+            audio_out_enabled=True,
+            audio_in_sample_rate=16000,
+            vad_analyzer=EnergyVADAnalyzer(),
+        ),
+        turn_gap_secs=0.0,
+        response_timeout_secs=10.0,
+        connect_secs=args.connect,
+    )
+    task = agent.create_pipeline_task(transport, *services)
+    await PipelineRunner(handle_sigint=False).run(task)
+    return transport.output().first_audio_at - offered_at
+
+
+async def warm_start(args) -> dict:
+    """Connect-to-first-audio of sessions with and without prepared services.
+
+    This is the archive dev server's path (lib/cloud.py), which starts
+    preparing a session as its offer arrives; agent.py, under pipecat's
+    runner, only starts once the offer is answered. Each session's offer takes
+    --signaling seconds to negotiate and its transport --connect seconds to
+    connect to the caller, and the stand-in Deepgram STT --stt-connect seconds
+    to open its websocket. Prepared sessions start building their services and
+    connecting the STT as the offer arrives. --abandoned offers are prepared and never taken, to check
+    they're released after --prepare-timeout.
+    """
+    # The greeting comes from the TTS cache
+    timings = ReplayTimings(tts_ttfb_secs=0.0)
+    pool = ReplayClientPool(timings, size=agent.BEDROCK_CLIENTS.size)
+    pool.warm()
+
+    def create_services() -> tuple:
+        return (
+            agent.StrandsAgent(clients=pool),
+            StandInDeepgramSTTService(args.stt_connect),
+            ReplayTTSService(timings, sample_rate=24000),
+            ReplayBedrockLLMService(timings, aws_region="us-east-1"),
+        )
+
+    # Built off the loop, as the archive bot's _prepare_session() does
+    async def prepare() -> tuple:
+        services = await asyncio.to_thread(create_services)
+        services[1].preconnect()
+        return services
+
+    async def release(services: tuple):
+        await services[1].release()
+
+    report = {"sessions": args.sessions}
+    for mode, max_pending in (
+        ("cold", 0),
+        ("prepared", args.sessions + args.abandoned),
+    ):
+        sessions = PreparedSessions(
+            prepare, release, timeout_secs=args.prepare_timeout, max_pending=max_pending
+        )
+
+        async def staggered(index: int) -> float:
+            await asyncio.sleep(args.ramp * index / args.sessions)
+            return await _warm_start_session(args, create_services, sessions)
+
+        if max_pending:
+            for _ in range(args.abandoned):
+                sessions.start(uuid.uuid4().hex)
+        first_audio = sorted(
+            await asyncio.gather(*(staggered(i) for i in range(args.sessions)))
+        )
+        # Long enough for the abandoned preparations to be released
+        await asyncio.sleep(max(0.0, args.prepare_timeout - args.ramp) + 0.5)
+        stats = sessions.stats()
+        del stats["first_audio_secs"]
+        report[mode] = {
+            "first_audio_secs": {
+                "p50": percentile(first_audio, 50),
+                "p95": percentile(first_audio, 95),
+                "max": first_audio[-1],
+            },
+            "stt_connections_open": StandInConnection.open_connections,
+            "prepared_sessions": stats,
+        }
+    return report
+
+
+async def thinking_bridge(args) -> dict:
+    """Stream token events from a stand-in agent thread to the pipeline (archive bot).
+
+    A thread plays the part of the Strands callback handler, emitting
+    --events-per-sec one-word token events, with a model message ending every
+    --message-tokens. They're delivered to a stand-in for push_frame that takes
+    --send-ms per message, one message per event as the bot used to send them,
+    then through a ThinkingBridge with each --windows-ms coalescing window.
+    """
+    sys.path.insert(0, os.path.abspath(args.bot_dir))
+    from strands_agent import ThinkingBridge
+
+    words = ["the", "weather", "near", "landmark", "is", "looking", "nice", "today"]
+
+    def produce(put, end_message) -> dict:
+        interval = 1 / args.events_per_sec
+        start_time = time.monotonic()
+        events = 0
+        while time.monotonic() - start_time < args.duration:
+            put(f" {words[events % len(words)]}")
+            events += 1
+            if events % args.message_tokens == 0:
+                end_message()
+            # Paced in bursts, since sleeps this short aren't precise
+            ahead = start_time + events * interval - time.monotonic()
+            if ahead > 0.001:
+                time.sleep(ahead)
+        end_message()
+        return {"events": events, "secs": time.monotonic() - start_time}
+
+    async def measure(mode: str, deliver) -> dict:
+        loop = asyncio.get_running_loop()
+        lag = LoopLagSampler(interval_secs=0.01)
+        lag_task = asyncio.create_task(lag.run())
+        sent = {"messages": 0, "chars": 0}
+
+        async def send(message: str):
+            sent["messages"] += 1
+            sent["chars"] += len(message)
+            await asyncio.sleep(args.send_ms / 1000)
+
+        put, end_message, drained, stats = deliver(loop, send)
+        produced = await loop.run_in_executor(None, produce, put, end_message)
+        stopped_at = time.monotonic()
+        await drained()
+        lag_task.cancel()
+        return {
+            "mode": mode,
+            "events_per_sec": produced["events"] / produced["secs"],
+            # How far delivery fell behind the agent
+            "drain_secs": time.monotonic() - stopped_at,
+            "messages_sent": sent["messages"],
+            "events_per_message": produced["events"] / max(1, sent["messages"]),
+            "loop_lag": lag.report(),
+            **stats(),
+        }
+
+    def per_event(loop, send):
+        queue = asyncio.Queue()
+
+        async def forward():
+            while True:
+                message = await queue.get()
+                await send(message.strip())
+                queue.task_done()
+
+        task = asyncio.create_task(forward())
+
+        async def drained():
+            try:
+                await asyncio.wait_for(queue.join(), args.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+            task.cancel()
+
+        return (
+            lambda text: loop.call_soon_threadsafe(queue.put_nowait, text),
+            lambda: None,
+            drained,
+            lambda: {"undelivered_events": queue.qsize()},
+        )
+
+    def bridged(window_secs: float):
+        def deliver(loop, send):
+            bridge = ThinkingBridge(send, max_delay_secs=window_secs)
+            task = asyncio.create_task(bridge.run())
+
+            async def drained():
+                while bridge.stats()["buffered_chars"]:
+                    await asyncio.sleep(0.01)
+                task.cancel()
+
+            return bridge.put, bridge.end_message, drained, bridge.stats
+
+        return deliver
+
+    results = [await measure("per-event", per_event)]
+    for window_ms in args.windows_ms:
+        results.append(
+            await measure(f"bridge-{window_ms:g}ms", bridged(window_ms / 1000))
+        )
+    return {
+        "events_per_sec": args.events_per_sec,
+        "send_ms": args.send_ms,
+        "results": results,
+    }
+
+
+def _metric(report: dict, path: tuple) -> Optional[float]:
+    value = report
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def find_regressions(report: dict, baseline: dict, max_regression: float) -> list:
+    """Gated metrics that got worse than the baseline by more than max_regression"""
+    regressions = []
+    for path, noise in _GATED_METRICS.items():
+        current, previous = _metric(report, path), _metric(baseline, path)
+        if current is None or previous is None:
+            continue
+        if current - previous > max(previous * max_regression, noise):
+            regressions.append(f"{'.'.join(path)}: {previous:.4g} -> {current:.4g}")
+    return regressions
+
+
+async def bot_discovery(args) -> dict:
+    """Time a burst of concurrent session starts on the archive dev server.
+
+    Each simulated offer resolves the bot module the way lib/cloud.py's
+    request handlers do, first by scanning for and executing the bot file on
+    every request (as it used to), then from the module resolved at startup.
+    Resolution blocks the event loop, so later offers in a burst wait for the
+    earlier ones.
+    """
+    sys.path.insert(0, os.path.abspath(args.bot_dir))
+    os.chdir(args.bot_dir)
+    from lib import cloud
+
+    async def burst(resolve) -> dict:
+        start_time = time.monotonic()
+
+        async def offer() -> float:
+            await asyncio.sleep(0)
+            resolve()
+            return time.monotonic() - start_time
+
+        waits = sorted(await asyncio.gather(*(offer() for _ in range(args.offers))))
+        return {
+            "p50": percentile(waits, 50),
+            "p95": percentile(waits, 95),
+            "max": waits[-1],
+        }
+
+    rescanning = await burst(cloud._find_bot_module)
+    cloud._preload(args.transport)
+    cached = await burst(cloud._get_bot_module)
+    return {"offers": args.offers, "rescanning": rescanning, "cached": cached}
+
+
+def _rss_mb() -> float:
+    """Current (not peak) resident set size, on Linux"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+
+
+def vad_scaling(args) -> dict:
+    """Measure Silero VAD memory and throughput against the number of sessions.
+
+    For each session count, compares one SileroVADAnalyzer per session (its own
+    model), SharedSileroVADAnalyzer (one model, per-stream state), and the
+    shared model analyzing every stream's chunk in one batched call. Each
+    session analyzes --frames chunks of noise.
+    """
+    sample_rate = 16000
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(512 * args.frames) * 3000).astype(np.int16)
+    chunks = audio.reshape(args.frames, 512)
+    float_chunks = chunks.astype(np.float32) / 32768.0
+
+    def per_stream(make_analyzer, sessions: int) -> dict:
+        rss_before = _rss_mb()
+        start_time = time.monotonic()
+        analyzers = [make_analyzer() for _ in range(sessions)]
+        for analyzer in analyzers:
+            analyzer.set_sample_rate(sample_rate)
+        load_secs = time.monotonic() - start_time
+        rss_mb = _rss_mb() - rss_before
+
+        start_time = time.monotonic()
+        for chunk in chunks:
+            buffer = chunk.tobytes()
+            for analyzer in analyzers:
+                analyzer.voice_confidence(buffer)
+        elapsed = time.monotonic() - start_time
+        return {
+            "load_secs": load_secs,
+            "rss_mb": rss_mb,
+            "frames_per_sec": sessions * args.frames / elapsed,
+        }
+
+    def batched(sessions: int) -> dict:
+        streams = [SileroStreamState() for _ in range(sessions)]
+        start_time = time.monotonic()
+        for chunk in float_chunks:
+            run_batch(streams, [chunk] * sessions, sample_rate)
+        elapsed = time.monotonic() - start_time
+        return {"frames_per_sec": sessions * args.frames / elapsed}
+
+    # Load the shared model up front so it isn't counted against one session
+    # count; each private model is counted
+    SharedSileroVADAnalyzer()
+    report = {}
+    for sessions in args.sessions:
+        report[sessions] = {
+            "shared": per_stream(SharedSileroVADAnalyzer, sessions),
+            "batched": batched(sessions),
+            "private": per_stream(SileroVADAnalyzer, sessions),
+        }
+    return {"frames_per_session": args.frames, "sessions": report}
+
+
+def vad_engine(args) -> dict:
+    """Compare per-stream and batched VAD CPU use with real-time streams.
+
+    Each simulated stream is a thread that analyzes a 32ms chunk every 32ms,
+    from a random start offset, the way a transport's executor thread does.
+    Reports the process's CPU use over --duration seconds and how long each
+    voice_confidence() call took, which for the batched engine includes waiting
+    for its batch (bounded by --max-wait-ms).
+    """
+    sample_rate = 16000
+    chunk_secs = 512 / sample_rate
+    rng = np.random.default_rng(0)
+    buffer = (rng.standard_normal(512) * 3000).astype(np.int16).tobytes()
+
+    def run_streams(make_analyzer, streams: int) -> dict:
+        analyzers = [make_analyzer() for _ in range(streams)]
+        for analyzer in analyzers:
+            analyzer.set_sample_rate(sample_rate)
+        offsets = rng.uniform(0, chunk_secs, streams)
+        call_secs = [[] for _ in range(streams)]
+        start_time = time.monotonic() + 0.1
+
+        def stream(index: int):
+            chunk = 0
+            while True:
+                deadline = start_time + offsets[index] + chunk * chunk_secs
+                if deadline - start_time > args.duration:
+                    return
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                called_at = time.monotonic()
+                analyzers[index].voice_confidence(buffer)
+                call_secs[index].append(time.monotonic() - called_at)
+                chunk += 1
+
+        threads = [threading.Thread(target=stream, args=(i,)) for i in range(streams)]
+        cpu_before = time.process_time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        cpu_secs = time.process_time() - cpu_before
+
+        calls = sorted(secs for stream_secs in call_secs for secs in stream_secs)
+        return {
+            "cpu_percent": 100 * cpu_secs / args.duration,
+            "chunks": len(calls),
+            "call_p50": percentile(calls, 50),
+            "call_p99": percentile(calls, 99),
+            "call_max": calls[-1],
+        }
+
+    report = {}
+    for streams in args.streams:
+        engine = BatchedVADEngine(max_wait_secs=args.max_wait_ms / 1000)
+        report[streams] = {
+            "per_stream": run_streams(SharedSileroVADAnalyzer, streams),
+            "batched": {
+                **run_streams(lambda: BatchedSileroVADAnalyzer(engine=engine), streams),
+                "engine": engine.stats(),
+            },
+        }
+    return {
+        "duration_secs": args.duration,
+        "max_wait_ms": args.max_wait_ms,
+        "streams": report,
+    }
+
+
+def load_labeled_calls(audio_dir: str) -> list:
+    """Read calls from audio_dir/*.wav, with the caller's turns in .json files.
+
+    Each <call>.json has {"turns": [[start, end], ...]}, in seconds, marking
+    where each of the caller's turns starts and ends; pauses within a turn are
+    part of it.
+    """
+    calls = []
+    for path in sorted(glob.glob(os.path.join(audio_dir, "*.wav"))):
+        with wave.open(path, "rb") as f:
+            if f.getnchannels() != 1 or f.getsampwidth() != 2:
+                raise ValueError(f"{path}: expected 16-bit mono audio")
+            sample_rate = f.getframerate()
+            audio = f.readframes(f.getnframes())
+        with open(f"{os.path.splitext(path)[0]}.json") as f:
+            turns = [tuple(turn) for turn in json.load(f)["turns"]]
+        calls.append((audio, sample_rate, turns))
+
+    if not calls:
+        raise ValueError(f"No .wav files in {audio_dir}")
+    return calls
+
+
+def synthetic_call(turns: int, seed: int, sample_rate: int = 16000) -> tuple:
+    """Turns of one to three noise-burst phrases, with pauses inside turns"""
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+
+    def silence(secs: float) -> np.ndarray:
+        return np.zeros(int(sample_rate * secs), dtype=np.int16)
+
+    chunks = [silence(1.0)]
+    labels = []
+    position = 1.0
+    for _ in range(turns):
+        start = position
+        for phrase in range(rng.randint(1, 3)):
+            if phrase:
+                pause = rng.uniform(0.1, 0.8)
+                chunks.append(silence(pause))
+                position += pause
+            secs = rng.uniform(0.6, 1.8)
+            samples = noise.normal(0, 6000, int(sample_rate * secs)).clip(-32768, 32767)
+            chunks.append(samples.astype(np.int16))
+            position += secs
+        labels.append((start, position))
+        # The bot's answer
+        chunks.append(silence(2.0))
+        position += 2.0
+    return np.concatenate(chunks).tobytes(), sample_rate, labels
+
+
+def detect_turn_ends(analyzer: VADAnalyzer, audio: bytes, sample_rate: int) -> list:
+    """Times at which analyzer decides the user stopped speaking"""
+    analyzer.set_sample_rate(sample_rate)
+    chunk_bytes = int(sample_rate * CHUNK_SECS) * 2
+    speaking = False
+    ends = []
+    for offset in range(0, len(audio), chunk_bytes):
+        state = analyzer.analyze_audio(audio[offset : offset + chunk_bytes])
+        if state == VADState.SPEAKING:
+            speaking = True
+        elif state == VADState.QUIET and speaking:
+            speaking = False
+            ends.append((offset + chunk_bytes) / 2 / sample_rate)
+    return ends
+
+
+def evaluate_profile(profile: TurnTakingProfile, calls: list, vad: str) -> dict:
+    """End-of-turn latency and false interruptions of profile over calls.
+
+    vad_stop is how long after the end of each turn VAD decided the user
+    stopped speaking. turn_end estimates when the LLM gets the turn, which
+    also waits for Deepgram's final transcript: at the earliest endpointing_ms
+    after the end of speech. A false interruption is VAD deciding the user
+    stopped during a pause inside a turn.
+    """
+    vad_stops = []
+    false_interruptions = 0
+    missed = 0
+    turn_count = 0
+    for audio, sample_rate, turns in calls:
+        if vad == "silero":
+            analyzer = SharedSileroVADAnalyzer(params=profile.vad_params)
+        else:
+            analyzer = EnergyVADAnalyzer(params=profile.vad_params)
+        ends = detect_turn_ends(analyzer, audio, sample_rate)
+
+        turn_count += len(turns)
+        for index, (start, end) in enumerate(turns):
+            next_start = turns[index + 1][0] if index + 1 < len(turns) else math.inf
+            false_interruptions += sum(1 for t in ends if start < t < end)
+            detected = [t for t in ends if end <= t < next_start]
+            if detected:
+                vad_stops.append(detected[0] - end)
+            else:
+                missed += 1
+
+    vad_stops.sort()
+    turn_ends = sorted(max(stop, profile.endpointing_ms / 1000) for stop in vad_stops)
+    return {
+        "vad_stop_p50": percentile(vad_stops, 50) if vad_stops else None,
+        "vad_stop_p95": percentile(vad_stops, 95) if vad_stops else None,
+        "turn_end_p50": percentile(turn_ends, 50) if turn_ends else None,
+        "turn_end_p95": percentile(turn_ends, 95) if turn_ends else None,
+        "false_interruptions": false_interruptions,
+        "false_interruption_rate": false_interruptions / max(1, turn_count),
+        "missed_turns": missed,
+    }
+
+
+def turn_taking(args) -> dict:
+    if args.audio:
+        calls = load_labeled_calls(args.audio)
+    else:
+        calls = [synthetic_call(args.turns, seed=i) for i in range(args.calls)]
+    vad = args.vad or ("silero" if args.audio else "energy")
+
+    return {
+        "calls": len(calls),
+        "turns": sum(len(turns) for _, _, turns in calls),
+        "vad": vad,
+        "profiles": {
+            name: evaluate_profile(TURN_TAKING_PROFILES[name], calls, vad)
+            for name in args.profiles
+        },
+    }
+
+
+#
+# Knowledge base context packing
+#
+
+_POLICYHOLDERS = ["Maria Lopez", "James Carter", "Priya Shah", "Tom Becker"]
+_VEHICLES = ["2019 Honda Civic", "2021 Ford F-150", "2017 Subaru Outback"]
+_DAMAGE = ["rear bumper repair", "windshield replacement", "front quarter panel"]
+_STATUSES = ["open, under review", "approved, awaiting payment", "closed, paid"]
+_CLAIM_NOTES = [
+    "Called the policyholder to confirm the date and location of the loss.",
+    "Photos of the damage were uploaded through the mobile app.",
+    "Police report requested from the county sheriff's office.",
+    "Rental car authorized for up to ten days at the policy limit.",
+    "Body shop submitted a supplement for hidden damage behind the bumper.",
+    "Left a voicemail for the other driver's insurer about liability.",
+    "Liability accepted by the other carrier at one hundred percent.",
+    "Deductible of five hundred dollars will be recovered through subrogation.",
+    "Policyholder asked for an update and was told the review is in progress.",
+    "Inspection scheduled at the preferred repair shop.",
+    "Appraiser reviewed the estimate and agreed with the labor hours.",
+    "Payment issued directly to the repair shop by electronic transfer.",
+]
+_GENERAL_DOCS = [
+    (
+        "What are your office hours?",
+        "Tri-County Insurance customer service. Our claims line is staffed "
+        "around the clock for reporting a new loss. For everything else, our "
+        "office is open weekdays from 8 a.m. to 6 p.m. and Saturdays from 9 "
+        "a.m. to noon, and is closed on public holidays. Calls outside those "
+        "hours go to voicemail and are returned the next business day.",
+        ["weekdays from 8 a.m. to 6 p.m."],
+    ),
+    (
+        "How do I file a windshield claim?",
+        "Glass claims. Chipped or cracked windshields are covered under "
+        "comprehensive coverage. To file a windshield claim, call the claims "
+        "line or use the mobile app, and choose glass damage. A repair of a "
+        "chip smaller than a quarter has no deductible. A full replacement is "
+        "subject to your comprehensive deductible, and is done by an approved "
+        "glass shop, which can usually come to you within two business days.",
+        ["A repair of a chip smaller than a quarter has no deductible."],
+    ),
+]
+
+
+def _chunk_words(text: str, chunk_words: int, overlap_words: int) -> list:
+    """Split text into overlapping chunks, the way the KB's fixed-size chunking does"""
+    words = text.split()
+    step = chunk_words - overlap_words
+    return [
+        " ".join(words[start : start + chunk_words])
+        for start in range(0, max(1, len(words) - overlap_words), step)
+    ]
+
+
+def _claim_document(claim_id: str, rng: random.Random) -> tuple:
+    status = f"Status: {rng.choice(_STATUSES)}."
+    estimate = f"Estimate: ${rng.randint(8, 60) * 100:,} for {rng.choice(_DAMAGE)}."
+    sentences = [
+        f"Claim ID {claim_id}. Policyholder: {rng.choice(_POLICYHOLDERS)}.",
+        f"Vehicle: {rng.choice(_VEHICLES)}.",
+        status,
+        estimate,
+    ]
+    for note in rng.sample(_CLAIM_NOTES, rng.randint(6, len(_CLAIM_NOTES))):
+        sentences.append(f"Note {rng.randint(1, 28)} March: {note}")
+    next_step = f"Next step: adjuster to call back by {rng.randint(1, 28)} April."
+    sentences.append(next_step)
+    return " ".join(sentences), [status, estimate, next_step]
+
+
+def _result(text: str, score: float, uri: str) -> dict:
+    return {
+        "content": {"text": text},
+        "score": round(score, 3),
+        "location": {"s3Location": {"uri": uri}},
+    }
+
+
+def synthetic_kb_fixtures(
+    count: int,
+    seed: int,
+    chunk_words: int = 120,
+    overlap_words: int = 25,
+    max_results: int = 10,
+) -> list:
+    """Retrieve results shaped like Bedrock's for claim and general queries.
+
+    A claim's document is split into overlapping chunks, some of which come
+    back twice (HYBRID search finds them in both the text and the CSV export
+    of the claims system), followed by weaker matches from other claims.
+    Each fixture lists facts an answer needs, to check they survive packing.
+    """
+    rng = random.Random(seed)
+    fixtures = []
+    for index in range(count):
+        if index % 4 == 3:
+            query, text, facts = _GENERAL_DOCS[index // 4 % len(_GENERAL_DOCS)]
+            chunks = _chunk_words(text, chunk_words, overlap_words)
+            results = [
+                _result(chunk, 0.7 - 0.05 * i, "s3://kb/faq.txt")
+                for i, chunk in enumerate(chunks)
+            ]
+            fixtures.append(
+                {"query": query, "kind": "general", "results": results, "facts": facts}
+            )
+            continue
+
+        claim_id = f"CLM-{rng.randint(10000, 99999)}"
+        text, facts = _claim_document(claim_id, rng)
+        results = []
+        for i, chunk in enumerate(_chunk_words(text, chunk_words, overlap_words)):
+            score = 0.85 - 0.05 * i + rng.uniform(-0.02, 0.02)
+            results.append(_result(chunk, score, f"s3://kb/claims/{claim_id}.txt"))
+            if rng.random() < 0.5:
+                results.append(
+                    _result(chunk, score - 0.01, "s3://kb/exports/claims.csv")
+                )
+        while len(results) < max_results:
+            other_text, _ = _claim_document(f"CLM-{rng.randint(10000, 99999)}", rng)
+            chunk = _chunk_words(other_text, chunk_words, overlap_words)[0]
+            results.append(_result(chunk, rng.uniform(0.3, 0.45), "s3://kb/claims/"))
+        results.sort(key=lambda r: r["score"], reverse=True)
+        fixtures.append(
+            {
+                "query": f"claim ID {claim_id}",
+                "kind": "claim",
+                "results": results[:max_results],
+                "facts": facts,
+            }
+        )
+    return fixtures
+
+
+def legacy_kb_format(query: str, results: list) -> str:
+    """query_knowledge_base's formatting before ContextPacker"""
+    formatted_response = f"Found {len(results)} result(s) for your query:\n\n"
+    for i, result in enumerate(results[:5], 1):
+        content = result.get("content", {}).get("text", "")
+        score = result.get("score", 0)
+        if content:
+            content_length = (
+                1000 if any(k in query.lower() for k in ["claim", "id"]) else 200
+            )
+            truncated_content = content[:content_length]
+            if len(content) > content_length:
+                truncated_content += "..."
+            formatted_response += f"{i}. {truncated_content}\n"
+            formatted_response += f"   (Relevance: {score:.2f})\n\n"
+    return formatted_response.strip()
+
+
+def _format_report(fixtures: list, outputs: list, format_secs: float) -> dict:
+    tokens = sorted(estimate_tokens(text) for text in outputs)
+    facts = [fact for fixture in fixtures for fact in fixture.get("facts", [])]
+    kept = sum(
+        1
+        for fixture, text in zip(fixtures, outputs)
+        for fact in fixture.get("facts", [])
+        if fact in text
+    )
+    return {
+        "tokens_mean": sum(tokens) / len(tokens),
+        "tokens_p50": percentile(tokens, 50),
+        "tokens_max": tokens[-1],
+        "facts_kept": kept / len(facts) if facts else None,
+        "format_us": format_secs / len(fixtures) * 1e6,
+    }
+
+
+def kb_context(args) -> dict:
+    """Tokens the search tool's result costs, before and after ContextPacker.
+
+    Every model call in the agent run after the search reads the result, so a
+    token saved is saved model_calls times; ttfb_saved_secs estimates what
+    that's worth at the model's prefill rate.
+    """
+    if args.fixtures:
+        with open(args.fixtures) as f:
+            fixtures = json.load(f)
+    else:
+        fixtures = synthetic_kb_fixtures(args.count, args.seed)
+
+    def run(format_result) -> tuple:
+        start_time = time.perf_counter()
+        outputs = [format_result(f["query"], f["results"]) for f in fixtures]
+        return outputs, time.perf_counter() - start_time
+
+    legacy_outputs, legacy_secs = run(legacy_kb_format)
+    legacy = _format_report(fixtures, legacy_outputs, legacy_secs)
+    report = {"fixtures": len(fixtures), "legacy": legacy, "budgets": {}}
+
+    def pack(budget: int, min_relative_score: float) -> dict:
+        packer = ContextPacker(
+            token_budget=budget, min_relative_score=min_relative_score
+        )
+        outputs, secs = run(lambda query, results: packer.pack(results).text)
+        packed = _format_report(fixtures, outputs, secs)
+        saved = legacy["tokens_mean"] - packed["tokens_mean"]
+        packed["by_kind"] = {
+            kind: {
+                "legacy_tokens_mean": _mean_tokens(legacy_outputs, fixtures, kind),
+                "packed_tokens_mean": _mean_tokens(outputs, fixtures, kind),
+            }
+            for kind in sorted({f.get("kind", "") for f in fixtures})
+        }
+        packed["tokens_saved_mean"] = saved
+        packed["tokens_saved_pct"] = 100 * saved / legacy["tokens_mean"]
+        packed["ttfb_saved_secs"] = (
+            saved * args.model_calls / args.prefill_tokens_per_sec
+        )
+        packed["packer"] = packer.stats()
+        return packed
+
+    # Packing alone, as agent.py does by default, then with results scoring
+    # well below the best one also left out, which saves tokens separately
+    for budget in args.budgets:
+        packed = pack(budget, 0.0)
+        if args.min_relative_score:
+            filtered = pack(budget, args.min_relative_score)
+            filtered["min_relative_score"] = args.min_relative_score
+            filtered["tokens_saved_by_filter_mean"] = (
+                packed["tokens_mean"] - filtered["tokens_mean"]
+            )
+            packed["score_filtered"] = filtered
+        report["budgets"][str(budget)] = packed
+    return report
+
+
+def _mean_tokens(outputs: list, fixtures: list, kind: str) -> float:
+    tokens = [
+        estimate_tokens(text)
+        for text, fixture in zip(outputs, fixtures)
+        if fixture.get("kind", "") == kind
+    ]
+    return sum(tokens) / len(tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="Replay scripted calls through the agent pipeline"
+    )
+    replay_parser.add_argument("--sessions", type=int, default=10)
+    replay_parser.add_argument(
+        "--ramp", type=float, default=5.0, help="Seconds over which sessions start"
+    )
+    replay_parser.add_argument(
+        "--audio", help="Directory of 16-bit mono WAV utterances with .txt transcripts"
+    )
+    replay_parser.add_argument(
+        "--turns", type=int, default=4, help="Synthetic utterances per session"
+    )
+    replay_parser.add_argument(
+        "--vad",
+        choices=["silero", "energy"],
+        help="Default: silero for --audio, energy for synthetic utterances",
+    )
+    replay_parser.add_argument("--turn-gap", type=float, default=0.5)
+    replay_parser.add_argument("--response-timeout", type=float, default=15.0)
+    replay_parser.add_argument("--stt-final-latency", type=float, default=0.15)
+    replay_parser.add_argument("--llm-ttfb", type=float, default=0.4)
+    replay_parser.add_argument("--llm-tokens-per-sec", type=float, default=60.0)
+    replay_parser.add_argument("--agent-ttfb", type=float, default=0.5)
+    replay_parser.add_argument("--agent-tokens-per-sec", type=float, default=80.0)
+    replay_parser.add_argument("--kb-latency", type=float, default=0.3)
+    replay_parser.add_argument("--tts-ttfb", type=float, default=0.2)
+    replay_parser.add_argument(
+        "--compare-prefetch",
+        action="store_true",
+        help="Replay the sessions without and with the KB prefetcher",
+    )
+    replay_parser.add_argument("--output", help="Write the report to this file")
+    replay_parser.add_argument("--baseline", help="Report to check for regressions")
+    replay_parser.add_argument("--max-regression", type=float, default=0.10)
+    replay_parser.add_argument("--log-level", default="WARNING")
+
+    discovery_parser = subparsers.add_parser(
+        "bot-discovery",
+        help="Time bot module resolution under a burst of offers (archive server)",
+    )
+    discovery_parser.add_argument("--bot-dir", default="archive/july-2025")
+    discovery_parser.add_argument("--offers", type=int, default=20)
+    discovery_parser.add_argument("--transport", default="webrtc")
+    discovery_parser.add_argument("--log-level", default="WARNING")
+
+    vad_parser = subparsers.add_parser(
+        "vad", help="Silero VAD memory and throughput per session count"
+    )
+    vad_parser.add_argument(
+        "--sessions",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[1, 10, 50],
+        help="Comma-separated session counts",
+    )
+    vad_parser.add_argument("--frames", type=int, default=200)
+    vad_parser.add_argument("--log-level", default="WARNING")
+
+    vad_engine_parser = subparsers.add_parser(
+        "vad-engine", help="Per-stream vs batched VAD CPU use with real-time streams"
+    )
+    vad_engine_parser.add_argument(
+        "--streams",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[10, 50, 100],
+        help="Comma-separated stream counts",
+    )
+    vad_engine_parser.add_argument("--duration", type=float, default=5.0)
+    vad_engine_parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    vad_engine_parser.add_argument("--log-level", default="WARNING")
+
+    turn_taking_parser = subparsers.add_parser(
+        "turn-taking",
+        help="End-of-turn latency vs false interruptions per turn-taking profile",
+    )
+    turn_taking_parser.add_argument(
+        "--audio", help="Directory of 16-bit mono WAV calls with .json turn labels"
+    )
+    turn_taking_parser.add_argument(
+        "--calls", type=int, default=20, help="Synthetic calls"
+    )
+    turn_taking_parser.add_argument(
+        "--turns", type=int, default=5, help="Caller turns per synthetic call"
+    )
+    turn_taking_parser.add_argument(
+        "--vad",
+        choices=["silero", "energy"],
+        help="Default: silero for --audio, energy for synthetic calls",
+    )
+    turn_taking_parser.add_argument(
+        "--profiles",
+        type=lambda value: value.split(","),
+        default=list(TURN_TAKING_PROFILES),
+        help="Comma-separated profile names",
+    )
+    turn_taking_parser.add_argument("--log-level", default="WARNING")
+
+    thinking_parser = subparsers.add_parser(
+        "thinking-bridge",
+        help="Token event delivery from a stand-in agent thread (archive bot)",
+    )
+    thinking_parser.add_argument("--bot-dir", default="archive/july-2025")
+    thinking_parser.add_argument("--events-per-sec", type=float, default=5000.0)
+    thinking_parser.add_argument("--duration", type=float, default=2.0)
+    thinking_parser.add_argument("--message-tokens", type=int, default=200)
+    thinking_parser.add_argument("--send-ms", type=float, default=1.0)
+    thinking_parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=30.0,
+        help="Seconds to let per-event delivery catch up once the agent stops",
+    )
+    thinking_parser.add_argument(
+        "--windows-ms",
+        type=lambda value: [float(n) for n in value.split(",")],
+        default=[0, 50, 250],
+        help="Comma-separated coalescing windows",
+    )
+    thinking_parser.add_argument("--log-level", default="WARNING")
+
+    interruption_parser = subparsers.add_parser(
+        "interruption",
+        help="Agent work done after an interruption, with and without cancellation",
+    )
+    interruption_parser.add_argument("--runs", type=int, default=10)
+    interruption_parser.add_argument(
+        "--interrupt-after",
+        type=float,
+        default=0.3,
+        help="Seconds into each agent run that the caller interrupts",
+    )
+    interruption_parser.add_argument("--agent-ttfb", type=float, default=0.5)
+    interruption_parser.add_argument("--agent-tokens-per-sec", type=float, default=80.0)
+    interruption_parser.add_argument("--kb-latency", type=float, default=0.3)
+    interruption_parser.add_argument("--log-level", default="WARNING")
+
+    routing_parser = subparsers.add_parser(
+        "routing",
+        help="Query routing accuracy and per-route latency on a labeled query set",
+    )
+    routing_parser.add_argument(
+        "--queries", help='JSON list of {"query", "route"} ("kb" or "agent")'
+    )
+    routing_parser.add_argument("--agent-ttfb", type=float, default=0.5)
+    routing_parser.add_argument("--agent-tokens-per-sec", type=float, default=80.0)
+    routing_parser.add_argument("--kb-latency", type=float, default=0.3)
+    routing_parser.add_argument("--log-level", default="WARNING")
+
+    limiter_parser = subparsers.add_parser(
+        "bedrock-limiter",
+        help="Turns failed and delayed by throttling, with and without the limiter",
+    )
+    limiter_parser.add_argument("--sessions", type=int, default=20)
+    limiter_parser.add_argument(
+        "--ramp", type=float, default=1.0, help="Seconds over which sessions start"
+    )
+    limiter_parser.add_argument("--turns", type=int, default=3)
+    limiter_parser.add_argument("--think-secs", type=float, default=1.0)
+    limiter_parser.add_argument(
+        "--throttle-rps",
+        type=float,
+        default=8.0,
+        help="Requests per second per API and model the stand-in allows",
+    )
+    limiter_parser.add_argument(
+        "--latency", type=float, default=0.2, help="Seconds per stand-in call"
+    )
+    limiter_parser.add_argument("--log-level", default="WARNING")
+
+    warm_start_parser = subparsers.add_parser(
+        "warm-start",
+        help="Connect-to-first-audio with and without preparing sessions' services",
+    )
+    warm_start_parser.add_argument("--sessions", type=int, default=10)
+    warm_start_parser.add_argument(
+        "--ramp", type=float, default=2.0, help="Seconds over which sessions start"
+    )
+    warm_start_parser.add_argument(
+        "--signaling", type=float, default=0.3, help="Seconds to negotiate an offer"
+    )
+    warm_start_parser.add_argument(
+        "--connect",
+        type=float,
+        default=0.3,
+        help="Seconds for the transport to connect to the caller",
+    )
+    warm_start_parser.add_argument(
+        "--stt-connect",
+        type=float,
+        default=0.4,
+        help="Seconds to open the Deepgram websocket",
+    )
+    warm_start_parser.add_argument("--abandoned", type=int, default=3)
+    warm_start_parser.add_argument("--prepare-timeout", type=float, default=2.0)
+    warm_start_parser.add_argument("--log-level", default="WARNING")
+
+    offload_parser = subparsers.add_parser(
+        "kb-offload",
+        help="Audio frame jitter during KB lookups, with retrieves on and off the loop",
+    )
+    offload_parser.add_argument("--sessions", type=int, default=10)
+    offload_parser.add_argument(
+        "--duration", type=float, default=10.0, help="Seconds of lookups per mode"
+    )
+    offload_parser.add_argument(
+        "--lookup-interval",
+        type=float,
+        default=2.0,
+        help="Mean seconds between a session's lookups",
+    )
+    offload_parser.add_argument("--kb-latency", type=float, default=0.3)
+    offload_parser.add_argument("--log-level", default="WARNING")
+
+    race_parser = subparsers.add_parser(
+        "kb-race",
+        help="Latency of sequential and racing HYBRID/SEMANTIC searches",
+    )
+    race_parser.add_argument("--queries", type=int, default=200)
+    race_parser.add_argument("--concurrency", type=int, default=4)
+    race_parser.add_argument(
+        "--delay", type=float, default=0.3, help="Seconds per simulated retrieve"
+    )
+    race_parser.add_argument(
+        "--jitter", type=float, default=0.1, help="Up to this much more per retrieve"
+    )
+    race_parser.add_argument(
+        "--miss-rate",
+        type=float,
+        default=0.3,
+        help="Fraction of claims the HYBRID search doesn't find",
+    )
+    race_parser.add_argument(
+        "--bucket", type=float, default=0.1, help="Histogram bucket width in seconds"
+    )
+    race_parser.add_argument("--log-level", default="WARNING")
+
+    stall_parser = subparsers.add_parser(
+        "agent-stall",
+        help="Other sessions' audio while one runs the Strands agent, on and off the loop",
+    )
+    stall_parser.add_argument("--sessions", type=int, default=5)
+    stall_parser.add_argument(
+        "--agent-sessions",
+        type=int,
+        default=1,
+        help="How many of the sessions run agent calls",
+    )
+    stall_parser.add_argument(
+        "--queries", type=int, default=3, help="Agent calls per agent session"
+    )
+    stall_parser.add_argument("--agent-ttfb", type=float, default=1.0)
+    stall_parser.add_argument("--agent-tokens-per-sec", type=float, default=80.0)
+    stall_parser.add_argument("--kb-latency", type=float, default=0.3)
+    stall_parser.add_argument("--log-level", default="WARNING")
+
+    pool_parser = subparsers.add_parser(
+        "client-pool",
+        help="Session setup time with and without the Bedrock client pool",
+    )
+    pool_parser.add_argument("--sessions", type=int, default=20)
+    pool_parser.add_argument("--pool-size", type=int, default=4)
+    pool_parser.add_argument("--log-level", default="WARNING")
+
+    kb_context_parser = subparsers.add_parser(
+        "kb-context",
+        help="Prompt tokens of search results, formatted as before and packed",
+    )
+    kb_context_parser.add_argument(
+        "--fixtures",
+        help="JSON list of {query, results, facts} (results as returned by retrieve)",
+    )
+    kb_context_parser.add_argument("--count", type=int, default=200)
+    kb_context_parser.add_argument("--seed", type=int, default=0)
+    kb_context_parser.add_argument(
+        "--budgets",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[250, 500, 1000],
+        help="Comma-separated token budgets",
+    )
+    kb_context_parser.add_argument(
+        "--model-calls",
+        type=int,
+        default=1,
+        help="Model calls in the agent run that read the search result",
+    )
+    kb_context_parser.add_argument(
+        "--prefill-tokens-per-sec",
+        type=float,
+        default=2000.0,
+        help="How fast the agent's model reads its prompt",
+    )
+    kb_context_parser.add_argument(
+        "--min-relative-score",
+        type=float,
+        default=0.6,
+        help="Also pack leaving out results below this fraction of the best "
+        "score, reported separately; 0 to skip",
+    )
+    kb_context_parser.add_argument("--log-level", default="WARNING")
+
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    if args.command == "bot-discovery":
+        print(json.dumps(asyncio.run(bot_discovery(args)), indent=2))
+        return
+    if args.command == "vad":
+        print(json.dumps(vad_scaling(args), indent=2))
+        return
+    if args.command == "vad-engine":
+        print(json.dumps(vad_engine(args), indent=2))
+        return
+    if args.command == "turn-taking":
+        print(json.dumps(turn_taking(args), indent=2))
+        return
+    if args.command == "thinking-bridge":
+        print(json.dumps(asyncio.run(thinking_bridge(args)), indent=2))
+        return
+    if args.command == "bedrock-limiter":
+        print(json.dumps(asyncio.run(bedrock_limiter(args)), indent=2))
+        return
+    if args.command == "kb-offload":
+        print(json.dumps(asyncio.run(kb_offload(args)), indent=2))
+        return
+    if args.command == "kb-race":
+        print(json.dumps(asyncio.run(kb_race(args)), indent=2))
+        return
+    if args.command == "kb-context":
+        print(json.dumps(kb_context(args), indent=2))
+        return
+
+    # The stand-ins never send a request, but botocore still wants credentials
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "replay")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "replay")
+
+    if args.command in (
+        "agent-stall",
+        "client-pool",
+        "interruption",
+        "routing",
+        "warm-start",
+    ):
+        command = {
+            "agent-stall": agent_stall,
+            "client-pool": client_pool,
+            "interruption": interruption,
+            "routing": routing,
+            "warm-start": warm_start,
+        }[args.command]
+        # The Strands agents print their output
+        with contextlib.redirect_stdout(sys.stderr):
+            report = asyncio.run(command(args))
+        print(json.dumps(report, indent=2))
+        return
+
+    # Replayed comparisons go to the Strands agent, which prints its output
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(replay(args))
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
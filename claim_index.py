@@ -0,0 +1,291 @@
+"""Local exact-match index from claim IDs to knowledge base document chunks.
+
+Pure claim-ID lookups ("claim ID 1234") don't need a vector search: they can be
+answered straight from the knowledge base's source documents. This module builds
+an index from a local dump of those documents (e.g. `aws s3 sync` of the KB's
+data source) and serves lookups from a memory-mapped file, so every worker
+process on a machine shares the same pages.
+
+Index layout (all integers little-endian)::
+
+    b"CLAIMIX1" | uint32 count | count * (32-byte key, uint64 offset, uint32 length) | blob
+
+Records are sorted by key. Each record points at a UTF-8 JSON list of
+{"text", "source"} chunks in the blob.
+
+Build or incrementally update an index with::
+
+    python claim_index.py build ./kb-docs --index claims.idx
+
+Only source files whose size or mtime changed since the last build are re-read;
+per-file results are kept in a `<index>.manifest.json` sidecar. Pass `--full` to
+rebuild from scratch.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+MAGIC = b"CLAIMIX1"
+KEY_SIZE = 32
+_HEADER = struct.Struct(f"<{len(MAGIC)}sI")
+_RECORD = struct.Struct(f"<{KEY_SIZE}sQI")
+
+SOURCE_EXTENSIONS = (".txt", ".md", ".csv", ".json")
+
+# How often a reader checks whether the index file was rebuilt
+RELOAD_CHECK_SECS = 1.0
+
+_CLAIM_MENTION = re.compile(
+    r"\bclaim(?:\s*(?:id|number|no)\b|\s*#)*\s*[:#]?\s*([A-Za-z0-9][A-Za-z0-9-]*)",
+    re.IGNORECASE,
+)
+# A query that is nothing but a claim ID, optionally prefixed with "claim ID"
+_PURE_CLAIM_QUERY = re.compile(
+    r"\s*(?:(?:claim|id|number|no)\b\s*|#\s*|:\s*)*"
+    r"([A-Za-z0-9][A-Za-z0-9-]*)\s*[?.!]?\s*",
+    re.IGNORECASE,
+)
+
+
+def normalize_claim_id(claim_id: str) -> Optional[str]:
+    """Canonical form of a claim ID, or None if it doesn't look like one"""
+    claim_id = claim_id.strip().upper()
+    if not any(c.isdigit() for c in claim_id):
+        return None
+    if len(claim_id.encode()) > KEY_SIZE:
+        return None
+    return claim_id
+
+
+def claim_id_from_query(query: str) -> Optional[str]:
+    """Return the claim ID if the query is a pure claim-ID lookup"""
+    match = _PURE_CLAIM_QUERY.fullmatch(query)
+    if not match:
+        return None
+    return normalize_claim_id(match.group(1))
+
+
+def find_claim_ids(text: str) -> List[str]:
+    """Claim IDs mentioned in free text ("... the estimate on claim 1234 ...")"""
+    claim_ids = []
+    for match in _CLAIM_MENTION.findall(text):
+        claim_id = normalize_claim_id(match)
+        if claim_id and claim_id not in claim_ids:
+            claim_ids.append(claim_id)
+    return claim_ids
+
+
+def extract_claim_chunks(text: str, source: str) -> Dict[str, List[dict]]:
+    """Split a source document into chunks keyed by the claim IDs they describe.
+
+    A chunk starts at a paragraph that mentions a claim and runs until the next
+    paragraph that mentions one. CSV-style documents are treated one row per
+    paragraph, with the header row kept on every chunk.
+    """
+    if source.endswith(".csv"):
+        lines = [line for line in text.splitlines() if line.strip()]
+        header, rows = (lines[0], lines[1:]) if lines else ("", [])
+        paragraphs = [f"{header}\n{row}" for row in rows]
+    else:
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+    sections = []
+    for paragraph in paragraphs:
+        claim_ids = set(find_claim_ids(paragraph))
+        if claim_ids:
+            sections.append((claim_ids, [paragraph]))
+        elif sections:
+            sections[-1][1].append(paragraph)
+
+    chunks: Dict[str, List[dict]] = {}
+    for claim_ids, section in sections:
+        chunk = {"text": "\n\n".join(section), "source": source}
+        for claim_id in claim_ids:
+            chunks.setdefault(claim_id, []).append(chunk)
+    return chunks
+
+
+def _write_index(path: str, claims: Dict[str, List[dict]]):
+    keys = sorted(claims)
+    blobs = [json.dumps(claims[key]).encode() for key in keys]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(keys)))
+        offset = _HEADER.size + _RECORD.size * len(keys)
+        for key, blob in zip(keys, blobs):
+            f.write(_RECORD.pack(key.encode(), offset, len(blob)))
+            offset += len(blob)
+        for blob in blobs:
+            f.write(blob)
+
+    # Readers keep their mapping of the old file until they notice the new one
+    os.replace(tmp_path, path)
+
+
+def build_index(source_dir: str, index_path: str, full: bool = False) -> dict:
+    """Build or incrementally update the index from a directory of source documents"""
+    manifest_path = f"{index_path}.manifest.json"
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    updated_manifest = {}
+    reparsed = 0
+    for root, _, filenames in os.walk(source_dir):
+        for filename in filenames:
+            if not filename.lower().endswith(SOURCE_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            source = os.path.relpath(path, source_dir)
+            stat = os.stat(path)
+
+            entry = manifest.get(source)
+            if (
+                entry
+                and entry["mtime_ns"] == stat.st_mtime_ns
+                and entry["size"] == stat.st_size
+            ):
+                updated_manifest[source] = entry
+                continue
+
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            updated_manifest[source] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "claims": extract_claim_chunks(text, source),
+            }
+            reparsed += 1
+
+    claims: Dict[str, List[dict]] = {}
+    for entry in updated_manifest.values():
+        for claim_id, chunks in entry["claims"].items():
+            claims.setdefault(claim_id, []).extend(chunks)
+
+    _write_index(index_path, claims)
+    with open(manifest_path, "w") as f:
+        json.dump(updated_manifest, f)
+
+    return {
+        "files": len(updated_manifest),
+        "reparsed": reparsed,
+        "removed": len(set(manifest) - set(updated_manifest)),
+        "claims": len(claims),
+    }
+
+
+class ClaimIndex:
+    """Read-only, memory-mapped view of a claim index file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._view = (None, 0)
+        self._stat = None
+        self._last_check = 0.0
+        self._open()
+
+    def _open(self):
+        stat = os.stat(self.path)
+        with open(self.path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC:
+            mapped.close()
+            raise ValueError(f"{self.path} is not a claim index")
+        # Swapped in as one tuple so readers never pair a mapping with the wrong
+        # count. The old mapping is left to the garbage collector, since another
+        # thread may still be reading from it.
+        self._view, self._stat = (mapped, count), stat
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_SECS:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return
+            if (stat.st_ino, stat.st_mtime_ns) != (
+                self._stat.st_ino,
+                self._stat.st_mtime_ns,
+            ):
+                self._open()
+
+    def __len__(self) -> int:
+        return self._view[1]
+
+    def lookup(self, claim_id: str) -> List[dict]:
+        """Return the chunks for a claim ID, or an empty list if it isn't indexed"""
+        key = normalize_claim_id(claim_id)
+        if not key:
+            return []
+        self._maybe_reload()
+
+        mapped, count = self._view
+        target = key.encode().ljust(KEY_SIZE, b"\0")
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record_key, offset, length = _RECORD.unpack_from(
+                mapped, _HEADER.size + mid * _RECORD.size
+            )
+            if record_key == target:
+                return json.loads(mapped[offset : offset + length])
+            if record_key < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return []
+
+
+def load_claim_index(path: Optional[str]) -> Optional[ClaimIndex]:
+    """Open the index at path, or return None if there isn't one"""
+    if not path or not os.path.exists(path):
+        return None
+    return ClaimIndex(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Claim ID index for knowledge base docs"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build or update the index")
+    build_parser.add_argument("source_dir", help="Directory of KB source documents")
+    build_parser.add_argument("--index", default="claims.idx", help="Index file path")
+    build_parser.add_argument(
+        "--full", action="store_true", help="Ignore the manifest and rebuild everything"
+    )
+
+    lookup_parser = subparsers.add_parser("lookup", help="Look up a claim ID")
+    lookup_parser.add_argument("claim_id")
+    lookup_parser.add_argument("--index", default="claims.idx", help="Index file path")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        summary = build_index(args.source_dir, args.index, full=args.full)
+        print(json.dumps(summary))
+    else:
+        index = load_claim_index(args.index)
+        if index is None:
+            sys.exit(f"No index at {args.index}")
+        print(json.dumps(index.lookup(args.claim_id), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""In-process cache for Bedrock Knowledge Base retrieve results.
+
+Callers tend to ask about the same claim several times in a call ("what's the
+status of claim 1234", then "and the estimate on 1234"), and across calls in the
+same hour. The cache sits in front of the retrieve round-trip and is shared by
+every session in the process, so it's guarded by a lock: Strands runs tools on
+their own threads and event loops.
+
+Retrieves that are still in flight are tracked too, so a lookup for a query
+that's already being retrieved (for example one started speculatively from an
+interim transcript) joins that retrieve instead of starting another.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+# Phrases that all mean "the claim identified by <id>"
+_CLAIM_PREFIX = re.compile(
+    r"\b(?:claim|reference|ticket)\b(?:\s*(?:id|number|no)\b|\s*#)*\s*:?\s*",
+    re.IGNORECASE,
+)
+_PUNCTUATION = re.compile(r"[^\w\s-]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so that trivially different phrasings share a cache entry"""
+    query = _CLAIM_PREFIX.sub("claim id ", query.lower())
+    query = _PUNCTUATION.sub(" ", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class RetrievalCache:
+    """Size-bounded LRU cache with a per-entry TTL and in-flight retrieve tracking"""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_secs: float = 3600,
+        speculation_window_secs: float = 120,
+    ):
+        self.max_entries = max_entries
+        self.ttl_secs = ttl_secs
+        self.speculation_window_secs = speculation_window_secs
+        self._entries: OrderedDict = OrderedDict()
+        # key -> [future, number of callers waiting on it]
+        self._inflight = {}
+        # key -> when a speculative retrieve for it was started
+        self._speculative = {}
+        # Bumped by invalidate(), so retrieves started before it aren't cached
+        self._generation = 0
+        # Reentrant, because a future's done callback runs immediately in the
+        # thread that adds it if the future has already finished
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.joined = 0
+        self.speculative_started = 0
+        self.speculative_used = 0
+        self.speculative_wasted = 0
+
+    @staticmethod
+    def make_key(query: str, search_type: str, max_results: int) -> tuple:
+        return (normalize_query(query), search_type, max_results)
+
+    def get(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self._mark_speculation_used(key)
+                    return value
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_secs, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def fetch(self, key: tuple, start: Callable[[], Future]) -> Future:
+        """Return the in-flight retrieve for key, calling start() if there isn't one.
+
+        The result is cached when the retrieve completes. Callers that stop
+        waiting early should call release().
+        """
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None:
+                self.joined += 1
+                self._mark_speculation_used(key)
+            else:
+                entry = self._start(key, start)
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, key: tuple, future: Future):
+        """Stop waiting on a retrieve; it's cancelled if nobody else needs it"""
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None or entry[0] is not future:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0 and key not in self._speculative:
+                # Keeps the retrieve from starting, or retrying after being
+                # throttled; a try that's already running finishes, but its
+                # result is dropped rather than cached
+                future.cancel()
+
+    def speculate(self, key: tuple, start: Callable[[], Future]) -> Optional[Future]:
+        """Start a retrieve for a query that's likely to come soon.
+
+        Returns the retrieve, or None if the result is already cached or being
+        retrieved.
+        """
+        with self._lock:
+            self._expire_speculations()
+            cached = self._entries.get(key)
+            if key in self._inflight or (cached and cached[0] > time.monotonic()):
+                return None
+            entry = self._start(key, start)
+            self._speculative[key] = time.monotonic()
+            self.speculative_started += 1
+            return entry[0]
+
+    def _start(self, key: tuple, start: Callable[[], Future]) -> list:
+        future = start()
+        entry = [future, 0]
+        self._inflight[key] = entry
+        generation = self._generation
+        future.add_done_callback(lambda f: self._finish(key, f, generation))
+        return entry
+
+    def _finish(self, key: tuple, future: Future, generation: int):
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None and entry[0] is future:
+                del self._inflight[key]
+            if generation != self._generation:
+                return
+            if not future.cancelled() and future.exception() is None:
+                self.put(key, future.result())
+
+    def _mark_speculation_used(self, key: tuple):
+        if self._speculative.pop(key, None) is not None:
+            self.speculative_used += 1
+
+    def _expire_speculations(self):
+        cutoff = time.monotonic() - self.speculation_window_secs
+        expired = [
+            key for key, started in self._speculative.items() if started < cutoff
+        ]
+        for key in expired:
+            del self._speculative[key]
+        self.speculative_wasted += len(expired)
+
+    def invalidate(self, query: Optional[str] = None) -> int:
+        """Drop cached results, e.g. after the knowledge base is re-synced.
+
+        With no query everything is dropped; otherwise only the entries for that
+        (normalized) query. Retrieves in flight when it's called, for any
+        query, still finish for the callers waiting on them but aren't cached;
+        later lookups for the dropped queries don't join them. Returns the
+        number of entries removed.
+        """
+        with self._lock:
+            self._generation += 1
+            if query is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._inflight.clear()
+                return removed
+
+            normalized = normalize_query(query)
+            stale = [key for key in self._entries if key[0] == normalized]
+            for key in stale:
+                del self._entries[key]
+            for key in [key for key in self._inflight if key[0] == normalized]:
+                del self._inflight[key]
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire_speculations()
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "inflight": len(self._inflight),
+                "joined": self.joined,
+                "speculative_started": self.speculative_started,
+                "speculative_used": self.speculative_used,
+                "speculative_wasted": self.speculative_wasted,
+                "speculative_pending": len(self._speculative),
+            }
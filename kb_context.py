@@ -0,0 +1,256 @@
+"""Packs knowledge base results into the search tool's result.
+
+The text search_knowledge_base returns goes into the Strands agent's prompt,
+and every model call after it in the agent run reads it again, so each wasted
+token adds to their time to first token. Bedrock's retrieve results waste a
+lot: the KB splits documents into overlapping chunks, so neighbouring chunks of
+the same document repeat each other, and HYBRID search returns the same chunk
+from more than one data source.
+
+ContextPacker takes the results in score order and packs them into a token
+budget (optionally leaving out results that score well below the best one,
+which saves more tokens but can lose facts the answer needs). A chunk that
+repeats text that's already been packed is dropped, or trimmed to what's new
+if the repeat is only at its edges, where the KB's chunking overlaps; what's
+left is joined to the chunk it carries on from. A chunk that doesn't fit whole
+is cut at a sentence (or word) boundary if enough budget is left to be worth
+it.
+
+Token counts are estimates (about 4 characters per token), which is close
+enough for a budget; the benchmark's kb-context subcommand compares the packed
+context with the old fixed-size formatting.
+"""
+
+import math
+import re
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+_NORMALIZE = re.compile(r"[^\w]+")
+# The end of a sentence, where a cut chunk reads best
+_SENTENCE_END = re.compile(r"[.!?](?=\s)")
+
+# Words per shingle when looking for text that's already been packed
+_SHINGLE_WORDS = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of text, at about 4 characters per token"""
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class PackedContext:
+    """The packed text, and what went into it"""
+
+    text: str
+    tokens: int
+    results: int
+    packed: int
+    low_score: int = 0
+    duplicates: int = 0
+    trimmed: int = 0
+    truncated: int = 0
+    over_budget: int = 0
+
+
+def _normalize(word: str) -> str:
+    return _NORMALIZE.sub("", word.lower())
+
+
+def _shingles(keys: List[str]) -> List[tuple]:
+    if len(keys) < _SHINGLE_WORDS:
+        return [tuple(keys)] if keys else []
+    return [
+        tuple(keys[i : i + _SHINGLE_WORDS])
+        for i in range(len(keys) - _SHINGLE_WORDS + 1)
+    ]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, at the last sentence end if it's not too early"""
+    max_chars = max_tokens * 4 - 3
+    cut = text[:max_chars]
+    sentence_ends = [m.end() for m in _SENTENCE_END.finditer(cut + " ")]
+    if sentence_ends and sentence_ends[-1] >= max_chars // 2:
+        return cut[: sentence_ends[-1]]
+    space = cut.rfind(" ")
+    return f"{cut[:space] if space > 0 else cut}..."
+
+
+class ContextPacker:
+    """Fits the best of a set of retrieve results into a token budget.
+
+    Args:
+        token_budget: The most tokens the packed text may take.
+        max_chunk_tokens: The most tokens any one chunk may take, so that a
+            long top result doesn't crowd out the rest.
+        min_chunk_tokens: A chunk isn't cut to fit in less than this.
+        min_relative_score: Results scoring less than this fraction of the
+            best result's score aren't packed; 0 packs results whatever their
+            score.
+        max_overlap: A chunk is dropped as a duplicate if more than this
+            fraction of what's left of it after trimming has been packed.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 500,
+        max_chunk_tokens: int = 250,
+        min_chunk_tokens: int = 40,
+        min_relative_score: float = 0.0,
+        max_overlap: float = 0.8,
+    ):
+        self.token_budget = token_budget
+        self.max_chunk_tokens = max_chunk_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+        self.min_relative_score = min_relative_score
+        self.max_overlap = max_overlap
+        # Strands runs tools on their own threads
+        self._lock = threading.Lock()
+        self.packs = 0
+        self.results_in = 0
+        self.chunks_packed = 0
+        self.low_score = 0
+        self.duplicates = 0
+        self.trimmed = 0
+        self.truncated = 0
+        self.over_budget = 0
+        self.tokens_total = 0
+        self.tokens_max = 0
+
+    def _new_span(self, keys: List[str], seen: set) -> Optional[tuple]:
+        """The (start, end) of the words that haven't been packed yet.
+
+        Returns None if the chunk is a duplicate.
+        """
+        covered = [False] * len(keys)
+        for i, shingle in enumerate(_shingles(keys)):
+            if shingle in seen:
+                covered[i : i + len(shingle)] = [True] * len(shingle)
+
+        # Overlap with an already packed chunk is at the start or end of a chunk
+        start, end = 0, len(keys)
+        while start < end and covered[start]:
+            start += 1
+        while end > start and covered[end - 1]:
+            end -= 1
+        if start == end or sum(covered[start:end]) > (end - start) * self.max_overlap:
+            return None
+        return start, end
+
+    def pack(self, results: list) -> PackedContext:
+        """Pack retrieve results, best scores first, into the token budget"""
+        ranked = sorted(results, key=lambda r: r.get("score", 0), reverse=True)
+        min_score = ranked[0].get("score", 0) * self.min_relative_score if ranked else 0
+        seen = set()
+        # [score, text] of each packed result
+        lines = []
+        # First and last shingles of packed text, to stitch neighbouring chunks
+        heads, tails = {}, {}
+        packed_chunks = low_score = duplicates = trimmed = truncated = over_budget = 0
+        # The header and line numbers are small enough to leave out of the budget
+        remaining = self.token_budget
+
+        for result in ranked:
+            score = result.get("score", 0)
+            if score < min_score:
+                low_score += 1
+                continue
+            words = result.get("content", {}).get("text", "").split()
+            if not words:
+                continue
+            keys = [_normalize(word) for word in words]
+            span = self._new_span(keys, seen)
+            if span is None:
+                duplicates += 1
+                continue
+            start, end = span
+            text = " ".join(words[start:end])
+            tokens = estimate_tokens(text)
+            limit = min(self.max_chunk_tokens, remaining)
+            cut = tokens > limit
+            if cut:
+                if limit < self.min_chunk_tokens:
+                    over_budget += 1
+                    continue
+                text = _truncate(text, limit)
+                tokens = estimate_tokens(text)
+                truncated += 1
+                end = start + len(text.split())
+            trimmed += start > 0 or end < len(words)
+            packed_chunks += 1
+            seen.update(_shingles(keys[start:end]))
+            remaining -= tokens
+
+            # A chunk that carries on from the end of a packed one (or leads up
+            # to the start of one) is joined to it
+            before = tuple(keys[max(0, start - _SHINGLE_WORDS) : start])
+            after = tuple(keys[end : end + _SHINGLE_WORDS])
+            head = tuple(keys[start : start + _SHINGLE_WORDS])
+            tail = None if cut else tuple(keys[max(start, end - _SHINGLE_WORDS) : end])
+            if before in tails:
+                line = tails.pop(before)
+                lines[line][1] += f" {text}"
+                if tail:
+                    tails[tail] = line
+            elif not cut and after in heads:
+                line = heads.pop(after)
+                lines[line][1] = f"{text} {lines[line][1]}"
+                heads[head] = line
+            else:
+                line = len(lines)
+                lines.append([score, text])
+                heads[head] = line
+                if tail:
+                    tails[tail] = line
+
+        packed = ""
+        if lines:
+            packed = "\n".join(
+                [f"Found {len(lines)} result(s):"]
+                + [
+                    f"{i}. ({score:.2f}) {text}"
+                    for i, (score, text) in enumerate(lines, 1)
+                ]
+            )
+        context = PackedContext(
+            text=packed,
+            tokens=estimate_tokens(packed),
+            results=len(results),
+            packed=packed_chunks,
+            low_score=low_score,
+            duplicates=duplicates,
+            trimmed=trimmed,
+            truncated=truncated,
+            over_budget=over_budget,
+        )
+        with self._lock:
+            self.packs += 1
+            self.results_in += context.results
+            self.chunks_packed += context.packed
+            self.low_score += low_score
+            self.duplicates += duplicates
+            self.trimmed += trimmed
+            self.truncated += truncated
+            self.over_budget += over_budget
+            self.tokens_total += context.tokens
+            self.tokens_max = max(self.tokens_max, context.tokens)
+        return context
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "packs": self.packs,
+                "results_in": self.results_in,
+                "chunks_packed": self.chunks_packed,
+                "low_score": self.low_score,
+                "duplicates": self.duplicates,
+                "trimmed": self.trimmed,
+                "truncated": self.truncated,
+                "over_budget": self.over_budget,
+                "avg_tokens": self.tokens_total / max(1, self.packs),
+                "max_tokens": self.tokens_max,
+            }
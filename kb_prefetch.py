@@ -0,0 +1,89 @@
+"""Speculative knowledge base prefetch from interim transcripts.
+
+Deepgram emits interim transcripts well before the final one, and long before
+the LLM decides to call search_knowledge_base. KnowledgeBasePrefetcher sits
+right after the STT service, watches those transcripts for claim IDs, and
+starts the matching retrieve in the background. The result lands in the
+retrieve cache (or is joined while still in flight) when the real lookup comes.
+
+A claim ID is only prefetched once it's stable: heard in two interim
+transcripts in a row, or in the final one. Interim transcripts grow as the
+caller reads a number out ("12", "123", "1234"), and each partial would
+otherwise cost a retrieve. A claim ID whose retrieve fails can be prefetched
+again.
+
+Speculation accuracy is tracked by the cache: see the speculative_* counters in
+RetrievalCache.stats().
+"""
+
+import re
+from concurrent.futures import Future
+
+from loguru import logger
+from pipecat.frames.frames import Frame, InterimTranscriptionFrame, TranscriptionFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from claim_index import find_claim_ids, normalize_claim_id
+
+# The LLM is told to treat bare numbers as claim IDs, so they're worth a prefetch
+_BARE_NUMBER = re.compile(r"\b\d{3,}\b")
+
+
+class KnowledgeBasePrefetcher(FrameProcessor):
+    """FrameProcessor that prefetches KB results for claim IDs in transcripts."""
+
+    def __init__(self, kb_client, max_results: int = 10):
+        super().__init__()
+        self._kb_client = kb_client
+        self._max_results = max_results
+        # Claim IDs prefetched, or being prefetched, this session
+        self._seen_claim_ids = set()
+        # Claim IDs in the latest interim transcript of the current utterance
+        self._interim_claim_ids = set()
+        self.prefetches = 0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, InterimTranscriptionFrame):
+            claim_ids = self._find_claim_ids(frame.text)
+            self._maybe_prefetch(claim_ids & self._interim_claim_ids)
+            self._interim_claim_ids = claim_ids
+        elif isinstance(frame, TranscriptionFrame):
+            self._maybe_prefetch(self._find_claim_ids(frame.text))
+            self._interim_claim_ids = set()
+
+        # Always pass the frame through
+        await self.push_frame(frame, direction)
+
+    @staticmethod
+    def _find_claim_ids(text: str) -> set:
+        return set(
+            find_claim_ids(text)
+            or [normalize_claim_id(number) for number in _BARE_NUMBER.findall(text)]
+        )
+
+    def _maybe_prefetch(self, claim_ids: set):
+        for claim_id in claim_ids - self._seen_claim_ids:
+            self._seen_claim_ids.add(claim_id)
+            try:
+                # Phrased the way the LLM is told to phrase claim lookups
+                future = self._kb_client.prefetch(
+                    f"claim ID {claim_id}", self._max_results
+                )
+            except Exception as e:
+                # A speculation is never worth failing the turn over
+                logger.warning(f"Couldn't prefetch claim {claim_id}: {e}")
+                continue
+            if future is None:
+                continue
+            self.prefetches += 1
+            logger.debug(f"Prefetching knowledge base results for claim {claim_id}")
+            future.add_done_callback(
+                lambda f, claim_id=claim_id: self._prefetch_done(claim_id, f)
+            )
+
+    def _prefetch_done(self, claim_id: str, future: Future):
+        # On the limiter's thread; set.discard is atomic
+        if future.cancelled() or future.exception() is not None:
+            self._seen_claim_ids.discard(claim_id)
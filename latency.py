@@ -0,0 +1,225 @@
+"""Per-turn latency breakdown for the voice pipeline.
+
+TurnLatencyObserver watches each session's frames and, for every user turn,
+records how long each stage took, measured from the moment VAD decided the user
+stopped speaking. Times are when frames were pushed, by the pipeline clock:
+
+- stt_final: until the last final transcript (Deepgram finalization)
+- llm_ttfb / tts_ttfb / stt_ttfb: TTFB metrics reported by the services
+- kb_retrieve / strands_agent: stage metrics reported by the KB tool handler
+- function_call: from a function call starting until its result
+- bot_started: until the bot started speaking (the latency the caller hears)
+
+A turn is recorded when the user starts speaking again or the session ends, so
+stages that finish after the bot starts talking (e.g. a tool call behind a
+filler phrase) are still included.
+
+Turns from every session in the process go into one LatencyRecorder, which
+keeps the most recent turns in a ring buffer, appends each turn to a JSONL log,
+and can serve p50/p95/p99 per stage over HTTP.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    FunctionCallInProgressFrame,
+    FunctionCallResultFrame,
+    MetricsFrame,
+    TranscriptionFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import TTFBMetricsData
+from pipecat.observers.base_observer import BaseObserver, FramePushed
+from pipecat.processors.frame_processor import FrameDirection
+
+_TRACKED_FRAMES = (
+    BotStartedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    FunctionCallInProgressFrame,
+    FunctionCallResultFrame,
+    MetricsFrame,
+    TranscriptionFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+
+
+def percentile(sorted_values: list, percent: float) -> float:
+    """The value percent of the way through sorted_values, which mustn't be empty"""
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+
+class LatencyRecorder:
+    """Process-wide ring buffer of per-turn stage latencies"""
+
+    def __init__(self, max_turns: int = 1000, log_path: Optional[str] = None):
+        self._turns = deque(maxlen=max_turns)
+        self._lock = threading.Lock()
+        self._log_file = open(log_path, "a", buffering=1) if log_path else None
+        self._stats_sources: Dict[str, Callable[[], dict]] = {}
+        self._server = None
+
+    def record(self, turn: dict):
+        with self._lock:
+            self._turns.append(turn)
+            if self._log_file:
+                self._log_file.write(json.dumps(turn) + "\n")
+
+    def clear(self):
+        """Forget the recorded turns"""
+        with self._lock:
+            self._turns.clear()
+
+    def add_stats_source(self, name: str, stats: Callable[[], dict]):
+        """Include stats(), e.g. cache or executor counters, in the HTTP report"""
+        self._stats_sources[name] = stats
+
+    def percentiles(self) -> dict:
+        with self._lock:
+            turns = list(self._turns)
+
+        by_stage: Dict[str, list] = {}
+        for turn in turns:
+            for stage, value in turn["stages"].items():
+                by_stage.setdefault(stage, []).append(value)
+
+        report = {}
+        for stage, values in by_stage.items():
+            values.sort()
+            report[stage] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+        return report
+
+    def report(self) -> dict:
+        report = {"turns": len(self._turns), "stages": self.percentiles()}
+        for name, stats in self._stats_sources.items():
+            report[name] = stats()
+        return report
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve report() as JSON on http://host:port/ from a background thread
+
+        Logs a warning, rather than raising, if the port is taken, e.g. by
+        another agent process on the same host.
+        """
+        if self._server:
+            return
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(recorder.report()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logger.warning(f"Couldn't serve turn latency metrics on port {port}: {e}")
+            return
+        threading.Thread(
+            target=self._server.serve_forever, name="latency-metrics", daemon=True
+        ).start()
+        logger.info(f"Serving turn latency metrics at http://{host}:{port}/")
+
+
+class TurnLatencyObserver(BaseObserver):
+    """Observer that breaks each user turn's latency down by pipeline stage."""
+
+    def __init__(self, recorder: LatencyRecorder, session_id: str):
+        super().__init__()
+        self._recorder = recorder
+        self._session_id = session_id
+        self._seen_frames = set()
+        self._user_stopped_at = None
+        self._last_transcript_at = None
+        self._function_call_started_at = None
+        self._stages = {}
+
+    def _stage_from_metric(self, processor: str) -> str:
+        for service in ("LLM", "TTS", "STT"):
+            if service in processor:
+                return f"{service.lower()}_ttfb"
+        return processor
+
+    def _finish_turn(self):
+        if self._user_stopped_at is None:
+            return
+        if self._last_transcript_at is not None:
+            self._stages["stt_final"] = max(
+                0.0, self._last_transcript_at - self._user_stopped_at
+            )
+        self._recorder.record(
+            {
+                "session_id": self._session_id,
+                "timestamp": time.time(),
+                "stages": self._stages,
+            }
+        )
+        logger.debug(f"Turn latency for session {self._session_id}: {self._stages}")
+        self._user_stopped_at = None
+
+    async def on_push_frame(self, data: FramePushed):
+        if data.direction != FrameDirection.DOWNSTREAM:
+            return
+
+        # Each frame is pushed once per hop; only look at it the first time
+        frame = data.frame
+        if not isinstance(frame, _TRACKED_FRAMES) or frame.id in self._seen_frames:
+            return
+        self._seen_frames.add(frame.id)
+
+        # When the frame was pushed, by the pipeline clock. Observers run on a
+        # queue of their own, so the time this runs can be much later.
+        now = data.timestamp / 1e9
+
+        if isinstance(frame, (UserStartedSpeakingFrame, EndFrame, CancelFrame)):
+            self._finish_turn()
+            self._seen_frames = {frame.id}
+            self._last_transcript_at = None
+            self._function_call_started_at = None
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._finish_turn()
+            self._user_stopped_at = now
+            self._stages = {}
+        elif isinstance(frame, TranscriptionFrame):
+            self._last_transcript_at = now
+        elif self._user_stopped_at is None:
+            return
+        elif isinstance(frame, MetricsFrame):
+            for metric in frame.data:
+                if isinstance(metric, TTFBMetricsData) and metric.value:
+                    stage = self._stage_from_metric(metric.processor)
+                    self._stages.setdefault(stage, metric.value)
+        elif isinstance(frame, FunctionCallInProgressFrame):
+            self._function_call_started_at = now
+        elif isinstance(frame, FunctionCallResultFrame):
+            if self._function_call_started_at is not None:
+                self._stages.setdefault(
+                    "function_call", now - self._function_call_started_at
+                )
+                self._function_call_started_at = None
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            self._stages.setdefault("bot_started", now - self._user_stopped_at)
@@ -0,0 +1,184 @@
+"""Event loop lag sampling and blocking-call detection.
+
+Code that blocks the event loop (a synchronous boto3 call, a Strands agent run,
+executing a module) stalls every session in the process, and only shows up as
+choppy audio. LoopMonitor measures how late the loop wakes up from a short
+sleep, continuously, and keeps a histogram of it. A watchdog thread notices
+when the loop has been stuck for longer than a threshold and captures the loop
+thread's stack while it's still stuck, so the log shows the code that blocked
+it rather than whatever ran next.
+
+Each stall is tagged with the asyncio task that was running and, for pipelines
+registered with track(), the session it belongs to.
+"""
+
+import asyncio
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter, deque
+from typing import Optional
+
+from loguru import logger
+
+# Upper bounds of the lag histogram buckets, in seconds
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, float("inf"))
+
+# Frames from these directories are library code; a stall is attributed to the
+# innermost frame outside them
+_LIBRARY_PATHS = tuple(
+    {sysconfig.get_paths()["stdlib"], sysconfig.get_paths()["purelib"]}
+)
+
+
+def _bucket_label(bound: float) -> str:
+    return "inf" if bound == float("inf") else f"{bound * 1000:g}ms"
+
+
+class LoopMonitor:
+    """Samples event loop lag and captures the stack of code that blocks the loop"""
+
+    def __init__(
+        self,
+        threshold_secs: float = 0.1,
+        interval_secs: float = 0.02,
+        max_samples: int = 10000,
+        max_stalls: int = 100,
+    ):
+        self.threshold_secs = threshold_secs
+        self.interval_secs = interval_secs
+        self._lock = threading.Lock()
+        self._lag_samples = deque(maxlen=max_samples)
+        self._lag_histogram = Counter()
+        self._stalls = deque(maxlen=max_stalls)
+        self._stalls_by_site = Counter()
+        self._stalls_by_session = Counter()
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat_task = None
+        self._last_beat = 0.0
+        # FrameProcessor -> session ID, and processor name -> FrameProcessor, so
+        # both stack frames and pipecat task names can be traced to a session
+        self._sessions = weakref.WeakKeyDictionary()
+        self._processors = weakref.WeakValueDictionary()
+
+    def start(self):
+        """Start monitoring the running event loop, if that hasn't happened yet"""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+        logger.info(
+            f"Monitoring event loop lag (stall threshold {self.threshold_secs * 1000:g}ms)"
+        )
+
+    def track(self, session_id: str, pipeline):
+        """Tag stalls in pipeline's processors with session_id (starts the monitor)"""
+        self.start()
+        pending = [pipeline]
+        while pending:
+            processor = pending.pop()
+            self._sessions[processor] = session_id
+            self._processors[processor.name] = processor
+            pending.extend(processor.processors)
+
+    async def _heartbeat(self):
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval_secs)
+            lag = max(0.0, time.monotonic() - self._last_beat - self.interval_secs)
+            with self._lock:
+                self._lag_samples.append(lag)
+                bound = next(b for b in LAG_BUCKETS if lag <= b)
+                self._lag_histogram[_bucket_label(bound)] += 1
+
+    def _watch(self):
+        captured_beat = None
+        while True:
+            time.sleep(self.interval_secs)
+            beat = self._last_beat
+            stalled_for = time.monotonic() - beat - self.interval_secs
+            # One capture per stall, taken while the loop is still stuck
+            if stalled_for > self.threshold_secs and beat != captured_beat:
+                captured_beat = beat
+                self._capture(stalled_for)
+
+    def _session_for(self, frame, task_name: Optional[str]) -> Optional[str]:
+        while frame is not None:
+            owner = frame.f_locals.get("self")
+            try:
+                session_id = self._sessions.get(owner)
+            except TypeError:
+                # Unhashable
+                session_id = None
+            if session_id is not None:
+                return session_id
+            frame = frame.f_back
+
+        # Pipecat names processor tasks "<processor name>::<task name>"
+        if task_name:
+            processor = self._processors.get(task_name.split("::")[0])
+            if processor is not None:
+                return self._sessions.get(processor)
+        return None
+
+    def _capture(self, stalled_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        task = asyncio.current_task(self._loop)
+        task_name = task.get_name() if task else None
+        session_id = self._session_for(frame, task_name)
+
+        stack = traceback.extract_stack(frame)
+        site = next(
+            (f for f in reversed(stack) if not f.filename.startswith(_LIBRARY_PATHS)),
+            stack[-1],
+        )
+        site = f"{site.filename}:{site.lineno} in {site.name}"
+
+        with self._lock:
+            self._stalls.append(
+                {
+                    "timestamp": time.time(),
+                    "stalled_secs": stalled_for,
+                    "site": site,
+                    "task": task_name,
+                    "session_id": session_id,
+                    "stack": traceback.format_list(stack),
+                }
+            )
+            self._stalls_by_site[site] += 1
+            self._stalls_by_session[session_id or "unknown"] += 1
+
+        logger.warning(
+            f"Event loop blocked for {stalled_for * 1000:.0f}ms+ at {site} "
+            f"(task {task_name}, session {session_id}):\n"
+            + "".join(traceback.format_list(stack))
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._lag_samples) or [0.0]
+            return {
+                "lag_p50": samples[int(len(samples) * 0.5)],
+                "lag_p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+                "lag_max": samples[-1],
+                "lag_histogram": {
+                    _bucket_label(b): self._lag_histogram[_bucket_label(b)]
+                    for b in LAG_BUCKETS
+                },
+                "stalls": sum(self._stalls_by_site.values()),
+                "stalls_by_site": dict(self._stalls_by_site.most_common(10)),
+                "stalls_by_session": dict(self._stalls_by_session.most_common(10)),
+            }
+
+    def recent_stalls(self) -> list:
+        with self._lock:
+            return list(self._stalls)
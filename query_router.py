@@ -0,0 +1,103 @@
+"""Routes knowledge base searches around the Strands agent when it adds nothing.
+
+The LLM's search_knowledge_base call normally goes to the Strands agent, which
+calls its own search_knowledge_base tool and then phrases an answer for the LLM
+to phrase again: three model generations for one lookup. Most searches are a
+single claim ID ("claim ID 1234", "the estimate on claim 1234"), where the
+agent's only job is to pass the query on to the knowledge base. QueryRouter
+sends those straight to BedrockKnowledgeBaseClient, and everything else (more
+than one claim, questions that aren't about a claim, anything worded as more
+than a lookup) to the agent.
+
+The rules are deliberately narrow: a query goes to the knowledge base only if
+it mentions exactly one claim and every other word is one a plain lookup uses.
+A query misrouted to the agent costs what it always did; one misrouted to the
+knowledge base gets a worse answer. benchmark.py's routing subcommand reports
+accuracy and per-route latency on a labeled query set.
+"""
+
+import string
+import threading
+from collections import deque
+from typing import Optional
+
+from claim_index import claim_id_from_query, find_claim_ids, normalize_claim_id
+from latency import percentile
+
+ROUTE_KB = "kb"
+ROUTE_AGENT = "agent"
+
+# Words a single-claim lookup can use besides the claim ID
+_LOOKUP_WORDS = frozenset(
+    """
+    a about an any can claim claims current details do find for get give have
+    i id info information is it latest look lookup me my no number of on please
+    pull search show status tell the up what what's whats with you
+    amount cost costs estimate notes payment repair
+    """.split()
+)
+
+
+def classify_query(query: str) -> str:
+    """ROUTE_KB for a lookup of a single claim, otherwise ROUTE_AGENT"""
+    if claim_id_from_query(query):
+        return ROUTE_KB
+
+    claim_ids = find_claim_ids(query)
+    if len(claim_ids) != 1:
+        return ROUTE_AGENT
+    for word in query.lower().split():
+        word = word.strip(string.punctuation)
+        if not word or word in _LOOKUP_WORDS:
+            continue
+        if normalize_claim_id(word) == claim_ids[0]:
+            continue
+        return ROUTE_AGENT
+    return ROUTE_KB
+
+
+class QueryRouter:
+    """Picks each search's route and keeps per-route latency.
+
+    Args:
+        mode: "rules" to route with classify_query(), or "agent" to send every
+            search to the Strands agent.
+        max_samples: Latencies kept per route for the percentiles.
+    """
+
+    def __init__(self, mode: str = "rules", max_samples: int = 1000):
+        if mode not in ("rules", "agent"):
+            raise ValueError(f"Unknown query routing mode: {mode}")
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._latencies = {
+            ROUTE_KB: deque(maxlen=max_samples),
+            ROUTE_AGENT: deque(maxlen=max_samples),
+        }
+        self._counts = {ROUTE_KB: 0, ROUTE_AGENT: 0}
+        self._errors = {ROUTE_KB: 0, ROUTE_AGENT: 0}
+
+    def route(self, query: str) -> str:
+        if self.mode == "agent":
+            return ROUTE_AGENT
+        return classify_query(query)
+
+    def record(self, route: str, secs: float, error: bool = False):
+        """Record how long a search on route took"""
+        with self._lock:
+            self._counts[route] += 1
+            self._errors[route] += error
+            self._latencies[route].append(secs)
+
+    def stats(self, route: Optional[str] = None) -> dict:
+        if route is None:
+            return {"mode": self.mode, **{r: self.stats(r) for r in self._counts}}
+        with self._lock:
+            latencies = sorted(self._latencies[route]) or [0.0]
+            return {
+                "count": self._counts[route],
+                "errors": self._errors[route],
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "max": latencies[-1],
+            }
@@ -0,0 +1,224 @@
+"""Builds a session's services while the caller is still connecting.
+
+A session used to create its services only once its transport existed: the
+Strands agent, the LLM and TTS services, and the Deepgram STT websocket, which
+connects when the pipeline starts and holds up the StartFrame (and so the
+greeting) until it has. Signaling (the WebRTC offer and ICE, or joining a
+Daily room) takes time the caller spends waiting anyway. PreparedSessions
+starts building a session's services as soon as a session is on its way, under
+a key the session takes them back by once its transport exists. A preparation
+nobody takes (the offer failed, or the caller gave up) is released after a
+timeout.
+
+Preparing only helps a server that can start it before signaling finishes,
+like the archive's dev server (lib/cloud.py), which does as an offer arrives.
+pipecat's runner answers the offer before it calls the bot, so agent.py builds
+its services once the session starts.
+
+PreconnectedDeepgramSTTService opens its websocket while the session is being
+prepared, and while the transport connects to the caller; Deepgram's keepalive
+holds it open until the pipeline starts. benchmark.py's warm-start subcommand
+compares connect-to-first-audio with and without preparation.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from loguru import logger
+from pipecat.frames.frames import StartFrame
+from pipecat.services.deepgram.stt import DeepgramSTTService
+
+from latency import percentile
+
+
+class PreconnectedDeepgramSTTService(DeepgramSTTService):
+    """DeepgramSTTService that can connect before its pipeline starts.
+
+    DeepgramSTTService connects when the StartFrame reaches it, and holds the
+    StartFrame (and so the greeting) back from the rest of the pipeline until
+    it has. A connection started while the session is prepared is usually
+    open by then.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._preconnecting = None
+
+    def preconnect(self, sample_rate: int = 16000):
+        """Start connecting to Deepgram for audio at sample_rate.
+
+        A pipeline that starts at a different sample rate reconnects.
+        """
+        self._settings["sample_rate"] = sample_rate
+        self._preconnecting = asyncio.get_running_loop().create_task(self._connect())
+
+    async def _preconnected(self) -> bool:
+        try:
+            await self._preconnecting
+        except Exception as e:
+            logger.warning(f"{self}: couldn't connect to Deepgram ahead of time: {e}")
+            return False
+        return await self._connection.is_connected()
+
+    async def start(self, frame: StartFrame):
+        if not self._preconnecting:
+            await super().start(frame)
+            return
+
+        # DeepgramSTTService.start() would connect again
+        await super(DeepgramSTTService, self).start(frame)
+        connected = await self._preconnected()
+        if not connected or self.sample_rate != self._settings["sample_rate"]:
+            logger.debug(f"{self}: reconnecting to Deepgram at {self.sample_rate} Hz")
+            if connected:
+                await self._disconnect()
+            self._settings["sample_rate"] = self.sample_rate
+            await self._connect()
+
+    async def release(self):
+        """Disconnect a preconnected service that's never going to start"""
+        if self._preconnecting and await self._preconnected():
+            await self._disconnect()
+
+
+class PreparedSessions:
+    """Sessions' services, prepared ahead under a key and taken by the session.
+
+    Args:
+        prepare: Coroutine function that builds a session's services, called
+            with the arguments given to start().
+        release: Coroutine function that releases services nobody took.
+        timeout_secs: How long prepared services wait to be taken.
+        max_pending: The most preparations waiting at once, so that a burst of
+            offers can't hold open any number of connections; 0 turns
+            preparation off.
+        max_samples: Connect-to-first-audio times kept for the percentiles.
+    """
+
+    def __init__(
+        self,
+        prepare: Callable[..., Awaitable[Any]],
+        release: Callable[[Any], Awaitable[None]],
+        timeout_secs: float = 30.0,
+        max_pending: int = 32,
+        max_samples: int = 1000,
+    ):
+        self._prepare = prepare
+        self._release = release
+        self.timeout_secs = timeout_secs
+        self.max_pending = max_pending
+        # key -> (preparation task, timeout handle)
+        self._pending = {}
+        self._reclaiming = set()
+        # Only the event loop changes these, but stats() is read from the
+        # latency server's thread
+        self._lock = threading.Lock()
+        self.started = 0
+        self.skipped = 0
+        self.taken = 0
+        self.missed = 0
+        self.failed = 0
+        self.reclaimed = 0
+        self._first_audio = {
+            "prepared": deque(maxlen=max_samples),
+            "cold": deque(maxlen=max_samples),
+        }
+
+    def start(self, key: Hashable, *args) -> bool:
+        """Start preparing a session's services under key.
+
+        Returns False if preparation is off, or too many are already waiting.
+        """
+        if len(self._pending) >= self.max_pending or key in self._pending:
+            with self._lock:
+                self.skipped += 1
+            return False
+
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self._prepare(*args))
+        timeout = loop.call_later(self.timeout_secs, self._expire, key)
+        self._pending[key] = (task, timeout)
+        with self._lock:
+            self.started += 1
+        return True
+
+    async def take(self, key: Optional[Hashable]) -> Optional[Any]:
+        """The services prepared under key, or None if there aren't any.
+
+        Waits for a preparation that's still under way.
+        """
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            with self._lock:
+                self.missed += 1
+            return None
+
+        task, timeout = pending
+        timeout.cancel()
+        try:
+            # The session may be cancelled while it waits; the services it
+            # would have taken still need releasing
+            services = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            self._reclaim(task)
+            raise
+        except Exception as e:
+            logger.warning(f"Couldn't prepare session {key}: {e}")
+            with self._lock:
+                self.failed += 1
+            return None
+
+        with self._lock:
+            self.taken += 1
+        return services
+
+    def _expire(self, key: Hashable):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        logger.info(f"Releasing session {key}, unused after {self.timeout_secs}s")
+        with self._lock:
+            self.reclaimed += 1
+        self._reclaim(pending[0])
+
+    def _reclaim(self, task: asyncio.Task):
+        async def release():
+            try:
+                services = await task
+            except Exception:
+                return
+            await self._release(services)
+
+        reclaim = asyncio.get_running_loop().create_task(release())
+        self._reclaiming.add(reclaim)
+        reclaim.add_done_callback(self._reclaiming.discard)
+
+    def record_first_audio(self, prepared: bool, secs: float):
+        """Record how long a session took from connecting to its first audio"""
+        with self._lock:
+            self._first_audio["prepared" if prepared else "cold"].append(secs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            first_audio = {}
+            for kind, samples in self._first_audio.items():
+                values = sorted(samples) or [0.0]
+                first_audio[kind] = {
+                    "count": len(samples),
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "max": values[-1],
+                }
+            return {
+                "timeout_secs": self.timeout_secs,
+                "pending": len(self._pending),
+                "started": self.started,
+                "skipped": self.skipped,
+                "taken": self.taken,
+                "missed": self.missed,
+                "failed": self.failed,
+                "reclaimed": self.reclaimed,
+                "first_audio_secs": first_audio,
+            }
@@ -0,0 +1,257 @@
+"""One Silero VAD model per process, shared by every session.
+
+SileroVADAnalyzer loads the ONNX model into a new onnxruntime InferenceSession
+for each transport it's given to, so every caller pays for loading the model
+and for the session's memory. The model itself is stateless between calls
+apart from a small recurrent state and a few samples of context, and an
+InferenceSession can be run from several threads at once.
+
+SharedSileroVADAnalyzer keeps just that per-stream state, and runs it through
+a single InferenceSession that is created the first time it's needed. The model
+also accepts a batch of streams, and run_batch() uses that to analyze one chunk
+from each of several streams in a single inference call.
+
+With many sessions, most of the inference CPU goes to per-call overhead, so
+BatchedVADEngine runs every session's chunks in batches instead. Each transport
+analyzes audio on its own executor thread; BatchedSileroVADAnalyzer hands the
+chunk to the engine and waits for its result. The engine's thread runs a batch
+as soon as every active stream (one that sent a chunk recently) has a chunk
+waiting, or when the oldest chunk has waited max_wait_secs, which bounds the
+latency batching adds.
+"""
+
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from importlib import resources
+from typing import List, Optional
+
+import numpy as np
+from pipecat.audio.vad.silero import SileroOnnxModel, SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def shared_session():
+    """Return the process-wide Silero InferenceSession, loading it if needed"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            path = resources.files("pipecat.audio.vad.data").joinpath("silero_vad.onnx")
+            _session = SileroOnnxModel(str(path), force_onnx_cpu=True).session
+        return _session
+
+
+class SileroStreamState(SileroOnnxModel):
+    """SileroOnnxModel's per-stream state, run on the shared InferenceSession"""
+
+    def __init__(self):
+        self.session = shared_session()
+        self.sample_rates = [8000, 16000]
+        self.reset_states()
+
+
+class SharedSileroVADAnalyzer(SileroVADAnalyzer):
+    """SileroVADAnalyzer that doesn't load its own copy of the model"""
+
+    def __init__(
+        self, *, sample_rate: Optional[int] = None, params: Optional[VADParams] = None
+    ):
+        # SileroVADAnalyzer.__init__ would load the model
+        VADAnalyzer.__init__(self, sample_rate=sample_rate, params=params)
+        self._model = SileroStreamState()
+        self._last_reset_time = 0
+
+
+def run_batch(
+    streams: List[SileroStreamState], chunks: List[np.ndarray], sample_rate: int
+) -> np.ndarray:
+    """Analyze one chunk from each stream in a single inference call.
+
+    Args:
+        streams: The streams' states, which are updated as if each stream's
+            chunk had been analyzed on its own.
+        chunks: One float32 chunk per stream, of 512 samples at 16kHz or 256 at
+            8kHz.
+        sample_rate: The sample rate of every chunk.
+
+    Returns:
+        The voice confidence for each stream.
+    """
+    context_size = 64 if sample_rate == 16000 else 32
+    for stream in streams:
+        if stream._last_sr != sample_rate or stream._last_batch_size != 1:
+            stream.reset_states(1)
+        if not np.shape(stream._context)[1]:
+            stream._context = np.zeros((1, context_size), dtype="float32")
+
+    x = np.concatenate(
+        [
+            np.concatenate((stream._context, chunk.reshape(1, -1)), axis=1)
+            for stream, chunk in zip(streams, chunks)
+        ]
+    )
+    state = np.concatenate([stream._state for stream in streams], axis=1)
+    out, state = streams[0].session.run(
+        None, {"input": x, "state": state, "sr": np.array(sample_rate, dtype="int64")}
+    )
+
+    for i, stream in enumerate(streams):
+        stream._state = state[:, i : i + 1].copy()
+        stream._context = x[i : i + 1, -context_size:]
+        stream._last_sr = sample_rate
+        stream._last_batch_size = 1
+    return out[:, 0]
+
+
+class BatchedVADEngine:
+    """Runs chunks from every stream in the process in batched inference calls.
+
+    Args:
+        max_wait_secs: The longest a chunk waits for other streams' chunks
+            before its batch is run anyway.
+        max_batch: The largest number of chunks run in one call.
+        active_secs: A stream that hasn't sent a chunk for this long isn't
+            waited for.
+    """
+
+    def __init__(
+        self,
+        max_wait_secs: float = 0.01,
+        max_batch: int = 128,
+        active_secs: float = 0.25,
+    ):
+        self.max_wait_secs = max_wait_secs
+        self.max_batch = max_batch
+        self.active_secs = active_secs
+        self._last_seen = weakref.WeakKeyDictionary()
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._batches = 0
+        self._chunks = 0
+        self._inference_secs = 0.0
+        self._waits = deque(maxlen=10000)
+
+    def infer(self, stream: SileroStreamState, chunk: np.ndarray, sample_rate: int):
+        """Analyze chunk as part of the next batch, blocking until it's done"""
+        num_samples = 512 if sample_rate == 16000 else 256
+        if sample_rate not in stream.sample_rates or chunk.size != num_samples:
+            raise ValueError(
+                f"Silero needs {num_samples} samples at 8000 or 16000 Hz, "
+                f"got {chunk.size} at {sample_rate} Hz"
+            )
+        future = Future()
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="vad-batcher", daemon=True
+                )
+                self._thread.start()
+            now = time.monotonic()
+            self._last_seen[stream] = now
+            self._pending.append((stream, chunk, sample_rate, now, future))
+            self._condition.notify()
+        return future.result()
+
+    def _active_streams(self, now: float) -> int:
+        return sum(1 for t in self._last_seen.values() if now - t < self.active_secs)
+
+    def _next_batch(self) -> list:
+        with self._condition:
+            while True:
+                if self._pending:
+                    now = time.monotonic()
+                    waited = now - self._pending[0][3]
+                    ready = len(self._pending) >= min(
+                        self.max_batch, self._active_streams(now)
+                    )
+                    if ready or waited >= self.max_wait_secs:
+                        batch = self._pending[: self.max_batch]
+                        del self._pending[: self.max_batch]
+                        return batch
+                    self._condition.wait(self.max_wait_secs - waited)
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start_time = time.monotonic()
+            for sample_rate in {item[2] for item in batch}:
+                items = [item for item in batch if item[2] == sample_rate]
+                try:
+                    confidences = run_batch(
+                        [item[0] for item in items],
+                        [item[1] for item in items],
+                        sample_rate,
+                    )
+                except Exception as e:
+                    for item in items:
+                        item[4].set_exception(e)
+                    continue
+                for item, confidence in zip(items, confidences):
+                    item[4].set_result(confidence)
+
+            with self._condition:
+                self._inference_secs += time.monotonic() - start_time
+                self._batches += 1
+                self._chunks += len(batch)
+                self._waits.extend(start_time - item[3] for item in batch)
+
+    def stats(self) -> dict:
+        with self._condition:
+            waits = sorted(self._waits) or [0.0]
+            active_streams = self._active_streams(time.monotonic())
+        return {
+            "active_streams": active_streams,
+            "batches": self._batches,
+            "chunks": self._chunks,
+            "avg_batch_size": self._chunks / max(1, self._batches),
+            "inference_secs": self._inference_secs,
+            "wait_p50": waits[int(len(waits) * 0.5)],
+            "wait_p99": waits[min(len(waits) - 1, int(len(waits) * 0.99))],
+            "wait_max": waits[-1],
+        }
+
+
+_engine = None
+
+
+def batched_vad_engine(max_wait_secs: float = 0.01) -> BatchedVADEngine:
+    """Return the process-wide BatchedVADEngine, creating it if needed"""
+    global _engine
+    with _session_lock:
+        if _engine is None:
+            _engine = BatchedVADEngine(max_wait_secs=max_wait_secs)
+        return _engine
+
+
+class BatchedStreamState(SileroStreamState):
+    """SileroStreamState that's run by a BatchedVADEngine"""
+
+    def __init__(self, engine: BatchedVADEngine):
+        super().__init__()
+        self._engine = engine
+
+    def __call__(self, x, sr: int):
+        # Shaped like the model's output, which callers index
+        return np.array([[self._engine.infer(self, np.asarray(x).ravel(), sr)]])
+
+
+class BatchedSileroVADAnalyzer(SharedSileroVADAnalyzer):
+    """SharedSileroVADAnalyzer whose inference is batched with other streams'"""
+
+    def __init__(
+        self,
+        *,
+        sample_rate: Optional[int] = None,
+        params: Optional[VADParams] = None,
+        engine: Optional[BatchedVADEngine] = None,
+    ):
+        super().__init__(sample_rate=sample_rate, params=params)
+        self._model = BatchedStreamState(engine or batched_vad_engine())
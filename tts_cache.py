@@ -0,0 +1,131 @@
+"""Pre-rendered TTS audio for fixed utterances.
+
+Every session speaks the same greeting, and some sessions the same fallback
+message, so there's no reason to synthesize them again for each caller.
+TTSAudioCache stores raw PCM keyed by a hash of (text, voice, sample_rate,
+encoding), on disk so it survives restarts and is shared between processes,
+and memory-mapped once read. CachedDeepgramTTSService serves cache hits
+straight away, without a round trip to Deepgram.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+from typing import AsyncGenerator, Iterable, Optional
+
+from loguru import logger
+from pipecat.frames.frames import (
+    ErrorFrame,
+    Frame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
+from pipecat.services.deepgram.tts import DeepgramTTSService
+
+
+class TTSAudioCache:
+    """Content-addressed PCM audio cache, on disk and in memory"""
+
+    def __init__(self, cache_dir: str = "tts_cache"):
+        self.cache_dir = cache_dir
+        self._audio = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str, voice: str, sample_rate: int, encoding: str) -> str:
+        key = json.dumps([text, voice, sample_rate, encoding])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pcm")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._audio.get(key)
+            if audio is not None:
+                return audio
+
+            try:
+                with open(self._path(key), "rb") as f:
+                    audio = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # Missing, or empty (which mmap refuses)
+                return None
+            self._audio[key] = audio
+            return audio
+
+    def put(self, key: str, audio: bytes):
+        with self._lock:
+            self._audio[key] = audio
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Couldn't write TTS cache entry {key}: {e}")
+
+
+class CachedDeepgramTTSService(DeepgramTTSService):
+    """DeepgramTTSService that serves fixed utterances from a TTSAudioCache.
+
+    Only texts in cacheable_texts are cached, so the cache can't grow with
+    whatever the LLM happens to say.
+    """
+
+    # Cache hits are yielded in chunks of this many seconds of audio
+    CHUNK_SECS = 1.0
+
+    def __init__(
+        self,
+        *,
+        audio_cache: TTSAudioCache,
+        cacheable_texts: Iterable[str] = (),
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._audio_cache = audio_cache
+        self._cacheable_texts = {text.strip() for text in cacheable_texts}
+
+    def _cache_key(self, text: str) -> str:
+        return self._audio_cache.make_key(
+            text, self._voice_id, self.sample_rate, self._settings["encoding"]
+        )
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        if text.strip() not in self._cacheable_texts:
+            async for frame in super().run_tts(text):
+                yield frame
+            return
+
+        key = self._cache_key(text.strip())
+        audio = self._audio_cache.get(key)
+        if audio is not None:
+            logger.debug(f"{self}: Serving cached TTS [{text}]")
+            # 16-bit mono samples
+            chunk_size = int(self.sample_rate * self.CHUNK_SECS) * 2
+            yield TTSStartedFrame()
+            for start in range(0, len(audio), chunk_size):
+                yield TTSAudioRawFrame(
+                    audio=bytes(audio[start : start + chunk_size]),
+                    sample_rate=self.sample_rate,
+                    num_channels=1,
+                )
+            yield TTSStoppedFrame()
+            return
+
+        chunks = []
+        failed = False
+        async for frame in super().run_tts(text):
+            if isinstance(frame, TTSAudioRawFrame):
+                chunks.append(frame.audio)
+            elif isinstance(frame, ErrorFrame):
+                failed = True
+            yield frame
+        # Interrupted syntheses never get here, so only complete audio is cached
+        if chunks and not failed:
+            self._audio_cache.put(key, b"".join(chunks))
@@ -0,0 +1,88 @@
+"""Named turn-taking profiles.
+
+How soon the bot answers once the caller stops talking is mostly down to two
+waits: Silero VAD's stop_secs, the silence it needs before it decides the user
+stopped speaking, and Deepgram's endpointing, the silence it needs before it
+finalizes a transcript. pipecat's default stop_secs of 0.8s leaves noticeable
+dead air. Shorter waits answer sooner, but end the turn early, and interrupt
+the caller, when they pause mid-sentence.
+
+- fast: answers as soon as possible; best for short, scripted exchanges.
+- balanced: the default; tolerates ordinary pauses between phrases.
+- telephony: 8 kHz phone audio is noisier and quieter, and callers pause
+  longer (e.g. reading out a claim number), so it waits longest and accepts
+  lower confidence and volume as speech.
+
+utterance_end_ms is Deepgram's fallback end-of-utterance signal for noisy
+audio, where endpointing may not see enough silence to fire.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+from pipecat.audio.vad.vad_analyzer import VADParams
+from pipecat.services.deepgram.stt import LiveOptions
+
+
+@dataclass(frozen=True)
+class TurnTakingProfile:
+    name: str
+    vad_params: VADParams
+    # Deepgram LiveOptions
+    endpointing_ms: int
+    utterance_end_ms: int
+
+    def live_options(self, **kwargs) -> LiveOptions:
+        """LiveOptions with this profile's endpointing, plus kwargs"""
+        return LiveOptions(
+            endpointing=self.endpointing_ms,
+            utterance_end_ms=str(self.utterance_end_ms),
+            # Required by utterance_end_ms
+            interim_results=True,
+            **kwargs,
+        )
+
+
+TURN_TAKING_PROFILES = {
+    "fast": TurnTakingProfile(
+        name="fast",
+        vad_params=VADParams(confidence=0.7, start_secs=0.2, stop_secs=0.3),
+        endpointing_ms=200,
+        utterance_end_ms=1000,
+    ),
+    "balanced": TurnTakingProfile(
+        name="balanced",
+        vad_params=VADParams(confidence=0.7, start_secs=0.2, stop_secs=0.5),
+        endpointing_ms=300,
+        utterance_end_ms=1000,
+    ),
+    "telephony": TurnTakingProfile(
+        name="telephony",
+        vad_params=VADParams(
+            confidence=0.6, start_secs=0.25, stop_secs=0.7, min_volume=0.4
+        ),
+        endpointing_ms=450,
+        utterance_end_ms=1500,
+    ),
+}
+
+
+def check_turn_taking_profile(name: str) -> str:
+    """name, if it's a known profile; raises ValueError otherwise"""
+    if name not in TURN_TAKING_PROFILES:
+        raise ValueError(
+            f"Unknown turn-taking profile {name!r}, expected one of: "
+            + ", ".join(TURN_TAKING_PROFILES)
+        )
+    return name
+
+
+def get_turn_taking_profile(body: Optional[dict], default: str) -> TurnTakingProfile:
+    """The profile named by body["turn_taking"], or the default profile"""
+    name = (body or {}).get("turn_taking") or default
+    profile = TURN_TAKING_PROFILES.get(name)
+    if profile is None:
+        logger.warning(f"Unknown turn-taking profile {name!r}, using {default!r}")
+        profile = TURN_TAKING_PROFILES[default]
+    return profile